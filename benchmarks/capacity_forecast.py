@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+from os import getenv, path
+from sys import path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.join(path.dirname(path.realpath(__file__)), '..', 'process'))
+from forecast import group_history, days_to_full  # noqa: E402
+
+EXTENTS = int(getenv('BENCHMARK_EXTENTS', '5000'))
+SCALEOUT_SIZE = int(getenv('BENCHMARK_SCALEOUT_SIZE', '4'))
+DAYS = int(getenv('BENCHMARK_DAYS', '365'))
+
+
+def history(now: datetime) -> list:
+    """ Generate one point per day and per extent, as returned by select_repositorie_history.sql """
+
+    random.seed(0)
+    growth = [random.uniform(-2, 5) * 2 ** 30 for extent in range(EXTENTS)]
+    size = [random.uniform(2, 20) * 2 ** 40 for extent in range(EXTENTS)]
+    rows = []
+    for day in range(DAYS):
+        creation_time = now - timedelta(days=DAYS - day)
+        for extent in range(EXTENTS):
+            scale_out = f'SOBR{extent // SCALEOUT_SIZE}' if extent % 3 else None
+            free = max(0, size[extent] - growth[extent] * day + random.gauss(0, 2 ** 30))
+            rows.append(('server', f'REPO{extent}', f'REPO{extent}' if scale_out else None, scale_out, day, creation_time, free))
+    return rows
+
+
+if __name__ == '__main__':
+    now = datetime.now()
+    rows = history(now)
+    print(f'{EXTENTS} extents, {DAYS} days, {len(rows)} history rows')
+
+    begin = perf_counter()
+    series = group_history(rows)
+    print(f'group_history : {perf_counter() - begin:.2f}s for {len(series)} series')
+
+    begin = perf_counter()
+    batched = days_to_full(series, now)
+    batched_time = perf_counter() - begin
+    print(f'days_to_full batched : {batched_time:.2f}s')
+
+    begin = perf_counter()
+    per_series = dict()
+    for key in series:
+        per_series.update(days_to_full({key: series[key]}, now))
+    per_series_time = perf_counter() - begin
+    print(f'days_to_full per series : {per_series_time:.2f}s ({per_series_time / batched_time:.1f}x)')
+
+    forecast = [days for days in batched.values() if days is not None]
+    print(f'{len(forecast)} series filling up, {sum(1 for days in forecast if days <= 30)} within 30 days')
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+import uuid
+from os import getenv, path
+from sys import path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.join(path.dirname(path.realpath(__file__)), '..', 'process'))
+from failures import reason_cause, cluster_failures  # noqa: E402
+
+SESSIONS = int(getenv('BENCHMARK_SESSIONS', '50000'))
+SERVERS = int(getenv('BENCHMARK_SERVERS', '50'))
+
+REASONS = [
+    'Error: Failed to create VM snapshot of {vm}. Task {guid} timed out at {time}',
+    'Processing {vm} Error: NFC storage connection is unavailable. Storage: [stg:datastore-{n}]. Host: [{ip}]',
+    'Error: Cannot connect to {ip}:902. Connection timed out after {n} seconds',
+    'Job {job} : The backup repository is out of space, {n} bytes required since {time}',
+    'Error: Changed block tracking cannot be enabled on {vm} (disk {n})'
+]
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    failed = dict()
+    for i in range(SESSIONS):
+        server, job, vm = f'SERVER{i % SERVERS}', f'JOB{i % 700}', f'VM{i}'
+        reason = random.choice(REASONS).format(vm=vm, job=job, guid=uuid.uuid4(), n=random.randint(1, 10 ** 6),
+                                               ip=f'10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}',
+                                               time=f'2024-0{random.randint(1, 9)}-1{random.randint(0, 9)} 0{random.randint(0, 9)}:{random.randint(10, 59)}:00')
+        failed.setdefault(server, dict()).setdefault(job, dict())[vm] = {'reason': reason}
+
+    begin = perf_counter()
+    for server in failed:
+        for job in failed[server]:
+            for vm, session in failed[server][job].items():
+                session['cause'], session['cause_template'] = reason_cause(session['reason'], vm, job)
+    normalize_time = perf_counter() - begin
+
+    begin = perf_counter()
+    causes = cluster_failures(failed)
+    cluster_time = perf_counter() - begin
+
+    print(f'{SESSIONS} failed sessions : normalized in {normalize_time:.2f}s, clustered in {cluster_time:.3f}s')
+    for cause in causes:
+        print(f'    {cause["count"]:>6} {cause["template"]}')
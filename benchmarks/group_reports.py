@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from os import getenv, path
+from sys import path as sys_path
+from time import perf_counter
+
+sys_path.insert(0, path.join(path.dirname(path.realpath(__file__)), '..', 'process'))
+from worker import render_report, group_stats, summarize_stats  # noqa: E402
+
+SERVERS = int(getenv('BENCHMARK_SERVERS', '100'))
+GROUPS = int(getenv('BENCHMARK_GROUPS', '20'))
+JOBS = int(getenv('BENCHMARK_JOBS', '20'))
+VMS = int(getenv('BENCHMARK_VMS', '10'))
+
+
+def failed_session(job: int, vm: int) -> dict:
+    return {
+        'retaincycles': 7, 'retaindays': 14, 'reason': f'Error: Failed to create VM snapshot (job {job}, VM {vm})',
+        'reason_summary': 'Error: Failed to create VM snapshot', 'cause_rank': 1, 'lps_color': '',
+        'last_point_success': '2024-01-01 22:00:00', 'start_date': '2024-01-02 22:00:00', 'end_date': '2024-01-02 23:00:00',
+        'duration_color': '', 'duration': '01:00:00', 'target_storage': 'repository', 'rp_color': '', 'nb_restore_points': 7
+    }
+
+
+if __name__ == '__main__':
+    from jinja2 import Environment, FileSystemLoader
+    env = Environment(loader=FileSystemLoader(path.join(path.dirname(path.realpath(__file__)), '..', 'process', 'jinja')))
+
+    servers = [f'SERVER{i}' for i in range(SERVERS)]
+    failed = {server: {f'JOB{j}': {f'VM{v}': failed_session(j, v) for v in range(VMS)} for j in range(JOBS)} for server in servers}
+    server_infos = {server: {'stats': {'backup': {'total': JOBS * VMS, 'failed': JOBS * VMS, 'success': 0, 'warning': 0}}} for server in servers}
+    stats = group_stats(server_infos, servers)
+    summarize_stats(stats)
+
+    cache = dict()
+    begin = perf_counter()
+    render_report(env, cache, servers, 'today', stats, {}, {}, failed, {}, server_infos)
+    global_time = perf_counter() - begin
+
+    # Each server belongs to one group, the group reports reuse the fragments of the global report
+    begin = perf_counter()
+    for group in range(GROUPS):
+        group_servers = servers[group::GROUPS]
+        report_stats = group_stats(server_infos, group_servers)
+        summarize_stats(report_stats)
+        render_report(env, cache, group_servers, 'today', report_stats, {}, {}, failed, {}, server_infos)
+    groups_time = perf_counter() - begin
+
+    begin = perf_counter()
+    for group in range(GROUPS):
+        group_servers = servers[group::GROUPS]
+        render_report(env, dict(), group_servers, 'today', stats, {}, {}, failed, {}, server_infos)
+    cold_time = perf_counter() - begin
+
+    print(f'{SERVERS} servers, {SERVERS * JOBS * VMS} failed sessions, {len(cache)} fragments')
+    print(f'    global report            {global_time:.2f}s')
+    print(f'    {GROUPS} group reports, shared  {groups_time:.2f}s')
+    print(f'    {GROUPS} group reports, cold    {cold_time:.2f}s')
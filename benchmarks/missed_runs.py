@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+from os import getenv, path
+from sys import path as sys_path
+from time import perf_counter
+from zoneinfo import ZoneInfo
+
+sys_path.insert(0, path.join(path.dirname(path.realpath(__file__)), '..', 'veeam'))
+from schedule import WEEKDAYS, cached_schedule, expand_runs, missed_runs  # noqa: E402
+
+JOBS = int(getenv('BENCHMARK_JOBS', '3000'))
+PERIOD = int(getenv('BENCHMARK_PERIOD', '5'))
+ZONE = ZoneInfo(getenv('BENCHMARK_TIMEZONE', 'Europe/Paris'))
+
+# Periodic schedule every PERIOD minutes outside of the 0h-6h backup window
+GRID = '&lt;scheduler&gt;' + ''.join(
+    f'&lt;{day}&gt;' + ','.join('1' if hour < 6 else '0' for hour in range(24)) + f'&lt;/{day}&gt;' for day in WEEKDAYS
+) + '&lt;/scheduler&gt;'
+SCHEDULE = ('<ScheduleOptions><OptionsDaily Enabled="False"/><OptionsPeriodically Enabled="True"><Kind>Minutes</Kind>'
+            '<FullPeriod>{}</FullPeriod><HourlyOffset>{}</HourlyOffset><Schedule>' + GRID + '</Schedule></OptionsPeriodically></ScheduleOptions>')
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    end = datetime(2024, 3, 12, 7)
+    start = end - timedelta(days=1)
+    tolerance = timedelta(minutes=PERIOD)
+    jobs = dict()
+    for i in range(JOBS):
+        schedule = SCHEDULE.format(PERIOD, i % PERIOD)
+        runs = expand_runs(cached_schedule(dict(), str(i), schedule), start, end, ZONE)
+        # Most runs start a few seconds late, a few are missed
+        starts = [datetime.fromtimestamp(run + random.randint(0, 30), ZONE).replace(tzinfo=None) for run in runs if random.random() > 0.01]
+        jobs[str(i)] = (schedule, starts)
+
+    cache = dict()
+    for label in ['parsed', 'cached']:
+        begin = perf_counter()
+        expected, missed = 0, 0
+        for job_id, (schedule, starts) in jobs.items():
+            runs = expand_runs(cached_schedule(cache, job_id, schedule), start, end - tolerance, ZONE)
+            expected += len(runs)
+            missed += len(missed_runs(runs, starts, tolerance, zone=ZONE))
+        print(f'{JOBS} jobs every {PERIOD} minutes, schedules {label} : {expected} expected runs, {missed} missed in {perf_counter() - begin:.2f}s')
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from os import getenv, path
+from sys import path as sys_path
+from threading import Thread
+from time import perf_counter
+from urllib.request import Request, urlopen
+
+sys_path.insert(0, path.join(path.dirname(path.realpath(__file__)), '..', 'process'))
+from server import ReportHandler, ReportStore  # noqa: E402
+
+SERVERS = int(getenv('BENCHMARK_SERVERS', '50'))
+JOBS = int(getenv('BENCHMARK_JOBS', '20'))
+VMS = int(getenv('BENCHMARK_VMS', '10'))
+CLIENTS = int(getenv('BENCHMARK_CLIENTS', '8'))
+REQUESTS = int(getenv('BENCHMARK_REQUESTS', '2000'))
+ENDPOINTS = ['/api/stats', '/api/repositories?threshold=20', '/api/failed?server=SERVER1', '/servers/SERVER1']
+
+
+class CountingStore(ReportStore):
+    """ Report store counting the version checks instead of querying MySQL """
+
+    checks = 0
+
+    def latest_pipeline(self):
+        self.checks += 1
+        return 1
+
+
+def write_outputs(report_dir: str) -> None:
+    """ Write a report model and an HTML report of the size of a worker run """
+
+    servers = [f'SERVER{i}' for i in range(SERVERS)]
+    failed = {server: {f'JOB{j}': {f'VM{v}': {'reason': 'Error: Failed to create VM snapshot', 'lps_color': 'bg-error',
+                                              'start_date': '2024-01-02 22:00:00', 'duration': '01:00:00'}
+                                   for v in range(VMS)} for j in range(JOBS)} for server in servers}
+    capacity = {server: [{'repository': f'REPO{r}', 'extent': None, 'free': r, 'used': 100 - r, 'total': 100, 'free_percent': r}
+                         for r in range(100)] for server in servers}
+    parts = {'header': '<html>', 'footer': '</html>', 'servers': {server: ['<table></table>'] * 10 for server in servers}}
+    with open(path.join(report_dir, 'output.json'), 'w') as f:
+        json.dump({'id_pipeline': 1, 'stats': {'backup': {'total': SERVERS * JOBS * VMS}},
+                   'server_infos': {server: {'stats': {}} for server in servers},
+                   'failed': failed, 'capacity': capacity, 'parts': parts}, f)
+    with open(path.join(report_dir, 'output.html'), 'w') as f:
+        f.write('<html>' + '<tr><td>VM</td></tr>' * SERVERS * JOBS * VMS + '</html>')
+
+
+def fetch(url: str) -> int:
+    with urlopen(Request(url, headers={'Accept-Encoding': 'gzip'})) as response:
+        response.read()
+        return response.status
+
+
+if __name__ == '__main__':
+    report_dir = tempfile.mkdtemp()
+    write_outputs(report_dir)
+
+    ReportHandler.store = CountingStore(report_dir, check_interval=10)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReportHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    print(f'{SERVERS} servers, {SERVERS * JOBS * VMS} failed sessions, {CLIENTS} clients, {REQUESTS} requests by endpoint')
+    with ThreadPoolExecutor(CLIENTS) as executor:
+        for endpoint in ['/'] + ENDPOINTS:
+            begin = perf_counter()
+            statuses = list(executor.map(fetch, [base + endpoint] * REQUESTS))
+            elapsed = perf_counter() - begin
+            print(f'    {endpoint:<32} {REQUESTS / elapsed:>8.0f} req/s   errors {sum(status != 200 for status in statuses)}')
+
+    print(f'    version checks {ReportHandler.store.checks} for {REQUESTS * (len(ENDPOINTS) + 1)} requests')
+    server.shutdown()
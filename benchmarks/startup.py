@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import re
+import subprocess
+from os import getenv, path
+from statistics import median
+from sys import executable
+
+# Entry points and the subsystems that main() only imports when they are used
+ENTRY_POINTS = {
+    'crawler': ('veeam', ['pyodbc', 'sentry_sdk', 'hvac', 'common.metrics']),
+    'worker': ('process', ['mysql.connector', 'sentry_sdk', 'hvac', 'jinja2', 'smtplib', 'email.mime.multipart', 'common.metrics'])
+}
+RUNS = int(getenv('BENCHMARK_RUNS', '5'))
+ROOT = path.join(path.dirname(path.realpath(__file__)), '..')
+
+
+def import_time(statement: str, module: str, directory: str = ROOT) -> tuple:
+    """ Return the cumulative import time of module in microseconds measured
+        by -X importtime in a new interpreter, and the direct imports of module """
+
+    result = subprocess.run([executable, '-X', 'importtime', '-c', statement], cwd=directory,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, []
+
+    # import time: self [us] | cumulative | imported package
+    total, children, pending = None, [], []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)) // 2, match.group(4)
+        # Children are printed before their parent, one level deeper
+        if depth == 1:
+            pending.append((name, cumulative))
+        elif depth == 0:
+            if name == module:
+                total, children = cumulative, pending
+            pending = []
+    return total, children
+
+
+def measure(statement: str, module: str, directory: str = ROOT) -> tuple:
+    """ Return the median cumulative import time over RUNS and the direct imports of the slowest run """
+
+    runs = [import_time(statement, module, directory) for i in range(RUNS)]
+    totals = [total for total, children in runs if total is not None]
+    if not totals:
+        return None, []
+    return median(totals), max(runs, key=lambda run: run[0] or 0)[1]
+
+
+if __name__ == '__main__':
+    print(f'Python {executable}, median of {RUNS} runs')
+
+    for entry_point, (directory, subsystems) in ENTRY_POINTS.items():
+        total, children = measure(f'import {entry_point}', entry_point, path.join(ROOT, directory))
+        if total is None:
+            print(f'\n{entry_point} : import failed')
+            continue
+        print(f'\n{entry_point} : {total / 1000:.1f} ms to import')
+        for name, cumulative in sorted(children, key=lambda child: child[1], reverse=True)[:5]:
+            print(f'    {name:<30} {cumulative / 1000:>8.1f} ms')
+
+        print('  deferred to main() :')
+        for subsystem in subsystems:
+            deferred, children = measure(f'import sys; sys.path.insert(0, {ROOT!r}); import {subsystem}', subsystem)
+            print(f'    {subsystem:<30} ' + (f'{deferred / 1000:>8.1f} ms' if deferred is not None else 'not installed'))
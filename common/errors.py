@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+
+class ErrorAggregator:
+    """ Group the errors of a loop by operation and exception type
+
+        Only the first error of a group is printed, the next ones are
+        counted and a few of their rows are kept as samples. report() sends
+        one Sentry event by group at the end of the run, so that a database
+        going away mid-run does not fill the Sentry transport queue with one
+        event by row """
+
+    def __init__(self, samples: int = 3, sample_length: int = 500):
+        self.samples = samples
+        self.sample_length = sample_length
+        self.groups = dict()
+
+    def add(self, operation: str, e: Exception, row=None) -> None:
+        """ Count an error of an operation, with the row which caused it """
+
+        key = (operation, type(e).__name__)
+        group = self.groups.get(key)
+        if group is None:
+            print(f"{operation} failed: ", e)
+            group = self.groups[key] = {'count': 0, 'exception': e, 'samples': []}
+        group['count'] += 1
+        if row is not None and len(group['samples']) < self.samples:
+            group['samples'].append(repr(row)[:self.sample_length])
+
+    @property
+    def count(self) -> int:
+        return sum(group['count'] for group in self.groups.values())
+
+    def report(self) -> int:
+        """ Send one Sentry event by group and clear them
+            Return the number of events sent """
+
+        if not self.groups:
+            return 0
+        import sentry_sdk
+        for (operation, exception_type), group in self.groups.items():
+            logging.warning(f'{operation} failed {group["count"]} times with {exception_type} : {group["exception"]}')
+            with sentry_sdk.push_scope() as scope:
+                scope.fingerprint = [operation, exception_type]
+                scope.set_tag('operation', operation)
+                scope.set_extra('count', group['count'])
+                scope.set_extra('samples', group['samples'])
+                sentry_sdk.capture_exception(group['exception'])
+        sent = len(self.groups)
+        self.groups = dict()
+        return sent
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from email.message import Message
+from queue import Queue, Empty
+from smtplib import SMTP, SMTPException, SMTPRecipientsRefused, SMTPResponseException
+from threading import Event, Thread
+from time import sleep, time
+
+import logging
+
+
+class MailSender:
+    """ Send mails in the background over one reused SMTP connection
+
+        The connection is opened by the first message and reused by the
+        next ones, it is opened again when the relay drops it. A message is
+        sent again with exponential backoff after a temporary failure, a
+        permanent failure (5xx reply) is not retried """
+
+    def __init__(self, host: str, port: int = 25, timeout: float = 30, retries: int = 3, backoff: float = 5,
+                 starttls: bool = False, username: str = None, password: str = None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+
+        self.queue = Queue()
+        self.stopped = Event()
+        self.smtp = None
+        self.sent, self.failed = 0, 0
+
+        self.thread = Thread(target=self._run, name='mail-sender', daemon=True)
+        self.thread.start()
+
+    def send(self, msg: Message, recipients: list = None) -> None:
+        """ Queue a message for the recipients, the To header by default """
+
+        if recipients is None:
+            recipients = [recipient.strip() for recipient in msg['To'].split(',')]
+        self.queue.put((msg, recipients))
+
+    def close(self, timeout: float = 120) -> None:
+        """ Wait at most timeout seconds for the queued messages to be sent
+            and close the connection, the messages still queued are lost """
+
+        self.stopped.set()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logging.error(f'Mail sender : {self.queue.qsize()} messages still queued after {timeout}s')
+        logging.info(f'Mail sender : sent = {self.sent}, failed = {self.failed}')
+
+    def _run(self) -> None:
+        while True:
+            try:
+                msg, recipients = self.queue.get(timeout=0.1)
+            except Empty:
+                if self.stopped.is_set():
+                    break
+                continue
+            if self._send(msg, recipients):
+                self.sent += 1
+            else:
+                self.failed += 1
+        self._disconnect()
+
+    def _connect(self) -> SMTP:
+        if self.smtp is None:
+            self.smtp = SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                self.smtp.starttls()
+            if self.username:
+                self.smtp.login(self.username, self.password)
+        return self.smtp
+
+    def _disconnect(self) -> None:
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (SMTPException, OSError):
+                pass
+            self.smtp = None
+
+    def _send(self, msg: Message, recipients: list) -> bool:
+        """ Send a message, retrying with exponential backoff """
+
+        message = msg.as_string()
+        for attempt in range(self.retries + 1):
+            begin = time()
+            try:
+                self._connect().sendmail(msg['From'], recipients, message)
+                logging.info(f'Mail "{msg["Subject"]}" sent to {recipients} in {time() - begin:.1f}s ({len(message)} bytes)')
+                return True
+            except SMTPRecipientsRefused as e:
+                logging.error(f'Mail refused for {recipients} : {e}')
+                return False
+            except SMTPResponseException as e:
+                logging.warning(f'Unable to send mail to {recipients} (attempt {attempt + 1}) : {e}')
+                if e.smtp_code >= 500:
+                    return False
+                self._disconnect()
+            except (SMTPException, OSError) as e:
+                logging.warning(f'Unable to send mail to {recipients} (attempt {attempt + 1}) : {e}')
+                self._disconnect()
+            if attempt < self.retries:
+                sleep(self.backoff * 2 ** attempt)
+        return False
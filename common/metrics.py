@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+from os import listdir, makedirs, path, remove, replace
+from threading import Event, Lock, Thread
+from time import sleep, time, time_ns
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import logging
+
+
+def escape_key(value: str) -> str:
+    """ Escape a measurement name, tag key/value or field key for the line protocol """
+
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def format_field(value) -> str:
+    """ Format a field value for the line protocol """
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"{}"'.format(str(value).replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def format_line(measurement: str, tags: dict, fields: dict) -> str:
+    """ Build a line protocol point without timestamp
+        Empty tags and None fields are omitted """
+
+    line = escape_key(measurement)
+    for key in sorted(tags):
+        if tags[key] is not None and tags[key] != '':
+            line += f',{escape_key(key)}={escape_key(tags[key])}'
+    return line + ' ' + ','.join(f'{escape_key(key)}={format_field(value)}' for key, value in fields.items() if value is not None)
+
+
+class MetricsBuilder:
+    """ Build the points of a run with a limit of series per measurement
+
+        A point creating a new series beyond max_series is dropped and
+        counted, the counts are sent as the metrics_dropped measurement """
+
+    def __init__(self, base_tags: dict, max_series: int = 1000):
+        self.base_tags = base_tags
+        self.max_series = max_series
+        self.lines = []
+        self.series = defaultdict(set)
+        self.dropped = defaultdict(int)
+
+    def add(self, measurement: str, fields: dict, **tags) -> bool:
+        tags = {**self.base_tags, **tags}
+        key = tuple(sorted((k, str(v)) for k, v in tags.items()))
+        known = self.series[measurement]
+        if key not in known and len(known) >= self.max_series:
+            self.dropped[measurement] += 1
+            return False
+        known.add(key)
+        self.lines.append(format_line(measurement, tags, fields))
+        return True
+
+    def build(self) -> list:
+        """ Return the points, including the dropped series counters """
+
+        for measurement, count in self.dropped.items():
+            self.lines.append(format_line('metrics_dropped', {**self.base_tags, 'measurement': measurement}, {'value': count}))
+            logging.warning(f'Metrics : {count} series of {measurement} dropped (limit = {self.max_series})')
+        self.dropped.clear()
+        return self.lines
+
+
+class MetricsExporter:
+    """ Buffer InfluxDB line protocol points and send them in the background
+
+        Points are flushed when the buffer reaches batch_size or every
+        flush_interval seconds. A batch which cannot be sent after the
+        retries is written to spool_dir and sent again by the next run.
+        The spool of the previous runs is replayed by its own thread, at
+        most spool_limit points by run, so that it does not delay the new
+        batches """
+
+    def __init__(self, url: str, database: str, spool_dir: str = None, batch_size: int = 5000,
+                 flush_interval: float = 10, retries: int = 3, backoff: float = 1, timeout: float = 10,
+                 spool_limit: int = 100000):
+        self.url = url.rstrip('/') + '/write?' + urlencode({'db': database, 'precision': 'ms'})
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.spool_limit = spool_limit
+
+        self.buffer = []
+        # Batches taken from the buffer and not yet sent or spooled
+        self.pending = dict()
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.stopped = Event()
+        self.sent, self.spooled = 0, 0
+
+        # Files spooled by this run are sent by the next one
+        files = sorted(file for file in listdir(spool_dir) if file.endswith('.lp')) if spool_dir and path.isdir(spool_dir) else []
+
+        self.thread = Thread(target=self._run, name='metrics-exporter', daemon=True)
+        self.thread.start()
+        self.spool_thread = Thread(target=self._drain_spool, args=(files,), name='metrics-spool', daemon=True)
+        self.spool_thread.start()
+
+    def add(self, line: str, timestamp: int = None) -> None:
+        """ Add a point without timestamp, timestamped in ms (now by default)
+            so that spooled points keep their original time """
+
+        with self.lock:
+            self.buffer.append(f'{line} {timestamp or int(time() * 1000)}')
+            if len(self.buffer) >= self.batch_size:
+                self.wakeup.set()
+
+    def close(self, timeout: float = 30) -> None:
+        """ Flush the remaining points and stop the background threads
+            Points still not sent after timeout seconds are spooled, with
+            the batch being sent. If that batch is sent afterwards, the
+            points written twice overwrite themselves in InfluxDB """
+
+        deadline = time() + timeout
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join(timeout)
+        self.spool_thread.join(max(0, deadline - time()))
+
+        with self.lock:
+            batches = list(self.pending.values()) + [self.buffer]
+            self.pending, self.buffer = dict(), []
+        lines = [line for batch in batches for line in batch]
+        if lines:
+            self._spool(lines)
+        logging.info(f'Metrics exporter : sent = {self.sent}, spooled = {self.spooled}')
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self) -> None:
+        while True:
+            with self.lock:
+                lines, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+                if lines:
+                    self.pending[id(lines)] = lines
+            if not lines:
+                return
+            sent = self._send(lines)
+            with self.lock:
+                # Already spooled by close() after its timeout
+                if self.pending.pop(id(lines), None) is None:
+                    return
+                if sent:
+                    self.sent += len(lines)
+            if not sent:
+                self._spool(lines)
+
+    def _send(self, lines: list) -> bool:
+        """ POST a batch, retrying with exponential backoff """
+
+        body = '\n'.join(lines).encode('utf-8')
+        for attempt in range(self.retries + 1):
+            try:
+                with urlopen(Request(self.url, data=body, method='POST'), timeout=self.timeout) as response:
+                    if response.status < 300:
+                        return True
+            except Exception as e:
+                logging.warning(f'Unable to send {len(lines)} points to InfluxDB (attempt {attempt + 1}) : {e}')
+            if attempt < self.retries and not self.stopped.is_set():
+                sleep(self.backoff * 2 ** attempt)
+        return False
+
+    def _spool(self, lines: list) -> None:
+        if not self.spool_dir:
+            logging.error(f'Dropping {len(lines)} points, no spool directory defined')
+            return
+        makedirs(self.spool_dir, exist_ok=True)
+        with open(path.join(self.spool_dir, f'{time_ns()}.lp'), 'w+') as f:
+            f.write('\n'.join(lines))
+        with self.lock:
+            self.spooled += len(lines)
+
+    def _drain_spool(self, files: list) -> None:
+        """ Send the points spooled by the previous runs, by batches of
+            batch_size and up to spool_limit points. A file is removed once
+            all its points are sent, the points left are kept in it """
+
+        replayed = 0
+        for file in files:
+            with open(path.join(self.spool_dir, file)) as f:
+                lines = f.read().splitlines()
+            while lines and replayed < self.spool_limit and not self.stopped.is_set():
+                batch = lines[:min(self.batch_size, self.spool_limit - replayed)]
+                if not self._send(batch):
+                    break
+                lines = lines[len(batch):]
+                replayed += len(batch)
+                with self.lock:
+                    self.sent += len(batch)
+            if lines:
+                # Replaced atomically, the thread may be stopped by the end of the run
+                with open(path.join(self.spool_dir, file + '.tmp'), 'w') as f:
+                    f.write('\n'.join(lines))
+                replace(path.join(self.spool_dir, file + '.tmp'), path.join(self.spool_dir, file))
+                logging.warning(f'Spooled points left for the next run : {len(lines)} in {file}')
+                return
+            remove(path.join(self.spool_dir, file))
+            logging.info(f'Sent the spooled points of {file}')
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import socket
+from email.message import EmailMessage
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import common.mail
+from common.mail import MailSender
+
+
+class RelayHandler:
+    """ Stand-in relay keeping the sessions and messages it received
+
+        The recipients in refused get a 550 reply, the first temporary
+        DATA commands get a 451 reply """
+
+    def __init__(self, refused: tuple = (), temporary: int = 0):
+        self.refused = refused
+        self.temporary = temporary
+        self.sessions = set()
+        self.rcpts = []
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        self.rcpts.append(address)
+        if address in self.refused:
+            return '550 5.1.1 Mailbox unavailable'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.temporary:
+            self.temporary -= 1
+            return '451 4.3.0 Try again later'
+        self.sessions.add(session)
+        self.messages.append(envelope)
+        return '250 Message accepted for delivery'
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def message(subject: str, to: str = 'team@example.com') -> EmailMessage:
+    msg = EmailMessage()
+    msg['Subject'], msg['From'], msg['To'] = subject, 'report@example.com', to
+    msg.set_content('Morning check')
+    return msg
+
+
+@pytest.fixture
+def relay(request):
+    handler = RelayHandler(**getattr(request, 'param', {}))
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """ Record the backoff delays instead of sleeping """
+
+    delays = []
+    monkeypatch.setattr(common.mail, 'sleep', delays.append)
+    return delays
+
+
+def test_connection_reused(relay):
+    sender = MailSender(relay.hostname, relay.port, timeout=5)
+    for i in range(5):
+        sender.send(message(f'Report {i}'))
+    sender.close(timeout=10)
+
+    assert (sender.sent, sender.failed) == (5, 0)
+    assert [envelope.rcpt_tos for envelope in relay.handler.messages] == [['team@example.com']] * 5
+    assert len(relay.handler.sessions) == 1
+
+
+@pytest.mark.parametrize('relay', [{'refused': ('gone@example.com',)}], indirect=True)
+def test_refused_recipient(relay, sleeps):
+    sender = MailSender(relay.hostname, relay.port, timeout=5, retries=3, backoff=1)
+    sender.send(message('Refused', to='gone@example.com'))
+    sender.send(message('Accepted'))
+    sender.close(timeout=10)
+
+    assert (sender.sent, sender.failed) == (1, 1)
+    # A refused recipient is permanent, it is neither retried nor breaks the connection
+    assert relay.handler.rcpts == ['gone@example.com', 'team@example.com']
+    assert sleeps == []
+    assert len(relay.handler.sessions) == 1
+
+
+@pytest.mark.parametrize('relay', [{'temporary': 2}], indirect=True)
+def test_temporary_failure_retried(relay, sleeps):
+    sender = MailSender(relay.hostname, relay.port, timeout=5, retries=3, backoff=2)
+    sender.send(message('Deferred'))
+    sender.close(timeout=10)
+
+    assert (sender.sent, sender.failed) == (1, 0)
+    assert sleeps == [2, 4]
+    assert len(relay.handler.messages) == 1
+
+
+def test_relay_unreachable(monkeypatch, sleeps):
+    connections = []
+
+    class CountingSMTP(common.mail.SMTP):
+        def __init__(self, *args, **kwargs):
+            connections.append(args)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(common.mail, 'SMTP', CountingSMTP)
+    port = free_port()
+    sender = MailSender('127.0.0.1', port, timeout=1, retries=3, backoff=0.5)
+    sender.send(message('Unreachable'))
+    sender.close(timeout=10)
+
+    assert (sender.sent, sender.failed) == (0, 1)
+    assert connections == [('127.0.0.1', port)] * 4
+    assert sleeps == [0.5, 1, 2]
+    assert sender.smtp is None
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import sleep
+
+import pytest
+
+import common.metrics
+from common.metrics import MetricsBuilder, MetricsExporter, format_line
+
+
+class InfluxHandler(BaseHTTPRequestHandler):
+    """ Stand-in InfluxDB write endpoint, the server holds the received
+        batches, the number of requests to fail and a delay by request """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        sleep(self.server.delay)
+        if self.server.failures:
+            self.server.failures -= 1
+            self.send_response(500)
+        else:
+            self.server.batches.append(body.splitlines())
+            self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def influx():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InfluxHandler)
+    server.batches, server.failures, server.delay = [], 0, 0
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """ Record the backoff delays instead of sleeping """
+
+    delays = []
+    monkeypatch.setattr(common.metrics, 'sleep', delays.append)
+    return delays
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def url(server) -> str:
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def wait(condition, timeout: float = 10) -> None:
+    for i in range(int(timeout * 100)):
+        if condition():
+            return
+        sleep(0.01)
+
+
+def points(batches: list) -> list:
+    """ Return the points of the batches without their timestamp """
+
+    return [line.rsplit(' ', 1)[0] for batch in batches for line in batch]
+
+
+def test_batches_sent(influx):
+    exporter = MetricsExporter(url(influx), 'morning_check', batch_size=3, flush_interval=60)
+    for i in range(7):
+        exporter.add(f'job value={i}')
+    exporter.close(timeout=10)
+
+    assert points(influx.batches) == [f'job value={i}' for i in range(7)]
+    assert all(len(batch) <= 3 for batch in influx.batches)
+    assert (exporter.sent, exporter.spooled) == (7, 0)
+
+
+def test_close_flushes_buffer(influx):
+    exporter = MetricsExporter(url(influx), 'morning_check', batch_size=100, flush_interval=60)
+    exporter.add('job value=1', timestamp=1700000000000)
+    exporter.close(timeout=10)
+
+    assert influx.batches == [['job value=1 1700000000000']]
+    assert exporter.sent == 1
+
+
+def test_retry_backoff_recovers(influx, sleeps):
+    influx.failures = 2
+    exporter = MetricsExporter(url(influx), 'morning_check', batch_size=1, retries=3, backoff=0.5, flush_interval=60)
+    exporter.add('job value=1')
+    wait(lambda: exporter.sent)
+    exporter.close(timeout=10)
+
+    assert points(influx.batches) == ['job value=1']
+    assert sleeps == [0.5, 1]
+    assert (exporter.sent, exporter.spooled) == (1, 0)
+
+
+def test_spooled_when_unreachable(tmp_path, sleeps):
+    exporter = MetricsExporter(f'http://127.0.0.1:{free_port()}', 'morning_check', spool_dir=str(tmp_path),
+                               batch_size=2, retries=2, backoff=1, timeout=1, flush_interval=60)
+    exporter.add('job value=1', timestamp=1700000000000)
+    exporter.add('job value=2', timestamp=1700000001000)
+    wait(lambda: exporter.spooled)
+    exporter.close(timeout=10)
+
+    assert (exporter.sent, exporter.spooled) == (0, 2)
+    files = list(tmp_path.glob('*.lp'))
+    assert len(files) == 1
+    assert files[0].read_text().splitlines() == ['job value=1 1700000000000', 'job value=2 1700000001000']
+    assert sleeps == [1, 2]
+
+
+def test_spool_replayed_after_recovery(influx, tmp_path, sleeps):
+    influx.failures = 100
+    exporter = MetricsExporter(url(influx), 'morning_check', spool_dir=str(tmp_path), retries=1, flush_interval=60)
+    exporter.add('job value=1', timestamp=1700000000000)
+    exporter.close(timeout=10)
+    assert (exporter.sent, exporter.spooled) == (0, 1)
+
+    influx.failures = 0
+    exporter = MetricsExporter(url(influx), 'morning_check', spool_dir=str(tmp_path), flush_interval=60)
+    exporter.spool_thread.join(10)
+    exporter.close(timeout=10)
+    assert influx.batches == [['job value=1 1700000000000']]
+    assert exporter.sent == 1
+    assert not list(tmp_path.iterdir())
+
+
+def test_spool_drained_up_to_limit(influx, tmp_path):
+    (tmp_path / '1.lp').write_text('\n'.join(f'job value={i} {1700000000000 + i}' for i in range(5)))
+    exporter = MetricsExporter(url(influx), 'morning_check', spool_dir=str(tmp_path), batch_size=2, spool_limit=3,
+                               flush_interval=60)
+    exporter.spool_thread.join(10)
+    exporter.close(timeout=10)
+
+    assert points(influx.batches) == ['job value=0', 'job value=1', 'job value=2']
+    assert [len(batch) for batch in influx.batches] == [2, 1]
+    # The points over the limit are kept for the next run
+    assert (tmp_path / '1.lp').read_text().splitlines() == ['job value=3 1700000000003', 'job value=4 1700000000004']
+    assert not list(tmp_path.glob('*.tmp'))
+    assert exporter.sent == 3
+
+
+def test_spool_file_removed_once_sent(influx, tmp_path):
+    (tmp_path / '1.lp').write_text('job value=1 1700000000000')
+    exporter = MetricsExporter(url(influx), 'morning_check', spool_dir=str(tmp_path), flush_interval=60)
+    exporter.spool_thread.join(10)
+    exporter.close(timeout=10)
+
+    assert influx.batches == [['job value=1 1700000000000']]
+    assert not list(tmp_path.iterdir())
+
+
+def test_close_timeout_spools_batch_in_flight(influx, tmp_path):
+    influx.delay = 2
+    exporter = MetricsExporter(url(influx), 'morning_check', spool_dir=str(tmp_path), batch_size=1, flush_interval=60)
+    exporter.add('job value=1', timestamp=1700000000000)
+    sleep(0.5)
+    exporter.add('job value=2', timestamp=1700000001000)
+    exporter.close(timeout=0.5)
+
+    # The batch being sent and the buffer are spooled, the batch sent afterwards is not counted twice
+    assert exporter.spooled == 2
+    spooled = [line for file in sorted(tmp_path.glob('*.lp')) for line in file.read_text().splitlines()]
+    assert sorted(spooled) == ['job value=1 1700000000000', 'job value=2 1700000001000']
+    exporter.thread.join(10)
+    assert exporter.sent == 0
+
+
+def test_format_line_escaping():
+    line = format_line('backup job', {'server': 'VBR 1,a=b', 'empty': '', 'none': None},
+                       {'reason': 'say "hi" \\o/', 'count': 3, 'ok': True, 'missing': None})
+    assert line == 'backup\\ job,server=VBR\\ 1\\,a\\=b reason="say \\"hi\\" \\\\o/",count=3,ok=true'
+
+
+def test_builder_max_series():
+    builder = MetricsBuilder({'server': 'VBR1'}, max_series=2)
+    assert builder.add('job', {'value': 1}, job='A')
+    assert builder.add('job', {'value': 2}, job='B')
+    assert not builder.add('job', {'value': 3}, job='C')
+    # A known series is still accepted once the limit is reached
+    assert builder.add('job', {'value': 4}, job='A')
+
+    lines = builder.build()
+    assert lines == ['job,job=A,server=VBR1 value=1', 'job,job=B,server=VBR1 value=2', 'job,job=A,server=VBR1 value=4',
+                     'metrics_dropped,measurement=job,server=VBR1 value=1']
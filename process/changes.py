@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from hashlib import md5
+
+
+def failure_key(server: str, job_id: str, object_id: str) -> bytes:
+    """ Hash the server, job and object of a session in a binary(16) key """
+
+    return md5(f'{server}|{job_id}|{object_id}'.lower().encode('utf-8')).digest()
+
+
+def index_failures(sessions: dict, kind: str) -> dict:
+    """ Index the sessions of the report by their kind and key """
+
+    return {
+        (kind, failure_key(server, sessions[server][job][vm].get('job_id'), sessions[server][job][vm].get('object_id'))):
+            {'kind': kind, 'server': server, 'job': job, 'vm': vm}
+        for server in sessions
+        for job in sessions[server]
+        for vm in sessions[server][job]
+    }
+
+
+def since_text(days: int) -> str:
+    """ Format the number of days since a failure was first seen """
+
+    if days <= 0:
+        return 'since today'
+    return f'for {days} day' + ('s' if days > 1 else '')
+
+
+def diff_failures(current: dict, previous: dict, servers: list, now: datetime) -> dict:
+    """ Compare the indexed sessions of this run to those of the previous run
+
+        previous maps the same keys to the stored rows of the previous run
+        of their server, with the date they were first seen. Each side is read
+        once and the other side is looked up by key. Only the servers of
+        this run can have resolved failures, a missing artifact does not
+        resolve the failures of its server. The first_seen date of each
+        current session is set for the next run """
+
+    changes = {'new': [], 'persistent': [], 'resolved': []}
+    for key, session in current.items():
+        stored = previous.get(key)
+        if stored is None:
+            session['first_seen'] = now
+            session['days'] = 0
+            changes['new'].append(session)
+        else:
+            session['first_seen'] = stored['first_seen']
+            session['days'] = (now - stored['first_seen']).days
+            changes['persistent'].append(session)
+        session['since'] = 'new' if stored is None else since_text(session['days'])
+
+    servers = set(servers)
+    for key, stored in previous.items():
+        if key not in current and stored['server'] in servers:
+            changes['resolved'].append(stored)
+
+    changes['persistent'].sort(key=lambda session: session['days'], reverse=True)
+    return changes
+
+
+def track_failures(cursor, sql_select: str, sql_delete: str, sql_insert: str, current: dict, servers: list,
+                   id_pipeline: int, now: datetime) -> dict:
+    """ Compare the indexed sessions of this run to the failure state stored
+        by the previous run of each server, then store the state of this run
+
+        The state is kept by pipeline, a run of the same pipeline again
+        replaces the state of its servers and is compared to the same
+        previous runs. A server without failures in its previous run has
+        no state in it, all its failures are new """
+
+    cursor.execute(sql_select, (id_pipeline,))
+    previous = {
+        (kind, bytes(key_hash)): {'kind': kind, 'server': server, 'job': job, 'vm': vm, 'first_seen': first_seen}
+        for kind, key_hash, server, job, vm, first_seen in cursor.fetchall()
+    }
+    changes = diff_failures(current, previous, servers, now)
+    cursor.executemany(sql_delete, [(id_pipeline, server) for server in servers])
+    cursor.executemany(sql_insert, [
+        (kind, key_hash, session['server'], session['job'], session['vm'], session['first_seen'], now, id_pipeline)
+        for (kind, key_hash), session in current.items()
+    ])
+    return changes
+
+
+def filter_changes(changes: dict, servers: list) -> dict:
+    """ Keep the changes of the given servers """
+
+    servers = set(servers)
+    return {status: [session for session in sessions if session['server'] in servers] for status, sessions in changes.items()}
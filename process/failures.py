@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import re
+from hashlib import md5
+from typing import Union
+
+# Variable parts of the failure reasons, masked in this order
+MASKS = [
+    (re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE), '<GUID>'),
+    (re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b'), '<IP>'),
+    (re.compile(r'\b\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?: ?[AP]M)?Z?)?', re.IGNORECASE), '<TIME>'),
+    (re.compile(r'\b\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?: ?[AP]M)?', re.IGNORECASE), '<TIME>'),
+    (re.compile(r'\b0x[0-9a-f]+\b|\b\d+\b', re.IGNORECASE), '<N>'),
+    (re.compile(r'\s+'), ' ')
+]
+
+
+def replace_name(text: str, name: str, mask: str) -> str:
+    """ Replace the case insensitive occurrences of name in text by mask """
+
+    lower, name = text.lower(), name.lower()
+    if len(lower) != len(text) or len(name) == 0:
+        return re.sub(re.escape(name), mask, text, flags=re.IGNORECASE)
+    parts, start = [], 0
+    index = lower.find(name)
+    while index >= 0:
+        parts.append(text[start:index])
+        parts.append(mask)
+        start = index + len(name)
+        index = lower.find(name, start)
+    parts.append(text[start:])
+    return ''.join(parts)
+
+
+def reason_template(reason: Union[str, None], vm: Union[str, None] = None, job: Union[str, None] = None) -> str:
+    """ Mask the VM and job names, the GUIDs, the timestamps, the IPs and
+        the numbers of a failure reason so that the reasons with the same
+        root cause share the same template """
+
+    if not reason:
+        return ''
+    template = reason
+    for name, mask in [(vm, '<VM>'), (job, '<JOB>')]:
+        if name:
+            template = replace_name(template, name, mask)
+    for pattern, mask in MASKS:
+        template = pattern.sub(mask, template)
+    return template.strip()
+
+
+def reason_cause(reason: Union[str, None], vm: Union[str, None] = None, job: Union[str, None] = None) -> tuple:
+    """ Return the hash and the template of a failure reason """
+
+    template = reason_template(reason, vm, job)
+    return md5(template.encode('utf-8')).hexdigest(), template
+
+
+def cluster_failures(failed: dict, top: int = 10) -> list:
+    """ Group the failed sessions of all servers by the hash of their reason
+
+        The sessions are counted in one pass, without comparing the reasons
+        between them. The top causes are returned by decreasing count and
+        their rank is stored in the cause_rank of their sessions """
+
+    causes = dict()
+    for server in failed:
+        for job in failed[server]:
+            for vm in failed[server][job]:
+                session = failed[server][job][vm]
+                if not session.get('cause'):
+                    continue
+                cause = causes.setdefault(session['cause'], {
+                    'cause': session['cause'],
+                    'template': session.get('cause_template'),
+                    'count': 0,
+                    'servers': dict(),
+                    'jobs': set(),
+                    'sessions': []
+                })
+                cause['count'] += 1
+                cause['servers'][server] = cause['servers'].get(server, 0) + 1
+                cause['jobs'].add((server, job))
+                cause['sessions'].append(session)
+
+    ranking = sorted(causes.values(), key=lambda cause: cause['count'], reverse=True)[:top]
+    result = []
+    for rank, cause in enumerate(ranking, start=1):
+        for session in cause.pop('sessions'):
+            session['cause_rank'] = rank
+        cause['rank'] = rank
+        cause['servers'] = dict(sorted(cause['servers'].items()))
+        cause['server_jobs'] = dict()
+        for server, job in cause['jobs']:
+            cause['server_jobs'][server] = cause['server_jobs'].get(server, 0) + 1
+        cause['jobs'] = len(cause['jobs'])
+        result.append(cause)
+    return result
+
+
+def filter_causes(causes: list, servers: list) -> list:
+    """ Return the causes of the failures of the given servers, counted on these servers only """
+
+    result = []
+    for cause in causes:
+        counts = {server: count for server, count in cause['servers'].items() if server in servers}
+        if counts:
+            jobs = {server: count for server, count in cause['server_jobs'].items() if server in servers}
+            result.append({**cause, 'count': sum(counts.values()), 'servers': counts, 'jobs': sum(jobs.values()), 'server_jobs': jobs})
+    return result
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from itertools import chain
+from typing import Union
+
+import numpy as np
+
+
+def group_history(rows: list) -> dict:
+    """ Group the mcb_repositorie history rows (server_name, name, extent,
+        scale_out_name, id_info, creation_time, free) by repository, by extent
+        and by scale-out. The free space of a scale-out is the sum of the
+        free space of its extents inserted by the same run """
+
+    series = dict()
+    scaleouts = dict()
+    for server_name, name, extent, scale_out_name, id_info, creation_time, free in rows:
+        if scale_out_name:
+            key = (server_name, scale_out_name, extent)
+            scaleout = scaleouts.setdefault((server_name, scale_out_name, None), dict())
+            scaleout[id_info] = (creation_time, scaleout.get(id_info, (None, 0))[1] + free)
+        else:
+            key = (server_name, name, None)
+        times, values = series.setdefault(key, ([], []))
+        times.append(creation_time)
+        values.append(free)
+
+    for key, points in scaleouts.items():
+        points = sorted(points.values())
+        series[key] = ([time for time, free in points], [free for time, free in points])
+    return series
+
+
+def days_to_full(series: dict, now: datetime, half_life: float = 30, min_points: int = 3) -> dict:
+    """ Forecast the days before each series of free space reaches zero
+
+        All the series are fitted at once by a weighted least squares line,
+        the weight of a point being halved every half_life days of age so that
+        the recent growth prevails. The series are padded in one matrix, the
+        padding having a zero weight. A series which is not shrinking or has
+        less than min_points points is forecast to None """
+
+    keys = list(series)
+    if not keys:
+        return dict()
+
+    # Scatter the concatenated points of the series in the rows of the matrix
+    lengths = np.array([len(series[key][0]) for key in keys])
+    rows = np.repeat(np.arange(len(keys)), lengths)
+    columns = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    mask = np.arange(lengths.max()) < lengths[:, None]
+    x = np.zeros(mask.shape)
+    y = np.zeros(mask.shape)
+    # The series share the creation times of the pipelines, each one is converted once
+    ages = {time: (time - now).total_seconds() / 86400 for time in set(chain.from_iterable(series[key][0] for key in keys))}
+    x[rows, columns] = np.fromiter((ages[time] for key in keys for time in series[key][0]), float, len(rows))
+    y[rows, columns] = np.fromiter(chain.from_iterable(series[key][1] for key in keys), float, len(rows))
+
+    # Ages are negative, the weight of a point of the future is capped to 1
+    weights = np.where(mask, 0.5 ** (np.maximum(-x, 0) / half_life), 0)
+    total = weights.sum(axis=1)
+    mean_x = (weights * x).sum(axis=1) / total
+    mean_y = (weights * y).sum(axis=1) / total
+    dx = x - mean_x[:, None]
+    variance = (weights * dx * dx).sum(axis=1)
+    covariance = (weights * dx * (y - mean_y[:, None])).sum(axis=1)
+    slope = np.divide(covariance, variance, out=np.zeros_like(covariance), where=variance > 0)
+
+    # The last point is the current free space, consumed at -slope per day
+    last = y[np.arange(len(keys)), lengths - 1]
+    shrinking = (slope < 0) & (lengths >= min_points)
+    days = np.divide(last, -slope, out=np.full_like(last, np.inf), where=shrinking)
+
+    return {key: float(days[i]) if shrinking[i] else None for i, key in enumerate(keys)}
+
+
+def forecast_text(days: Union[float, None], horizon: int = 365) -> str:
+    """ Format the days before full for the report """
+
+    if days is None or days > horizon:
+        return ''
+    if days < 1:
+        return '< 1 day'
+    return f'{int(days)} days'
+
+
+def forecast_color(days: Union[float, None]) -> str:
+    """ Return the CSS color class depending of
+        the days before the repository is full """
+
+    if days is None:
+        return ''
+    if days <= 7:
+        return 'bg-error'
+    elif days <= 30:
+        return 'bg-warning'
+    else:
+        return ''
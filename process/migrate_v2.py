@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from os import getenv, path
+from sys import exit
+from time import perf_counter
+from typing import Union
+import logging
+
+from schema_v2 import DimensionCache, FACTS
+
+# Queries run on both schemas to compare them, with the query giving their parameters
+BENCHMARKS = {
+    'failed sessions by job': (
+        'SELECT job_name, COUNT(*) FROM mcb_failed GROUP BY job_name',
+        'SELECT mcb2_job.name, COUNT(*) FROM mcb2_failed '
+        'INNER JOIN mcb2_job ON mcb2_job.id = mcb2_failed.id_job GROUP BY mcb2_job.name',
+        None
+    ),
+    'failed sessions of an object': (
+        'SELECT start_date, backup_status, reason FROM mcb_failed WHERE object_id = %s',
+        'SELECT start_date, backup_status, reason FROM mcb2_failed '
+        'INNER JOIN mcb2_object ON mcb2_object.id = mcb2_failed.id_object '
+        'WHERE mcb2_object.guid = UNHEX(REPLACE(%s, \'-\', \'\'))',
+        'SELECT object_id FROM mcb_failed ORDER BY id DESC LIMIT 1'
+    ),
+    'repositories history': (
+        open(path.join(path.dirname(path.realpath(__file__)), 'sql', 'select_repositorie_history.sql')).read(),
+        open(path.join(path.dirname(path.realpath(__file__)), 'sql', 'v2', 'select_repositorie_history.sql')).read(),
+        'SELECT DATE_SUB(NOW(), INTERVAL 90 DAY)'
+    )
+}
+
+# Queries giving the server of the values of a column, from the tables storing the server of their rows
+SERVER_SOURCES = {
+    'job_id': 'SELECT job_id, server_name FROM mcb_upsert_failed '
+              'UNION SELECT job_id, server_name FROM mcb_upsert_in_progress',
+    'job_name': 'SELECT job_name, server_name FROM mcb_job_throughput '
+                'UNION SELECT job_name, server_name FROM mcb_failure_state',
+    'mediapool_name': 'SELECT mediapool_name, server_name FROM mcb_tape_pool',
+    'id_repo': 'SELECT id_repo, server_name FROM mcb_repositorie WHERE server_name IS NOT NULL'
+}
+
+# Columns selected after the server_name by the select_v1 queries, tried in order to find the server of a row
+SERVER_KEYS = {
+    'tape': ['mediapool_name', 'job_name'],
+    'in_progress': ['job_id', 'job_name'],
+    'failed': ['job_id', 'job_name'],
+    'repositorie': ['id_repo']
+}
+
+# Server of the rows whose server cannot be derived
+UNKNOWN_SERVER = 'unknown'
+
+
+def create_schema(conn, file: str) -> bool:
+    """ Create the v2 tables if they do not exist yet """
+
+    cursor = conn.cursor()
+    cursor.execute("SHOW TABLES LIKE 'mcb2_server'")
+    exists = cursor.fetchone() is not None
+    if not exists:
+        with open(file) as f:
+            statements = [s.strip() for s in f.read().split(';')]
+        for statement in statements:
+            lines = [line for line in statement.splitlines() if not line.strip().startswith('--')]
+            if lines:
+                cursor.execute('\n'.join(lines))
+        conn.commit()
+    cursor.close()
+    return not exists
+
+
+def table_sizes(conn, database: str, pattern: str) -> dict:
+    """ Return the rows and the size in bytes (data and indexes) of the tables matching pattern """
+
+    cursor = conn.cursor()
+    cursor.execute('SELECT table_name FROM information_schema.tables WHERE table_schema = %s AND table_name LIKE %s',
+                   (database, pattern))
+    tables = [row[0] for row in cursor.fetchall()]
+    # Refresh the statistics, information_schema is only an estimate otherwise
+    for table in tables:
+        cursor.execute(f'ANALYZE TABLE {table}')
+        cursor.fetchall()
+    cursor.execute('SELECT table_name, table_rows, data_length + index_length FROM information_schema.tables '
+                   'WHERE table_schema = %s AND table_name LIKE %s ORDER BY table_name', (database, pattern))
+    sizes = {row[0]: {'rows': row[1], 'bytes': row[2]} for row in cursor.fetchall()}
+    cursor.close()
+    return sizes
+
+
+def load_servers(conn) -> dict:
+    """ Return the server of the values of each column of SERVER_SOURCES
+        A value seen on several servers is left out, it does not tell the server of a row """
+
+    cursor = conn.cursor()
+    servers = dict()
+    for column, sql in SERVER_SOURCES.items():
+        try:
+            cursor.execute(sql)
+        except Exception as e:
+            logging.warning(f'Servers by {column} not loaded : {e}')
+            servers[column] = dict()
+            continue
+        values = dict()
+        for value, server in cursor.fetchall():
+            values.setdefault(value, set()).add(server)
+        servers[column] = {value: names.pop() for value, names in values.items() if len(names) == 1}
+    cursor.close()
+    return servers
+
+
+def row_server(servers: dict, keys: list, row: tuple) -> Union[str, None]:
+    """ Return the server of a selected v1 row : its server_name column,
+        else the server of the first of its keys with a known server """
+
+    if row[1]:
+        return row[1]
+    for column, value in zip(keys, row[2:]):
+        server = servers[column].get(value)
+        if server:
+            return server
+    return None
+
+
+def migrate_table(conn, dimensions: DimensionCache, servers: dict, table: str, sql_select: str, sql_insert: str,
+                  chunk_size: int) -> int:
+    """ Copy the history of a v1 table in its v2 table, by chunks of ids
+
+        The last id copied is saved with each chunk so that an interrupted
+        migration resumes where it stopped. mcb_info holds a single server
+        by run, so the server of each row is derived from its own columns,
+        the rows without known server are attributed to UNKNOWN_SERVER.
+        Return the number of rows copied """
+
+    convert = FACTS[table][0]
+    keys = SERVER_KEYS[table]
+    unknown = 0
+    cursor = conn.cursor()
+    cursor.execute('SELECT last_id FROM mcb2_migration WHERE table_name = %s', (table,))
+    row = cursor.fetchone()
+    last_id = row[0] if row else 0
+    copied = 0
+    while True:
+        cursor.execute(sql_select, (last_id, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        converted = []
+        for row in rows:
+            server = row_server(servers, keys, row)
+            if server is None:
+                server = UNKNOWN_SERVER
+                unknown += 1
+            converted.append(convert(dimensions, server, tuple(row[2 + len(keys):])))
+        cursor.executemany(sql_insert, converted)
+        last_id = rows[-1][0]
+        cursor.execute('REPLACE INTO mcb2_migration (table_name, last_id) VALUES (%s, %s)', (table, last_id))
+        conn.commit()
+        copied += len(rows)
+        logging.info(f'mcb_{table} : {copied} rows copied, last id {last_id}')
+    cursor.close()
+    if unknown:
+        logging.warning(f'mcb_{table} : {unknown} rows without known server attributed to {UNKNOWN_SERVER}')
+    return copied
+
+
+def benchmark(conn, runs: int) -> dict:
+    """ Return the best time in seconds of each benchmark query on v1 and v2 """
+
+    cursor = conn.cursor()
+    result = dict()
+    for name, (sql_v1, sql_v2, sql_params) in BENCHMARKS.items():
+        params = ()
+        if sql_params:
+            cursor.execute(sql_params)
+            row = cursor.fetchone()
+            if row is None:
+                continue
+            params = tuple(row)
+        times = dict()
+        for version, sql in (('v1', sql_v1), ('v2', sql_v2)):
+            best = None
+            for i in range(runs):
+                begin = perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                elapsed = perf_counter() - begin
+                best = elapsed if best is None else min(best, elapsed)
+            times[version] = best
+        result[name] = times
+    cursor.close()
+    return result
+
+
+def main() -> None:
+    """ Migrate the history of the v1 sessions and repositories tables to the schema v2 """
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s : %(lineno)d : %(levelname)s : %(module)s : %(funcName)s : %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    scriptPath = path.dirname(path.realpath(__file__))
+    MIGRATION_CHUNK_SIZE = int(getenv('MIGRATION_CHUNK_SIZE', '5000'))
+    BENCHMARK_RUNS = int(getenv('BENCHMARK_RUNS', '5'))
+
+    for var in ['DATABASE_ADDRESS', 'DATABASE_PORT', 'DATABASE_NAME', 'DATABASE_USERNAME', 'DATABASE_PASSWORD']:
+        if not getenv(var):
+            logging.error(f'Required environment variable {var} is not defined')
+            exit(1)
+    DATABASE_NAME = getenv('DATABASE_NAME')
+
+    import mysql.connector
+    conn = mysql.connector.connect(
+            host=getenv('DATABASE_ADDRESS'),
+            port=getenv('DATABASE_PORT'),
+            database=DATABASE_NAME,
+            user=getenv('DATABASE_USERNAME'),
+            password=getenv('DATABASE_PASSWORD'))
+
+    if create_schema(conn, path.join(scriptPath, '..', 'veeam', 'sql', 'create_database_v2.sql')):
+        logging.info('Schema v2 created')
+
+    dimensions = DimensionCache(conn)
+    servers = load_servers(conn)
+    for table, (convert, insert_file) in FACTS.items():
+        sql_select = open(path.join(scriptPath, 'sql', 'v2', f'select_v1_{table}.sql')).read()
+        sql_insert = open(path.join(scriptPath, 'sql', 'v2', insert_file)).read()
+        copied = migrate_table(conn, dimensions, servers, table, sql_select, sql_insert, MIGRATION_CHUNK_SIZE)
+        logging.info(f'mcb_{table} migrated : {copied} rows')
+
+    sizes_v1 = table_sizes(conn, DATABASE_NAME, 'mcb\\_%')
+    sizes_v2 = table_sizes(conn, DATABASE_NAME, 'mcb2\\_%')
+    print('Table sizes')
+    for table, size in list(sizes_v1.items()) + list(sizes_v2.items()):
+        print(f'  {table:<24} {size["rows"]:>12} rows {size["bytes"] / 1024 / 1024:>10.1f} MB')
+    for table in FACTS:
+        v1, v2 = sizes_v1.get(f'mcb_{table}'), sizes_v2.get(f'mcb2_{table}')
+        if v1 and v2 and v1['bytes']:
+            print(f'  mcb_{table} : {(v1["bytes"] - v2["bytes"]) * 100 / v1["bytes"]:.1f} % smaller in v2')
+
+    print(f'Queries (best of {BENCHMARK_RUNS} runs)')
+    for name, times in benchmark(conn, BENCHMARK_RUNS).items():
+        print(f'  {name:<30} v1 {times["v1"] * 1000:>10.1f} ms   v2 {times["v2"] * 1000:>10.1f} ms')
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
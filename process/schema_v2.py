@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from typing import Union
+from uuid import UUID
+
+import logging
+
+# Codes of the job types and transport modes stored as small integers
+JOB_TYPES = {'Backup': 0, 'Replica': 1, 'Backup Tape': 28, 'Backup Copy': 51, 'Unknown': -1}
+TRANSPORT_MODES = {'san': 1, 'nbd': 2, 'hotadd': 3}
+
+# Query loading the keys of a dimension, and query inserting a member and returning its key
+# The natural key columns come first, the key last
+DIMENSIONS = {
+    'server': (
+        'SELECT name, id FROM mcb2_server',
+        'INSERT INTO mcb2_server (name) VALUES (%s) '
+        'ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)'
+    ),
+    'job': (
+        'SELECT id_server, guid, id FROM mcb2_job',
+        'INSERT INTO mcb2_job (id_server, guid, name, type) VALUES (%s, %s, %s, %s) '
+        'ON DUPLICATE KEY UPDATE name = VALUES(name), type = VALUES(type), id = LAST_INSERT_ID(id)'
+    ),
+    'object': (
+        'SELECT id_server, guid, id FROM mcb2_object',
+        'INSERT INTO mcb2_object (id_server, guid, name) VALUES (%s, %s, %s) '
+        'ON DUPLICATE KEY UPDATE name = VALUES(name), id = LAST_INSERT_ID(id)'
+    ),
+    'repository': (
+        'SELECT id_server, name, id FROM mcb2_repository',
+        'INSERT INTO mcb2_repository (id_server, name, guid) VALUES (%s, %s, %s) '
+        'ON DUPLICATE KEY UPDATE guid = IFNULL(VALUES(guid), guid), id = LAST_INSERT_ID(id)'
+    )
+}
+
+
+def guid_bytes(value: Union[str, bytes, None]) -> Union[bytes, None]:
+    """ Convert a GUID to its binary(16) form """
+
+    if not value:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return UUID(str(value)).bytes
+
+
+class DimensionCache:
+    """ Surrogate keys of the dimension tables
+
+        The existing keys are loaded once by dimension, the missing members
+        are inserted on the fly so that the rows of an artifact are resolved
+        without querying the database for the known servers, jobs, objects
+        and repositories """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.keys = dict()
+        self.hits, self.misses = 0, 0
+
+    def load(self, dimension: str) -> dict:
+        if dimension not in self.keys:
+            cursor = self.conn.cursor()
+            cursor.execute(DIMENSIONS[dimension][0])
+            self.keys[dimension] = {
+                tuple(bytes(value) if isinstance(value, bytearray) else value for value in row[:-1]): row[-1]
+                for row in cursor.fetchall()
+            }
+            cursor.close()
+        return self.keys[dimension]
+
+    def key(self, dimension: str, natural: tuple, attributes: tuple = ()) -> int:
+        """ Return the key of a member, inserting it when it is unknown """
+
+        keys = self.load(dimension)
+        if natural in keys:
+            self.hits += 1
+            return keys[natural]
+        self.misses += 1
+        cursor = self.conn.cursor()
+        cursor.execute(DIMENSIONS[dimension][1], natural + attributes)
+        keys[natural] = cursor.lastrowid
+        cursor.close()
+        return keys[natural]
+
+    def server(self, name: str) -> int:
+        return self.key('server', (name,))
+
+    def job(self, id_server: int, guid: str, name: str, job_type: Union[str, None]) -> int:
+        return self.key('job', (id_server, guid_bytes(guid)), (name, JOB_TYPES.get(job_type, -1)))
+
+    def object(self, id_server: int, guid: str, name: str) -> int:
+        return self.key('object', (id_server, guid_bytes(guid)), (name,))
+
+    def repository(self, id_server: int, name: Union[str, None], guid: Union[str, None] = None) -> Union[int, None]:
+        if not name:
+            return None
+        return self.key('repository', (id_server, name), (guid_bytes(guid),))
+
+
+def tape_row(dimensions: DimensionCache, server: str, row: tuple) -> tuple:
+    """ Convert a mcb_tape row to a mcb2_tape row """
+
+    id_info, start_date, end_date, backup_status, backup_status_details, job_name, job_id, reason, mediapool_name = row
+    id_server = dimensions.server(server)
+    return (id_info, dimensions.job(id_server, job_id, job_name, 'Backup Tape'), start_date, end_date, backup_status,
+            reason, mediapool_name)
+
+
+def in_progress_row(dimensions: DimensionCache, server: str, row: tuple) -> tuple:
+    """ Convert a mcb_in_progress row to a mcb2_in_progress row """
+
+    (id_info, start_date, session_id, orig_session_id, backup_status, backup_status_details, last_point_success,
+     object_id, job_name, job_id, job_type, object_name, backup_transport_mode, target_storage, proxies,
+     nb_restore_points, retaindays, retaincycles, retention_maintenance) = row[:19]
+    id_server = dimensions.server(server)
+    return (id_info, dimensions.job(id_server, job_id, job_name, job_type), dimensions.object(id_server, object_id, object_name),
+            dimensions.repository(id_server, target_storage), start_date, guid_bytes(session_id), guid_bytes(orig_session_id),
+            backup_status, last_point_success, TRANSPORT_MODES.get(backup_transport_mode), proxies, nb_restore_points,
+            retaindays, retaincycles, retention_maintenance)
+
+
+def failed_row(dimensions: DimensionCache, server: str, row: tuple) -> tuple:
+    """ Convert a mcb_failed row to a mcb2_failed row """
+
+    (id_info, start_date, end_date, session_id, orig_session_id, backup_status, backup_status_details,
+     last_point_success, object_id, job_name, job_id, job_type, reason, object_name, backup_transport_mode,
+     target_storage, proxies, nb_restore_points, retaindays, retaincycles, retention_maintenance) = row[:21]
+    id_server = dimensions.server(server)
+    return (id_info, dimensions.job(id_server, job_id, job_name, job_type), dimensions.object(id_server, object_id, object_name),
+            dimensions.repository(id_server, target_storage), start_date, end_date, guid_bytes(session_id),
+            guid_bytes(orig_session_id), backup_status, last_point_success, reason, TRANSPORT_MODES.get(backup_transport_mode),
+            proxies, nb_restore_points, retaindays, retaincycles, retention_maintenance)
+
+
+def repositorie_row(dimensions: DimensionCache, server: str, row: tuple) -> tuple:
+    """ Convert a mcb_repositorie row to a mcb2_repositorie row """
+
+    (id_info, id_repo, name, extent, description, repo_type, repo_path, status, host_name, host_ip, scale_out_name,
+     free, total, used) = row[:14]
+    id_server = dimensions.server(server)
+    return (id_info, dimensions.repository(id_server, name, id_repo), extent, scale_out_name, description, repo_type,
+            repo_path, status, host_name, host_ip, free, total, used)
+
+
+# Converters and insert queries of the fact tables, by v1 table
+FACTS = {
+    'tape': (tape_row, 'insert_tape.sql'),
+    'in_progress': (in_progress_row, 'insert_in_progress.sql'),
+    'failed': (failed_row, 'insert_failed.sql'),
+    'repositorie': (repositorie_row, 'insert_repositorie.sql')
+}
+
+
+def ingest_rows(conn, dimensions: DimensionCache, queries: dict, server: str, rows: dict) -> dict:
+    """ Convert the v1 rows of a server by table and insert them in bulk
+        Return the number of rows inserted by table """
+
+    counts = dict()
+    cursor = conn.cursor()
+    for table, table_rows in rows.items():
+        if not table_rows:
+            continue
+        convert = FACTS[table][0]
+        cursor.executemany(queries[table], [convert(dimensions, server, row) for row in table_rows])
+        counts[table] = len(table_rows)
+    conn.commit()
+    cursor.close()
+    logging.info(f'Ingested {server} in schema v2 : {counts}, dimension keys hits = {dimensions.hits}, misses = {dimensions.misses}')
+    return counts
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+from os import getenv, path
+from sys import argv
+import gzip
+import logging
+from hashlib import md5
+from threading import Lock
+from time import time
+from typing import Callable, Union
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+
+def flatten_sessions(sessions: dict, server_filter: Union[str, None] = None) -> list:
+    """ Flatten the sessions grouped by server, job and VM
+        without their CSS color classes """
+
+    result = []
+    for server in sessions:
+        if server_filter and server != server_filter:
+            continue
+        for job in sessions[server]:
+            for vm in sessions[server][job]:
+                row = {'server': server, 'job': job, 'vm': vm}
+                row.update({key: value for key, value in sessions[server][job][vm].items() if not key.endswith('_color')})
+                result.append(row)
+    return result
+
+
+def flatten_repositories(capacities: dict, threshold: int) -> list:
+    """ Flatten the repositories and scale-out extents of all the servers
+        whose free space percent is below or equal to threshold """
+
+    return [
+        {'server': server, **capacity}
+        for server in capacities
+        for capacity in capacities[server]
+        if capacity['free_percent'] <= threshold
+    ]
+
+
+class ReportStore:
+    """ Latest outputs of the worker with a cache of the responses
+
+        The cache is invalidated when a new pipeline is inserted in
+        mcb_pipeline or when the worker outputs are rewritten. The version
+        is checked at most every check_interval seconds so that the
+        requests do not hit MySQL. Each new version increments the
+        generation, a response built from an older generation is returned
+        but not cached """
+
+    def __init__(self, report_dir: str, check_interval: float = 10, database: Union[dict, None] = None,
+                 max_responses: int = 1000):
+        self.report_dir = report_dir
+        self.check_interval = check_interval
+        self.database = database
+        self.max_responses = max_responses
+
+        self.lock = Lock()
+        self.conn = None
+        self.checked = 0
+        self.version = None
+        self.generation = 0
+        self.model = dict()
+        self.html = ''
+        self.responses = dict()
+
+    def latest_pipeline(self) -> Union[int, None]:
+        """ Return the id of the last pipeline inserted by the worker """
+
+        if not self.database:
+            return None
+        try:
+            if self.conn is None or not self.conn.is_connected():
+                import mysql.connector
+                self.conn = mysql.connector.connect(**self.database)
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT MAX(id) FROM mcb_pipeline')
+            latest = cursor.fetchone()[0]
+            cursor.close()
+            self.conn.commit()
+            return latest
+        except Exception as e:
+            logging.warning(f'Unable to retrieve the last pipeline : {e}')
+            self.conn = None
+            return self.version[0] if self.version else None
+
+    def refresh(self) -> None:
+        """ Reload the outputs and clear the responses if a new version is available """
+
+        with self.lock:
+            if time() - self.checked < self.check_interval:
+                return
+            self.checked = time()
+
+            model_file = path.join(self.report_dir, 'output.json')
+            html_file = path.join(self.report_dir, 'output.html')
+            version = (
+                self.latest_pipeline(),
+                path.getmtime(model_file) if path.isfile(model_file) else None,
+                path.getmtime(html_file) if path.isfile(html_file) else None
+            )
+            if version == self.version:
+                return
+
+            model, html = dict(), ''
+            try:
+                if version[1]:
+                    with open(model_file) as f:
+                        model = json.load(f)
+                if version[2]:
+                    with open(html_file) as f:
+                        html = f.read()
+            except (OSError, ValueError) as e:
+                # Keep serving the last good snapshot, the new version is loaded by the next check
+                logging.warning(f'Unable to load the report version {version}, keeping version {self.version} : {e}')
+                return
+
+            logging.info(f'New report version {version}, clearing {len(self.responses)} cached responses')
+            self.model, self.html = model, html
+            self.responses = dict()
+            self.version = version
+            self.generation += 1
+
+    def response(self, key: Union[str, tuple], build: Callable) -> Union[dict, None]:
+        """ Return the cached response of key, built on the first request
+            from the model and the HTML of the current generation """
+
+        with self.lock:
+            response = self.responses.get(key)
+            generation, model, html = self.generation, self.model, self.html
+        if response is None:
+            result = build(model, html)
+            if result is None:
+                return None
+            content_type, body = result
+            body = body.encode('utf-8')
+            response = {
+                'content_type': content_type,
+                'body': body,
+                'gzip': gzip.compress(body),
+                'etag': '"{}"'.format(md5(body).hexdigest())
+            }
+            with self.lock:
+                # A refresh happened during the build, the response is stale
+                if generation == self.generation:
+                    if len(self.responses) >= self.max_responses:
+                        self.responses = dict()
+                    self.responses[key] = response
+        return response
+
+
+def route(url: str) -> Union[tuple, None]:
+    """ Return the cache key of url and the function building its response
+        from the model and the HTML report
+
+        The key is the path without trailing slash and the parameters of the
+        route in their canonical form, so that equivalent URLs share the same
+        cached response """
+
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    route_path = unquote(parsed.path).rstrip('/') or '/'
+
+    def as_json(data) -> tuple:
+        return 'application/json', json.dumps(data)
+
+    if route_path in ['/', '/report']:
+        return '/', lambda model, html: ('text/html; charset=utf-8', html) if html else None
+
+    if route_path.startswith('/servers/'):
+        server = route_path[len('/servers/'):]
+
+        def server_report(model, html):
+            parts = model.get('parts', {})
+            if server not in parts.get('servers', {}):
+                return None
+            return 'text/html; charset=utf-8', parts['header'] + ''.join(parts['servers'][server]) + parts['footer']
+        return route_path, server_report
+
+    if route_path == '/api/servers':
+        return route_path, lambda model, html: as_json(list(model.get('server_infos', {})))
+
+    if route_path == '/api/stats':
+        return route_path, lambda model, html: as_json({
+            'id_pipeline': model.get('id_pipeline'),
+            'creation_time': model.get('creation_time'),
+            'stats': model.get('stats'),
+            'servers': {server: infos.get('stats') for server, infos in model.get('server_infos', {}).items()}
+        })
+
+    if route_path in ['/api/failed', '/api/in_progress']:
+        section = route_path[len('/api/'):]
+        server = query.get('server', [None])[0]
+        return (route_path, server), lambda model, html: as_json(flatten_sessions(model.get(section, {}), server))
+
+    if route_path == '/api/failure_causes':
+        return route_path, lambda model, html: as_json(model.get('failure_causes', []))
+
+    if route_path == '/api/repositories':
+        try:
+            threshold = int(query.get('threshold', ['8'])[0])
+        except ValueError:
+            return None
+        return (route_path, threshold), lambda model, html: as_json(flatten_repositories(model.get('capacity', {}), threshold))
+
+    return None
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """ Serve the cached responses of the report store with ETag and gzip """
+
+    store = None
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def serve(self, send_body: bool) -> None:
+        self.store.refresh()
+
+        routed = route(self.path)
+        response = self.store.response(*routed) if routed else None
+        if response is None:
+            self.send_error(404)
+            return
+
+        if self.headers.get('If-None-Match') == response['etag']:
+            self.send_response(304)
+            self.send_header('ETag', response['etag'])
+            self.end_headers()
+            return
+
+        body = response['body']
+        self.send_response(200)
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = response['gzip']
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', response['content_type'])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', response['etag'])
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+if __name__ == '__main__':
+    # Define logger format
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s : %(lineno)d : %(levelname)s : %(module)s : %(funcName)s : %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    REPORT_DIR = getenv('REPORT_DIR', 'artifacts')
+    REPORT_HOST = getenv('REPORT_HOST', '127.0.0.1')
+    REPORT_PORT = int(getenv('REPORT_PORT', '8080'))
+    REPORT_CHECK_INTERVAL = float(getenv('REPORT_CHECK_INTERVAL', '10'))
+
+    # The pipelines are only watched when the MySQL database is defined
+    database = None
+    if getenv('DATABASE_ADDRESS'):
+        database = {
+            'host': getenv('DATABASE_ADDRESS'),
+            'port': getenv('DATABASE_PORT'),
+            'database': getenv('DATABASE_NAME'),
+            'user': getenv('DATABASE_USERNAME'),
+            'password': getenv('DATABASE_PASSWORD')
+        }
+
+    logging.info('Script start : %s' % __file__)
+    logging.info('Parameters : %s' % (', '.join(argv[1:]) or 'None'))
+    logging.info(f'Serving {REPORT_DIR} on http://{REPORT_HOST}:{REPORT_PORT}')
+
+    ReportHandler.store = ReportStore(REPORT_DIR, REPORT_CHECK_INTERVAL, database)
+    server = ThreadingHTTPServer((REPORT_HOST, REPORT_PORT), ReportHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+    logging.info('Script end')
@@ -0,0 +1,4 @@
+DELETE
+FROM mcb_failure_state
+WHERE id_pipeline = %s
+  AND server_name = %s;
@@ -0,0 +1,3 @@
+DELETE FROM mcb_upsert_in_progress
+WHERE session_id = %s
+  AND object_id = %s;
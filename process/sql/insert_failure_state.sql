@@ -0,0 +1,2 @@
+INSERT INTO mcb_failure_state (kind, key_hash, server_name, job_name, object_name, first_seen, last_seen, id_pipeline)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
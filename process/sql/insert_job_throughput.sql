@@ -0,0 +1,3 @@
+insert into mcb_job_throughput (id_info, server_name, job_name, start_date, end_date, duration, sessions, processed,
+                                transferred, throughput)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
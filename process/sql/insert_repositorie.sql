@@ -1,3 +1,3 @@
 insert into mcb_repositorie (id_info, id_repo, name, extent, description, type, path, status, host_name, host_ip,
-                             scale_out_name, free, total, used)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
\ No newline at end of file
+                             scale_out_name, free, total, used, server_name)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
\ No newline at end of file
@@ -0,0 +1,3 @@
+insert into mcb_tape_pool (id_info, server_name, mediapool_name, cartridges, scratch, expiring, vault, offline, capacity,
+                           remaining)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
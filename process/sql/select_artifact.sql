@@ -0,0 +1,3 @@
+SELECT content_hash, id_info
+FROM mcb_artifact
+WHERE server_name = %s;
@@ -0,0 +1,9 @@
+SELECT mcb_failure_state.kind, mcb_failure_state.key_hash, mcb_failure_state.server_name, mcb_failure_state.job_name,
+       mcb_failure_state.object_name, mcb_failure_state.first_seen
+FROM mcb_failure_state
+         INNER JOIN (SELECT server_name, MAX(id_pipeline) AS id_pipeline
+                     FROM mcb_info
+                     WHERE id_pipeline < %s
+                     GROUP BY server_name) AS previous
+                    ON previous.server_name = mcb_failure_state.server_name
+                        AND previous.id_pipeline = mcb_failure_state.id_pipeline;
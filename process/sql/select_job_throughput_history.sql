@@ -0,0 +1,8 @@
+SELECT mcb_job_throughput.server_name, mcb_job_throughput.job_name, AVG(mcb_job_throughput.throughput)
+FROM mcb_job_throughput
+         INNER JOIN mcb_info ON mcb_info.id = mcb_job_throughput.id_info
+         INNER JOIN mcb_pipeline ON mcb_pipeline.id = mcb_info.id_pipeline
+WHERE mcb_pipeline.creation_time >= %s
+  AND mcb_pipeline.id != %s
+  AND mcb_job_throughput.throughput > 0
+GROUP BY mcb_job_throughput.server_name, mcb_job_throughput.job_name;
@@ -0,0 +1,8 @@
+SELECT mcb_repositorie.server_name, mcb_repositorie.name, mcb_repositorie.extent, mcb_repositorie.scale_out_name,
+       mcb_repositorie.id_info, mcb_pipeline.creation_time, mcb_repositorie.free
+FROM mcb_repositorie
+         INNER JOIN mcb_info ON mcb_info.id = mcb_repositorie.id_info
+         INNER JOIN mcb_pipeline ON mcb_pipeline.id = mcb_info.id_pipeline
+WHERE mcb_pipeline.creation_time >= %s
+  AND mcb_repositorie.server_name IS NOT NULL
+ORDER BY mcb_pipeline.creation_time;
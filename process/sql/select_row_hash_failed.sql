@@ -0,0 +1,3 @@
+SELECT session_id, object_id, row_hash
+FROM mcb_upsert_failed
+WHERE session_id IN ({0});
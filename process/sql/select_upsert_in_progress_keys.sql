@@ -0,0 +1,3 @@
+SELECT session_id, object_id
+FROM mcb_upsert_in_progress
+WHERE server_name = %s;
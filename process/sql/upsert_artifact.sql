@@ -0,0 +1,4 @@
+INSERT INTO mcb_artifact (server_name, content_hash, id_info, update_time)
+VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash), id_info = VALUES(id_info),
+                        update_time = VALUES(update_time);
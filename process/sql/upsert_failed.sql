@@ -0,0 +1,14 @@
+INSERT INTO mcb_upsert_failed (id_info, start_date, end_date, session_id, orig_session_id, backup_status,
+                               backup_status_details, last_point_success, object_id, job_name, job_id, type,
+                               reason, object_name, backup_transport_mode, target_storage, proxies,
+                               nb_restore_points, retaindays, retaincycles, retention_maintenance, server_name,
+                               row_hash)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE id_info = VALUES(id_info), start_date = VALUES(start_date), end_date = VALUES(end_date),
+                        backup_status = VALUES(backup_status), backup_status_details = VALUES(backup_status_details),
+                        last_point_success = VALUES(last_point_success), reason = VALUES(reason),
+                        backup_transport_mode = VALUES(backup_transport_mode), target_storage = VALUES(target_storage),
+                        proxies = VALUES(proxies), nb_restore_points = VALUES(nb_restore_points),
+                        retaindays = VALUES(retaindays), retaincycles = VALUES(retaincycles),
+                        retention_maintenance = VALUES(retention_maintenance), server_name = VALUES(server_name),
+                        row_hash = VALUES(row_hash);
@@ -0,0 +1,16 @@
+INSERT INTO mcb_info (id_pipeline, server_name, backup_sessions, backup_total, backup_success, backup_warning,
+                      backup_failed, backup_running, backup_pending, backup_idle, backup_undefined, backup_in_progress,
+                      tape_sessions, tape_success, tape_warning, tape_failed, tape_running, tape_pending, tape_idle,
+                      tape_undefined, tape_in_progress, repositories)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), server_name = VALUES(server_name),
+                        backup_sessions = VALUES(backup_sessions), backup_total = VALUES(backup_total),
+                        backup_success = VALUES(backup_success), backup_warning = VALUES(backup_warning),
+                        backup_failed = VALUES(backup_failed), backup_running = VALUES(backup_running),
+                        backup_pending = VALUES(backup_pending), backup_idle = VALUES(backup_idle),
+                        backup_undefined = VALUES(backup_undefined), backup_in_progress = VALUES(backup_in_progress),
+                        tape_sessions = VALUES(tape_sessions), tape_success = VALUES(tape_success),
+                        tape_warning = VALUES(tape_warning), tape_failed = VALUES(tape_failed),
+                        tape_running = VALUES(tape_running), tape_pending = VALUES(tape_pending),
+                        tape_idle = VALUES(tape_idle), tape_undefined = VALUES(tape_undefined),
+                        tape_in_progress = VALUES(tape_in_progress), repositories = VALUES(repositories);
@@ -0,0 +1,3 @@
+INSERT INTO mcb_pipeline (id_pipeline_gitlab, creation_time, comment)
+VALUES (%s, %s, %s)
+ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), comment = VALUES(comment)
@@ -0,0 +1,4 @@
+insert into mcb_repositorie (id_info, id_repo, name, extent, description, type, path, status, host_name, host_ip,
+                             scale_out_name, free, total, used, server_name)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE status = VALUES(status), free = VALUES(free), total = VALUES(total), used = VALUES(used);
@@ -0,0 +1,6 @@
+INSERT INTO mcb_tape (id_info, start_date, end_date, backup_status, backup_status_details, job_name, job_id, reason,
+                     mediapool_name)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE end_date = VALUES(end_date), backup_status = VALUES(backup_status),
+                        backup_status_details = VALUES(backup_status_details), reason = VALUES(reason),
+                        mediapool_name = VALUES(mediapool_name);
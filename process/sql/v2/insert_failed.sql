@@ -0,0 +1,4 @@
+INSERT INTO mcb2_failed (id_info, id_job, id_object, id_repository, start_date, end_date, session_id, orig_session_id,
+                         backup_status, last_point_success, reason, backup_transport_mode, proxies, nb_restore_points,
+                         retaindays, retaincycles, retention_maintenance)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
@@ -0,0 +1,3 @@
+INSERT INTO mcb2_repositorie (id_info, id_repository, extent, scale_out_name, description, type, path, status,
+                              host_name, host_ip, free, total, used)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
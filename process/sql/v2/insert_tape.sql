@@ -0,0 +1,2 @@
+INSERT INTO mcb2_tape (id_info, id_job, start_date, end_date, backup_status, reason, mediapool_name)
+VALUES (%s, %s, %s, %s, %s, %s, %s);
@@ -0,0 +1,9 @@
+SELECT mcb2_server.name, mcb2_repository.name, mcb2_repositorie.extent, mcb2_repositorie.scale_out_name,
+       mcb2_repositorie.id_info, mcb_pipeline.creation_time, mcb2_repositorie.free
+FROM mcb2_repositorie
+         INNER JOIN mcb2_repository ON mcb2_repository.id = mcb2_repositorie.id_repository
+         INNER JOIN mcb2_server ON mcb2_server.id = mcb2_repository.id_server
+         INNER JOIN mcb_info ON mcb_info.id = mcb2_repositorie.id_info
+         INNER JOIN mcb_pipeline ON mcb_pipeline.id = mcb_info.id_pipeline
+WHERE mcb_pipeline.creation_time >= %s
+ORDER BY mcb_pipeline.creation_time;
@@ -0,0 +1,10 @@
+SELECT mcb_failed.id, NULL AS server_name, mcb_failed.job_id, mcb_failed.job_name,
+       mcb_failed.id_info, mcb_failed.start_date, mcb_failed.end_date, mcb_failed.session_id, mcb_failed.orig_session_id,
+       mcb_failed.backup_status, mcb_failed.backup_status_details, mcb_failed.last_point_success, mcb_failed.object_id,
+       mcb_failed.job_name, mcb_failed.job_id, mcb_failed.type, mcb_failed.reason, mcb_failed.object_name,
+       mcb_failed.backup_transport_mode, mcb_failed.target_storage, mcb_failed.proxies, mcb_failed.nb_restore_points,
+       mcb_failed.retaindays, mcb_failed.retaincycles, mcb_failed.retention_maintenance
+FROM mcb_failed
+WHERE mcb_failed.id > %s
+ORDER BY mcb_failed.id
+LIMIT %s;
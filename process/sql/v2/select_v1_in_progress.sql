@@ -0,0 +1,11 @@
+SELECT mcb_in_progress.id, NULL AS server_name, mcb_in_progress.job_id, mcb_in_progress.job_name,
+       mcb_in_progress.id_info, mcb_in_progress.start_date, mcb_in_progress.session_id, mcb_in_progress.orig_session_id,
+       mcb_in_progress.backup_status, mcb_in_progress.backup_status_details, mcb_in_progress.last_point_success,
+       mcb_in_progress.object_id, mcb_in_progress.job_name, mcb_in_progress.job_id, mcb_in_progress.type,
+       mcb_in_progress.object_name, mcb_in_progress.backup_transport_mode, mcb_in_progress.target_storage,
+       mcb_in_progress.proxies, mcb_in_progress.nb_restore_points, mcb_in_progress.retaindays,
+       mcb_in_progress.retaincycles, mcb_in_progress.retention_maintenance
+FROM mcb_in_progress
+WHERE mcb_in_progress.id > %s
+ORDER BY mcb_in_progress.id
+LIMIT %s;
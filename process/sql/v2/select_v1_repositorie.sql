@@ -0,0 +1,9 @@
+SELECT mcb_repositorie.id, mcb_repositorie.server_name, mcb_repositorie.id_repo,
+       mcb_repositorie.id_info, mcb_repositorie.id_repo, mcb_repositorie.name, mcb_repositorie.extent,
+       mcb_repositorie.description, mcb_repositorie.type, mcb_repositorie.path, mcb_repositorie.status,
+       mcb_repositorie.host_name, mcb_repositorie.host_ip, mcb_repositorie.scale_out_name, mcb_repositorie.free,
+       mcb_repositorie.total, mcb_repositorie.used
+FROM mcb_repositorie
+WHERE mcb_repositorie.id > %s
+ORDER BY mcb_repositorie.id
+LIMIT %s;
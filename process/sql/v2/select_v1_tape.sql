@@ -0,0 +1,7 @@
+SELECT mcb_tape.id, NULL AS server_name, mcb_tape.mediapool_name, mcb_tape.job_name,
+       mcb_tape.id_info, mcb_tape.start_date, mcb_tape.end_date, mcb_tape.backup_status, mcb_tape.backup_status_details,
+       mcb_tape.job_name, mcb_tape.job_id, mcb_tape.reason, mcb_tape.mediapool_name
+FROM mcb_tape
+WHERE mcb_tape.id > %s
+ORDER BY mcb_tape.id
+LIMIT %s;
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from datetime import datetime, timedelta
+from os import path
+
+import pytest
+
+from changes import index_failures, track_failures
+
+SQL_DIR = path.join(path.dirname(path.realpath(__file__)), 'sql')
+DAY = datetime(2024, 3, 1, 7, 0)
+
+sqlite3.register_adapter(datetime, datetime.isoformat)
+sqlite3.register_converter('datetime', lambda value: datetime.fromisoformat(value.decode('utf-8')))
+
+
+def read_sql(name: str) -> str:
+    """ The queries of the worker with the placeholders of sqlite """
+
+    with open(path.join(SQL_DIR, name)) as f:
+        return f.read().replace('%s', '?')
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.executescript("""
+        create table mcb_info (id_pipeline integer not null, server_name text not null);
+        create table mcb_failure_state
+        (
+            id_pipeline integer not null, kind text not null, key_hash blob not null, server_name text not null,
+            job_name text not null, object_name text not null, first_seen datetime not null, last_seen datetime not null,
+            primary key (id_pipeline, kind, key_hash)
+        );
+    """)
+    yield conn
+    conn.close()
+
+
+def run(db, id_pipeline: int, failed: dict, day: int = 0) -> dict:
+    """ Track the failed sessions of a run of the worker, by server and job """
+
+    db.executemany('INSERT INTO mcb_info (id_pipeline, server_name) VALUES (?, ?)', [
+        (id_pipeline, server) for server in failed
+        if not db.execute('SELECT 1 FROM mcb_info WHERE id_pipeline = ? AND server_name = ?', (id_pipeline, server)).fetchone()
+    ])
+    sessions = {
+        server: {job: {vm: {'job_id': job, 'object_id': vm} for vm in vms} for job, vms in jobs.items()}
+        for server, jobs in failed.items()
+    }
+    changes = track_failures(db.cursor(), read_sql('select_failure_state.sql'), read_sql('delete_failure_state.sql'),
+                             read_sql('insert_failure_state.sql'), index_failures(sessions, 'failed'), list(failed), id_pipeline,
+                             DAY + timedelta(days=day))
+    db.commit()
+    return {status: sorted((session['server'], session['vm'], session.get('days')) for session in sessions)
+            for status, sessions in changes.items()}
+
+
+def test_changes_since_previous_run(db):
+    run(db, 1, {'VBR1': {'Job A': ['VM1', 'VM2']}})
+    changes = run(db, 2, {'VBR1': {'Job A': ['VM1', 'VM3']}}, day=1)
+
+    assert changes == {
+        'new': [('VBR1', 'VM3', 0)],
+        'persistent': [('VBR1', 'VM1', 1)],
+        'resolved': [('VBR1', 'VM2', None)]
+    }
+
+
+def test_rerun_of_same_pipeline(db):
+    run(db, 1, {'VBR1': {'Job A': ['VM1', 'VM2']}})
+    first = run(db, 2, {'VBR1': {'Job A': ['VM1', 'VM3']}}, day=1)
+    # The state of the first run of the pipeline is replaced, not compared
+    rerun = run(db, 2, {'VBR1': {'Job A': ['VM1', 'VM3']}}, day=1)
+    assert rerun == first
+
+    changes = run(db, 3, {'VBR1': {'Job A': ['VM1']}}, day=3)
+    assert changes == {'new': [], 'persistent': [('VBR1', 'VM1', 3)], 'resolved': [('VBR1', 'VM3', None)]}
+
+
+def test_previous_run_without_failures(db):
+    run(db, 1, {'VBR1': {'Job A': ['VM1']}})
+    run(db, 2, {'VBR1': {}}, day=1)
+    changes = run(db, 3, {'VBR1': {'Job A': ['VM1']}}, day=2)
+
+    # VM1 failed again after a run without failures, it is new
+    assert changes == {'new': [('VBR1', 'VM1', 0)], 'persistent': [], 'resolved': []}
+
+
+def test_server_missing_from_run(db):
+    run(db, 1, {'VBR1': {'Job A': ['VM1']}, 'VBR2': {'Job B': ['VM2']}})
+    run(db, 2, {'VBR1': {'Job A': ['VM1']}}, day=1)
+    changes = run(db, 3, {'VBR1': {'Job A': ['VM1']}, 'VBR2': {'Job B': ['VM2']}}, day=2)
+
+    # VBR2 is compared to its last run, its failure is not resolved by its missing artifact
+    assert changes == {'new': [], 'persistent': [('VBR1', 'VM1', 2), ('VBR2', 'VM2', 2)], 'resolved': []}
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Union
+
+import numpy as np
+
+
+def iso(time: np.datetime64) -> str:
+    """ Format a numpy datetime like the dates of the artifacts """
+
+    return str(time) + 'Z'
+
+
+def job_throughput(rows: list, now: datetime) -> tuple:
+    """ Compute the throughput of the jobs of a server from its sessions
+
+        rows are the [job, vm, start, end, processed, read, transferred]
+        sessions of the artifact, the sessions without end are running until
+        now. All the sessions are computed at once, then reduced by job.
+        Return the jobs and the backup window of the server, the critical
+        job being the one ending the window """
+
+    if not rows:
+        return dict(), dict()
+
+    jobs, job_index = np.unique([row[0] or '' for row in rows], return_inverse=True)
+    now = now.strftime('%Y-%m-%dT%H:%M:%S')
+    start = np.array([row[2][:19] for row in rows], dtype='datetime64[s]').astype(np.int64)
+    end = np.array([(row[3] or now)[:19] for row in rows], dtype='datetime64[s]').astype(np.int64)
+    end = np.maximum(end, start)
+    processed = np.array([row[4] or 0 for row in rows], dtype=float)
+    transferred = np.array([row[6] or 0 for row in rows], dtype=float)
+    duration = (end - start).astype(float)
+    vm_throughput = np.divide(processed, duration, out=np.zeros_like(processed), where=duration > 0)
+
+    job_start = np.full(len(jobs), np.iinfo(np.int64).max)
+    job_end = np.full(len(jobs), np.iinfo(np.int64).min)
+    np.minimum.at(job_start, job_index, start)
+    np.maximum.at(job_end, job_index, end)
+    job_duration = (job_end - job_start).astype(float)
+    job_processed = np.bincount(job_index, processed, len(jobs))
+    job_transferred = np.bincount(job_index, transferred, len(jobs))
+    job_sessions = np.bincount(job_index, minlength=len(jobs))
+    throughput = np.divide(job_processed, job_duration, out=np.zeros_like(job_processed), where=job_duration > 0)
+
+    # Slowest session of each job which processed data : first of its job by increasing throughput
+    measured = np.flatnonzero((duration > 0) & (processed > 0))
+    order = measured[np.lexsort((vm_throughput[measured], job_index[measured]))]
+    first = order[np.r_[True, job_index[order][1:] != job_index[order][:-1]]] if len(order) else order
+    slowest = {job_index[i]: i for i in first}
+
+    starts, ends = job_start.astype('datetime64[s]'), job_end.astype('datetime64[s]')
+    result = dict()
+    for i, job in enumerate(jobs):
+        result[str(job)] = {
+            'start': iso(starts[i]),
+            'end': iso(ends[i]),
+            'duration': job_duration[i],
+            'sessions': int(job_sessions[i]),
+            'processed': job_processed[i],
+            'transferred': job_transferred[i],
+            'throughput': throughput[i],
+            'slowest_vm': rows[slowest[i]][1] if i in slowest else None,
+            'slowest_vm_throughput': vm_throughput[slowest[i]] if i in slowest else None
+        }
+
+    window = {
+        'start': iso(starts.min()),
+        'end': iso(ends.max()),
+        'duration': float(job_end.max() - job_start.min()),
+        'critical_job': str(jobs[np.argmax(job_end)])
+    }
+    return result, window
+
+
+def throughput_trend(throughput: float, history: Union[float, None]) -> Union[float, None]:
+    """ Return the change in percent of the throughput compared to its history """
+
+    if not history:
+        return None
+    return round((throughput - history) * 100 / history, 1)
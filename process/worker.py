@@ -1,34 +1,32 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import json
-from os import getenv, path, walk
-from sys import exit, argv
+from os import getenv, path, walk, listdir, makedirs, remove, replace
+from sys import exit, argv, path as sys_path
 import logging
-from datetime import datetime, timezone
+import re
+from datetime import datetime, timezone, timedelta
 from json import load as json_load
 from hashlib import md5
-from typing import Union
-import mysql.connector
+from typing import Union, TYPE_CHECKING
 from uuid import UUID
 
-import sentry_sdk
+from failures import reason_cause, cluster_failures, filter_causes
+from changes import index_failures, track_failures, filter_changes
 
-import hvac
+# The heavy subsystems are imported by main() when they are used
+if TYPE_CHECKING:
+    from jinja2 import Environment
 
-from influxdb import InfluxDBClient
-
-from jinja2 import Environment, FileSystemLoader
-
-from smtplib import SMTP
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
+# Modules shared between the crawler and the worker, imported when needed
+sys_path.append(path.join(path.dirname(path.realpath(__file__)), '..'))
 
 
 def before_send(event: Union[dict, None], hint: Union[dict, None]) -> dict:
     """ Sentry - Generate a new fingerprint only based on event message """
-    msg = event.get('logentry').get('message')
-    if msg is not None:
+    msg = (event.get('logentry') or {}).get('message')
+    # The events of the aggregated errors have their own fingerprint
+    if msg is not None and not event.get('fingerprint'):
         event['fingerprint'] = [md5(msg.encode('utf-8')).hexdigest()]
     return event
 
@@ -115,6 +113,14 @@ def error_text(error: Union[str, None]) -> str:
         return error
 
 
+def error_summary(error: Union[str, None]) -> str:
+    """ Return the first sentence of an error message truncated to 80 characters """
+
+    if error is None:
+        return ''
+    return error.replace('\n', ' ').split('. ')[0][:80]
+
+
 def sizeof_fmt(num: int, suffix: str = 'B') -> str:
     """ Format bytes as human readable with auto suffix """
 
@@ -170,6 +176,21 @@ def repo_free_color(free: int) -> str:
         return ''
 
 
+def repository_capacity(repository: str, extent: Union[str, None], repo: dict) -> dict:
+    """ Return the free space of a repository or scale-out extent, before its formatting """
+
+    return {
+        'repository': repository,
+        'extent': extent,
+        'host_name': repo.get('host_name'),
+        'path': repo.get('path'),
+        'free': repo.get('free'),
+        'used': repo.get('used'),
+        'total': repo.get('total'),
+        'free_percent': int(repo.get('free') * 100 / repo.get('total')) if repo.get('total') else 100
+    }
+
+
 def percent_mail(nb_sessions_calculated):
     if nb_sessions_calculated == 0:
         output = 0
@@ -185,6 +206,399 @@ def datetime_fmt_to_mysql(date):
     return result
 
 
+def read_artifact(file: str) -> tuple:
+    """ Read a crawler artifact once, return the hash of its content and its data """
+
+    with open(file, 'rb') as f:
+        content = f.read()
+    return md5(content).hexdigest(), json.loads(content)
+
+
+def row_hash(row: tuple) -> str:
+    """ Hash a database row without its id_info to detect
+        changes between two ingestions """
+
+    return md5(json.dumps(row[1:], default=str).encode('utf-8')).hexdigest()
+
+
+def upsert_sessions(cursor, sql_select: str, sql_upsert: str, rows: dict, chunk_size: int = 1000) -> list:
+    """ Upsert session rows keyed by (session_id, object_id)
+        Only the rows whose hash differs from the stored one are written
+        Return the keys of the written rows """
+
+    keys = list(rows)
+    changed = []
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i + chunk_size]
+        session_ids = list(dict.fromkeys(key[0] for key in chunk))
+
+        # Retrieve the stored hashes in one query per chunk
+        cursor.execute(sql_select.format(', '.join(['%s'] * len(session_ids))), session_ids)
+        stored = {(session_id, object_id): stored_hash for session_id, object_id, stored_hash in cursor.fetchall()}
+
+        values = []
+        for key in chunk:
+            current_hash = row_hash(rows[key])
+            if stored.get(key) != current_hash:
+                values.append(rows[key] + (current_hash,))
+                changed.append(key)
+        if values:
+            cursor.executemany(sql_upsert, values)
+
+    return changed
+
+
+# Format of the artifact cache entries, part of the cache version
+ARTIFACT_CACHE_FORMAT = 2
+
+
+def cache_version(script_dir: str) -> str:
+    """ Hash the format of the cache entries with the code and the templates
+        producing them, so that a deploy invalidates the cache """
+
+    version = md5(str(ARTIFACT_CACHE_FORMAT).encode('utf-8'))
+    files = [path.join(script_dir, file) for file in sorted(listdir(script_dir)) if file.endswith('.py')]
+    files += [path.join(script_dir, 'jinja', file) for file in sorted(listdir(path.join(script_dir, 'jinja')))]
+    for file in files:
+        with open(file, 'rb') as f:
+            version.update(f.read())
+    return version.hexdigest()
+
+
+def load_artifact_cache(cache_dir: Union[str, None], version: str) -> dict:
+    """ Load the cached report fragments indexed by artifact content hash
+        The entries of another version are ignored """
+
+    cache = dict()
+    if not cache_dir or not path.isdir(cache_dir):
+        return cache
+
+    for file in listdir(cache_dir):
+        if file.lower().endswith('.json'):
+            try:
+                with open(path.join(cache_dir, file)) as f:
+                    entry = json_load(f)
+                if entry.get('version') == version:
+                    cache[entry['content_hash']] = entry
+            except Exception as e:
+                logging.warning(f'Unable to load cache file {file} : {e}')
+    return cache
+
+
+def write_atomic(file: str, content: str) -> None:
+    """ Write a file through a temporary file in the same directory, so
+        that a reader never sees it half-written """
+
+    with open(file + '.tmp', 'w') as f:
+        f.write(content)
+    replace(file + '.tmp', file)
+
+
+def save_artifact_cache(cache_dir: str, entry: dict) -> None:
+    """ Store the report fragment of a server in the cache directory """
+
+    makedirs(cache_dir, exist_ok=True)
+    with open(path.join(cache_dir, entry['SERVER_NAME'] + '.json'), 'w+') as f:
+        f.write(json.dumps(entry, cls=CustomJSONEncoder))
+
+
+def refresh_fragment(entry: dict, now: datetime) -> None:
+    """ Update the time dependent fields of a cached report fragment """
+
+    elapsed = (now - datetime.strptime(entry['created'], '%Y-%m-%dT%H:%M:%S')).total_seconds()
+
+    for section in ['in_progress', 'failed', 'compliance']:
+        for job in entry.get(section) or {}:
+            for vm in entry[section][job]:
+                session = entry[section][job][vm]
+                if session.get('lps_duration') is not None:
+                    session['lps_duration'] += elapsed
+                session['lps_color'] = lps_duration_color(session.get('lps_duration'))
+
+    # In progress sessions are still running, their duration is relative to now
+    for job in entry.get('in_progress') or {}:
+        for vm in entry['in_progress'][job]:
+            session = entry['in_progress'][job][vm]
+            start_date = session['start_date'].replace(' ', 'T') + 'Z'
+            session['duration_color'] = 'bg-error' if duration_in_seconds(start_date, None) >= 20 * 3600 else ''
+            session['duration'] = duration(start_date, None)
+
+    entry['created'] = now.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def render_fragment(env: 'Environment', template_name: str, context: dict, cache: dict, cache_dir: Union[str, None] = None,
+                    version: str = '') -> str:
+    """ Render a report fragment, cached under the hash of the cache version,
+        its template and view-model """
+
+    key = md5((version + template_name + json.dumps(context, cls=CustomJSONEncoder)).encode('utf-8')).hexdigest()
+    if key in cache:
+        return cache[key]
+
+    cache_file = path.join(cache_dir, key + '.html') if cache_dir else None
+    if cache_file and path.isfile(cache_file):
+        with open(cache_file) as f:
+            cache[key] = f.read()
+    else:
+        cache[key] = env.get_template(template_name).render(**context)
+        if cache_file:
+            makedirs(cache_dir, exist_ok=True)
+            with open(cache_file, 'w+') as f:
+                f.write(cache[key])
+    return cache[key]
+
+
+def prune_fragment_cache(cache: dict, cache_dir: Union[str, None]) -> None:
+    """ Remove the cached fragments not used during this run """
+
+    if not cache_dir or not path.isdir(cache_dir):
+        return
+    for file in listdir(cache_dir):
+        if file.endswith('.html') and file[:-len('.html')] not in cache:
+            remove(path.join(cache_dir, file))
+
+
+def jobs_by_type(sessions: dict) -> dict:
+    """ Return the jobs and the number of sessions of a server by job type,
+        Backup first then Replica and Backup Copy """
+
+    types = dict()
+    for job in sessions:
+        job_type = next(iter(sessions[job].values()), {}).get('type') or 'Backup'
+        jobs_type = types.setdefault(job_type, {'jobs': [], 'sessions': 0})
+        jobs_type['jobs'].append(job)
+        jobs_type['sessions'] += len(sessions[job])
+    order = ['Backup', 'Replica', 'Backup Copy']
+    return {job_type: types[job_type] for job_type in sorted(types, key=lambda t: (order.index(t) if t in order else len(order), t))}
+
+
+def render_report(env: 'Environment', cache: dict, servers: list, today: str, stats: dict, tapes: dict,
+                  in_progress: dict, failed: dict, repositories: dict, server_infos: dict,
+                  cache_dir: Union[str, None] = None, parts: Union[dict, None] = None,
+                  causes: Union[list, None] = None, compliance: Union[dict, None] = None,
+                  unprotected: Union[dict, None] = None, loads: Union[dict, None] = None,
+                  throughputs: Union[dict, None] = None, changes: Union[dict, None] = None,
+                  changes_max_rows: int = 50, missed: Union[dict, None] = None,
+                  tape_media: Union[dict, None] = None, version: str = '') -> str:
+    """ Assemble the HTML report of the given servers from
+        their per-server and per-section fragments
+        The rendered parts are stored in parts when given """
+
+    if parts is None:
+        parts = dict()
+    parts['header'] = env.get_template('header.j2').render(today=today)
+    parts['footer'] = env.get_template('footer.j2').render()
+    parts['servers'] = {server: [] for server in servers}
+
+    html = parts['header']
+    html += env.get_template('infos.j2').render(stats=stats)
+    if changes:
+        html += env.get_template('changes.j2').render(changes=filter_changes(changes, servers), changes_max_rows=changes_max_rows)
+
+    for template_name, section, sessions in [('sessions_tapes', 'tapes', tapes),
+                                             ('tape_pools', 'tape_media', tape_media or {}),
+                                             ('sessions_in_progress', 'in_progress', in_progress),
+                                             ('sessions_failed', 'failed', failed),
+                                             ('repositories', 'repositories', repositories),
+                                             ('compliance', 'compliance', compliance or {}),
+                                             ('unprotected', 'unprotected', unprotected or {}),
+                                             ('missed', 'missed', missed or {}),
+                                             ('load', 'load', loads or {}),
+                                             ('throughput', 'throughput', throughputs or {})]:
+        fragments = []
+        for server in sessions:
+            if server not in servers:
+                continue
+            context = {
+                'server': server,
+                section: {server: sessions[server]},
+                'server_infos': {server: server_infos.get(server)}
+            }
+            # Backup, Replica and Backup Copy sessions are in separate tables
+            if section in ['in_progress', 'failed']:
+                context['job_types'] = jobs_by_type(sessions[server])
+            fragments.append(render_fragment(env, f'{template_name}_server.j2', context, cache, cache_dir, version))
+            parts['servers'][server].append(fragments[-1])
+        html += env.get_template(f'{template_name}.j2').render(stats=stats, fragments=fragments, causes=causes or [])
+
+    html += parts['footer']
+    return html
+
+
+def load_server_groups(file: Union[str, None]) -> dict:
+    """ Read the server groups from a JSON file
+        Example : {"sante": {"servers": ["^VBR-SANTE"], "tags": ["sante"], "recipients": ["sante@example.org"]}} """
+
+    if not file:
+        return dict()
+    with open(file) as f:
+        return json_load(f)
+
+
+def group_servers(groups: dict, server_infos: dict) -> dict:
+    """ Return the servers of each group, matching one of the regex
+        or having one of the tags of the group """
+
+    return {
+        group: [
+            server for server in server_infos
+            if any(re.search(pattern, server, re.IGNORECASE) for pattern in groups[group].get('servers', []))
+            or set(groups[group].get('tags', [])) & set(server_infos[server].get('tags') or [])
+        ]
+        for group in groups
+    }
+
+
+def group_stats(server_infos: dict, servers: list) -> dict:
+    """ Sum the stats of the servers like the global stats """
+
+    stats = {
+        'backup': {key: 0 for key in ['sessions', 'total', 'success', 'warning', 'failed', 'running', 'pending', 'idle', 'undefined', 'in_progress']},
+        'tape': {key: 0 for key in ['sessions', 'success', 'warning', 'failed', 'running', 'pending', 'idle', 'undefined', 'in_progress']},
+        'repositories': 0,
+        'types': dict(),
+        'compliance': {'objects': 0, 'compliant': 0, 'breached': 0},
+        'unprotected': 0,
+        'missed': {'jobs': 0, 'runs': 0, 'expected': 0},
+        'tape_media': {'pools': 0, 'cartridges': 0, 'scratch': 0, 'expiring': 0, 'low': 0}
+    }
+    for server in servers:
+        server_stats = server_infos[server].get('stats') or {}
+        for key in stats['backup']:
+            if key != 'in_progress':
+                stats['backup'][key] += server_stats.get('backup', {}).get(key) or 0
+        stats['backup']['in_progress'] += (server_stats.get('backup', {}).get('running') or 0) + (server_stats.get('backup', {}).get('pending') or 0)
+        for key in stats['tape']:
+            stats['tape'][key] += server_stats.get('tape', {}).get(key) or 0
+        stats['repositories'] += server_stats.get('repositories') or 0
+        for job_type, stats_type in (server_stats.get('types') or {}).items():
+            stats_types = stats['types'].setdefault(job_type, dict())
+            for key in stats_type:
+                stats_types[key] = stats_types.get(key, 0) + stats_type[key]
+        for key in stats['compliance']:
+            stats['compliance'][key] += (server_stats.get('compliance') or {}).get(key) or 0
+        stats['unprotected'] += server_stats.get('unprotected') or 0
+        for key in stats['missed']:
+            stats['missed'][key] += (server_stats.get('missed') or {}).get(key) or 0
+        for key in stats['tape_media']:
+            stats['tape_media'][key] += (server_stats.get('tape_media') or {}).get(key) or 0
+    return stats
+
+
+def summarize_stats(stats: dict) -> None:
+    """ Add the percentages, the emoji and the color of the status to the backup stats """
+
+    total = int(stats['backup']['total']) or 1
+    percent_failed = int(stats['backup']['failed'] * 100 / total)
+
+    stats['backup']['success%'] = percent_mail(stats['backup']['success'] * 100 / total)
+    stats['backup']['failed%'] = percent_mail(stats['backup']['failed'] * 100 / total)
+    stats['backup']['warning%'] = percent_mail(stats['backup']['warning'] * 100 / total)
+    stats['backup']['in_progress%'] = percent_mail(stats['backup']['in_progress'] * 100 / total)
+    # Set emoji and color for global status
+    # Percent of the protected objects within their RPO
+    if stats.get('compliance'):
+        objects = stats['compliance']['objects']
+        stats['compliance']['percent'] = round(stats['compliance']['compliant'] * 100 / objects, 2) if objects else 100
+
+    if percent_failed < 25:
+        stats['backup']['emoji'] = '&#128578;'
+        stats['backup']['color'] = 'bg-success'
+    elif 25 <= percent_failed < 50:
+        stats['backup']['emoji'] = '&#128528;'
+        stats['backup']['color'] = 'bg-warning'
+    else:
+        stats['backup']['emoji'] = '&#128544;'
+        stats['backup']['color'] = 'bg-error'
+
+
+def mail_subject(stats: dict, group: Union[str, None] = None) -> str:
+    """ Build the mail subject from the backup stats """
+
+    return 'Morning check backup' + (f' [{group}]' if group else '') + ' - T:{} | S:{} ({}%) | F:{} ({}%) | W:{} ({}%) | IP:{} ({}%)'.format(
+        stats.get('backup').get('sessions'),
+        stats.get('backup').get('success'),
+        stats['backup']['success%'],
+        stats.get('backup').get('failed'),
+        stats['backup']['failed%'],
+        stats.get('backup').get('warning'),
+        stats['backup']['warning%'],
+        stats.get('backup').get('in_progress'),
+        stats['backup']['in_progress%']
+    )
+
+
+def build_mail(subject: str, sender: str, recipients: list, html: str, compact_html: Union[str, None] = None):
+    """ Build the report mail, the full report as body and attachment
+        or the compact report as body and the full report compressed as attachment """
+
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.mime.application import MIMEApplication
+    import gzip
+
+    # Create message container - the correct MIME type is multipart/alternative.
+    msg = MIMEMultipart('mixed' if compact_html else 'alternative')
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = ','.join(recipients)
+
+    if compact_html:
+        # Add the summary as HTML body and the full report as compressed attachment
+        msg.attach(MIMEText(compact_html, 'html', 'utf-8'))
+        attachment = MIMEApplication(gzip.compress(html.encode('utf-8')), Name='Morning check backup.html.gz')
+        attachment['Content-Disposition'] = 'attachment; filename="Morning check backup.html.gz"'
+    else:
+        # Add HTML body
+        msg.attach(MIMEText(html, 'html', 'utf-8'))
+
+        # Add HTML attachment
+        attachment = MIMEApplication(html, Name='Morning check backup.html')
+        attachment['Content-Disposition'] = 'attachment; filename="Morning check backup.html"'
+    msg.attach(attachment)
+    return msg
+
+
+def render_compact_report(env: 'Environment', today: str, stats: dict, failed: dict, repositories: dict,
+                          server_infos: dict, causes: list, max_rows: int = 50, report_url: Union[str, None] = None,
+                          changes: Union[dict, None] = None) -> str:
+    """ Render the summary of the report sent as mail body when the full
+        report exceeds the mail size budget : the stats, the changes since
+        the last run, the top failure causes, the counts per server, the
+        first max_rows failed sessions and the max_rows fullest repositories """
+
+    failed_rows = []
+    for server in failed:
+        for job in failed[server]:
+            for vm in failed[server][job]:
+                if len(failed_rows) < max_rows:
+                    failed_rows.append({'server': server, 'job': job, 'vm': vm, **failed[server][job][vm]})
+
+    fullest = []
+    for server in repositories:
+        for repo in repositories[server]:
+            if repositories[server][repo].get('id'):
+                extents = {None: repositories[server][repo]}
+            else:
+                extents = repositories[server][repo]
+            for extent in extents:
+                fullest.append({'server': server, 'repository': repo, 'extent': extent, **extents[extent]})
+    fullest = sorted(fullest, key=lambda repository: repository.get('free_percent', 100))[:max_rows]
+
+    return env.get_template('compact.j2').render(
+        today=today,
+        stats=stats,
+        causes=causes,
+        server_infos=server_infos,
+        failed_rows=failed_rows,
+        failed_total=sum(len(failed[server][job]) for server in failed for job in failed[server]),
+        repositories=fullest,
+        report_url=report_url,
+        changes=changes,
+        changes_max_rows=max_rows
+    )
+
+
 # Add capabilities to JSON serialize UUID and datetime objects
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -198,533 +612,1046 @@ class CustomJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-# Define logger format
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s : %(lineno)d : %(levelname)s : %(module)s : %(funcName)s : %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-# Initialize Sentry SDK
-if not getenv('SENTRY_DSN'):
-    logging.error('Environment variable SENTRY_DSN is not defined')
-    exit(1)
-sentry_sdk.init(
-    getenv('SENTRY_DSN'),
-    before_send=before_send,
-    transport_queue_size=10000
-)
-
-# Main
-
-# Global Variables
-begin = datetime.now()
-scriptPath = path.dirname(path.realpath(__file__))
-json_files = []
-CI_PIPELINE_ID = getenv('CI_PIPELINE_ID')
-CI_PIPELINE_CREATED_AT = getenv('CI_PIPELINE_CREATED_AT')
-COMMENT = getenv('COMMENT')
-
-stats = {
-    'backup': {
-        'sessions': 0, 'total': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
-    },
-    'tape': {
-        'sessions': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
-    },
-    'repositories': 0
-}
-
-# Get SQL queries
-sql_insert_pipeline = open(scriptPath + '/sql/insert_pipeline.sql', 'r').read()
-sql_insert_info = open(scriptPath + '/sql/insert_info.sql', 'r').read()
-sql_insert_tape = open(scriptPath + '/sql/insert_tape.sql', 'r').read()
-sql_insert_in_progress = open(scriptPath + '/sql/insert_in_progress.sql', 'r').read()
-sql_insert_failed = open(scriptPath + '/sql/insert_failed.sql', 'r').read()
-sql_insert_repositorie = open(scriptPath + '/sql/insert_repositorie.sql', 'r').read()
-
-server_infos = dict()
-sessions_tape = dict()
-sessions_failed = dict()
-sessions_in_progress = dict()
-repositories = dict()
-
-logging.info('Script start : %s' % __file__)
-logging.info('Parameters : %s' % (', '.join(argv[1:]) or 'None'))
-
-# Retrieve credentials from Vault or read them from env vars
-if getenv('VAULT_ADDR'):
-    for var in ['VAULT_ADDR', 'VAULT_TOKEN', 'VAULT_CREDENTIALS_PATH']:
-        if not getenv(var):
-            raise Exception(f'Required environment variable {var} is not defined')
-
-    vault = hvac.Client(url=getenv('VAULT_ADDR'),
-                        token=getenv('VAULT_TOKEN'))
-    vault_res = vault.is_authenticated()
-    logging.info('Vault auth res  : ' + str(vault_res))
-    read_secret_synapps_result = vault.read(
-        getenv('VAULT_CREDENTIALS_PATH')
+def main() -> None:
+    """ Insert the crawler artifacts in MySQL, render and send the report """
+
+    # Define logger format
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s : %(lineno)d : %(levelname)s : %(module)s : %(funcName)s : %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    # Initialize Sentry SDK
+    if not getenv('SENTRY_DSN'):
+        logging.error('Environment variable SENTRY_DSN is not defined')
+        exit(1)
+    import sentry_sdk
+    sentry_sdk.init(
+        getenv('SENTRY_DSN'),
+        before_send=before_send,
+        transport_queue_size=10000
     )
-    if read_secret_synapps_result['data']['data']:
-        credentials = read_secret_synapps_result['data']['data']
-        DATABASE_ADDRESS = credentials.get('DATABASE_ADDRESS')
-        DATABASE_PORT = credentials.get('DATABASE_PORT')
-        DATABASE_NAME = credentials.get('DATABASE_NAME')
-        DATABASE_USERNAME = credentials.get('DATABASE_USERNAME')
-        DATABASE_PASSWORD = credentials.get('DATABASE_PASSWORD')
+    SENTRY_FLUSH_TIMEOUT = float(getenv('SENTRY_FLUSH_TIMEOUT', '30'))
+
+    # The errors of the ingestion loops are sent as one event by operation and exception type
+    from common.errors import ErrorAggregator
+    errors = ErrorAggregator(samples=int(getenv('SENTRY_ERROR_SAMPLES', '3')))
+
+    # Main
+
+    # Global Variables
+    begin = datetime.now()
+    scriptPath = path.dirname(path.realpath(__file__))
+    json_files = []
+    CI_PIPELINE_ID = getenv('CI_PIPELINE_ID')
+    COMMENT = getenv('COMMENT')
+    INGEST_MODE = getenv('INGEST_MODE', 'insert')
+    # Schema of the sessions and repositories tables, v2 stores the names and GUIDs in dimension tables
+    SCHEMA_VERSION = int(getenv('SCHEMA_VERSION', '1'))
+    ARTIFACT_CACHE_DIR = getenv('ARTIFACT_CACHE_DIR')
+    INFLUXDB_URL = getenv('INFLUXDB_URL', 'http://server.adm.fr.arno.net:8086')
+    INFLUXDB_DATABASE = getenv('INFLUXDB_DATABASE', 'morning_check_backup')
+    METRICS_SPOOL_DIR = getenv('METRICS_SPOOL_DIR')
+    FAILURE_CAUSES_TOP = int(getenv('FAILURE_CAUSES_TOP', '10'))
+    # Busiest proxies and datastores shown for each server
+    LOAD_TOP = int(getenv('LOAD_TOP', '10'))
+    MAIL_MODE = getenv('MAIL_MODE', 'auto')
+    MAIL_SIZE_BUDGET = int(getenv('MAIL_SIZE_BUDGET', '1000000'))
+    MAIL_MAX_ROWS = int(getenv('MAIL_MAX_ROWS', '50'))
+    REPORT_URL = getenv('REPORT_URL')
+    MAIL_RELAY = getenv('MAIL_RELAY', 'smtp-relay-interne.lycee.fr.arno.net')
+    MAIL_PORT = int(getenv('MAIL_PORT', '25'))
+    MAIL_FROM = getenv('MAIL_FROM', 'morning-check-backup@ablondel.lycee')
+    MAIL_TO = getenv('MAIL_TO', 'FR-infra-stockage@ablondel.lycee')
+    MAIL_TIMEOUT = float(getenv('MAIL_TIMEOUT', '30'))
+    MAIL_RETRIES = int(getenv('MAIL_RETRIES', '3'))
+    MAIL_SEND_TIMEOUT = float(getenv('MAIL_SEND_TIMEOUT', '300'))
+    SERVER_GROUPS_FILE = getenv('SERVER_GROUPS_FILE')
+    FORECAST_HISTORY_DAYS = int(getenv('FORECAST_HISTORY_DAYS', '90'))
+    FORECAST_HALF_LIFE = float(getenv('FORECAST_HALF_LIFE', '30'))
+    FORECAST_MIN_POINTS = int(getenv('FORECAST_MIN_POINTS', '3'))
+    FORECAST_HORIZON = int(getenv('FORECAST_HORIZON', '365'))
+    # Jobs throughput compared to their average over the history, the slowest jobs shown for each server
+    THROUGHPUT_HISTORY_DAYS = int(getenv('THROUGHPUT_HISTORY_DAYS', '30'))
+    THROUGHPUT_DEGRADATION = float(getenv('THROUGHPUT_DEGRADATION', '20'))
+    THROUGHPUT_TOP = int(getenv('THROUGHPUT_TOP', '10'))
+    CHANGES_MAX_ROWS = int(getenv('CHANGES_MAX_ROWS', '50'))
+
+    if INGEST_MODE not in ['insert', 'upsert']:
+        raise Exception(f'Unhandled ingestion mode {INGEST_MODE}')
+    if SCHEMA_VERSION not in [1, 2]:
+        raise Exception(f'Unhandled schema version {SCHEMA_VERSION}')
+    if SCHEMA_VERSION == 2 and INGEST_MODE != 'insert':
+        raise Exception(f'Unhandled ingestion mode {INGEST_MODE} with schema version 2')
+    if MAIL_MODE not in ['auto', 'full', 'compact']:
+        raise Exception(f'Unhandled mail mode {MAIL_MODE}')
+
+    stats = {
+        'backup': {
+            'sessions': 0, 'total': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
+        },
+        'tape': {
+            'sessions': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
+        },
+        'repositories': 0,
+        'types': dict(),
+        'compliance': {'objects': 0, 'compliant': 0, 'breached': 0},
+        'unprotected': 0,
+        'missed': {'jobs': 0, 'runs': 0, 'expected': 0},
+        'tape_media': {'pools': 0, 'cartridges': 0, 'scratch': 0, 'expiring': 0, 'low': 0}
+    }
+
+    # Get SQL queries
+    # In upsert mode, re-runs reuse the pipeline/info rows and update sessions in place
+    sql_prefix = 'upsert' if INGEST_MODE == 'upsert' else 'insert'
+    sql_insert_pipeline = open(scriptPath + f'/sql/{sql_prefix}_pipeline.sql', 'r').read()
+    sql_insert_info = open(scriptPath + f'/sql/{sql_prefix}_info.sql', 'r').read()
+    sql_insert_tape = open(scriptPath + f'/sql/{sql_prefix}_tape.sql', 'r').read()
+    sql_insert_in_progress = open(scriptPath + f'/sql/{sql_prefix}_in_progress.sql', 'r').read()
+    sql_insert_failed = open(scriptPath + f'/sql/{sql_prefix}_failed.sql', 'r').read()
+    sql_insert_repositorie = open(scriptPath + f'/sql/{sql_prefix}_repositorie.sql', 'r').read()
+    sql_select_row_hash_in_progress = open(scriptPath + '/sql/select_row_hash_in_progress.sql', 'r').read()
+    sql_select_row_hash_failed = open(scriptPath + '/sql/select_row_hash_failed.sql', 'r').read()
+    sql_delete_in_progress = open(scriptPath + '/sql/delete_in_progress.sql', 'r').read()
+    sql_select_upsert_in_progress_keys = open(scriptPath + '/sql/select_upsert_in_progress_keys.sql', 'r').read()
+    sql_select_artifact = open(scriptPath + '/sql/select_artifact.sql', 'r').read()
+    sql_upsert_artifact = open(scriptPath + '/sql/upsert_artifact.sql', 'r').read()
+    sql_select_repositorie_history = open(scriptPath + ('/sql/v2' if SCHEMA_VERSION == 2 else '/sql') + '/select_repositorie_history.sql', 'r').read()
+    sql_insert_job_throughput = open(scriptPath + '/sql/insert_job_throughput.sql', 'r').read()
+    sql_insert_tape_pool = open(scriptPath + '/sql/insert_tape_pool.sql', 'r').read()
+    sql_select_job_throughput_history = open(scriptPath + '/sql/select_job_throughput_history.sql', 'r').read()
+    sql_select_failure_state = open(scriptPath + '/sql/select_failure_state.sql', 'r').read()
+    sql_delete_failure_state = open(scriptPath + '/sql/delete_failure_state.sql', 'r').read()
+    sql_insert_failure_state = open(scriptPath + '/sql/insert_failure_state.sql', 'r').read()
+
+    server_infos = dict()
+    sessions_tape = dict()
+    sessions_failed = dict()
+    sessions_in_progress = dict()
+    compliance = dict()
+    unprotected = dict()
+    missed = dict()
+    tape_media = dict()
+    loads = dict()
+    throughputs = dict()
+    repositories = dict()
+    # Free space of all the repositories and extents, the report only shows the fullest ones
+    capacities = dict()
+    artifact_hashes = dict()
+    artifacts = dict()
+    artifact_cache_version = cache_version(scriptPath) if ARTIFACT_CACHE_DIR else ''
+    artifact_cache = load_artifact_cache(ARTIFACT_CACHE_DIR, artifact_cache_version)
+    server_groups = load_server_groups(SERVER_GROUPS_FILE)
+    cache_hits, cache_misses = 0, 0
+
+    # Start the metrics exporter early so that it drains its spool during the run
+    metrics = None
+    if getenv('DISABLE_INFLUXDB') != '1':
+        from common.metrics import MetricsExporter
+        metrics = MetricsExporter(INFLUXDB_URL, INFLUXDB_DATABASE, spool_dir=METRICS_SPOOL_DIR)
+
+    logging.info('Script start : %s' % __file__)
+    logging.info('Parameters : %s' % (', '.join(argv[1:]) or 'None'))
+
+    # Retrieve credentials from Vault or read them from env vars
+    if getenv('VAULT_ADDR'):
+        import hvac
+
+        for var in ['VAULT_ADDR', 'VAULT_TOKEN', 'VAULT_CREDENTIALS_PATH']:
+            if not getenv(var):
+                raise Exception(f'Required environment variable {var} is not defined')
+
+        vault = hvac.Client(url=getenv('VAULT_ADDR'),
+                            token=getenv('VAULT_TOKEN'))
+        vault_res = vault.is_authenticated()
+        logging.info('Vault auth res  : ' + str(vault_res))
+        read_secret_synapps_result = vault.read(
+            getenv('VAULT_CREDENTIALS_PATH')
+        )
+        if read_secret_synapps_result['data']['data']:
+            credentials = read_secret_synapps_result['data']['data']
+            DATABASE_ADDRESS = credentials.get('DATABASE_ADDRESS')
+            DATABASE_PORT = credentials.get('DATABASE_PORT')
+            DATABASE_NAME = credentials.get('DATABASE_NAME')
+            DATABASE_USERNAME = credentials.get('DATABASE_USERNAME')
+            DATABASE_PASSWORD = credentials.get('DATABASE_PASSWORD')
+        else:
+            raise Exception('Unable to retrieve credentials from Vault')
     else:
-        raise Exception('Unable to retrieve credentials from Vault')
-else:
-    for var in ['DATABASE_ADDRESS', 'DATABASE_PORT', 'DATABASE_NAME', 'DATABASE_USERNAME', 'DATABASE_PASSWORD']:
-        if not getenv(var):
-            raise Exception(f'Required environment variable {var} is not defined')
-    DATABASE_ADDRESS = getenv('DATABASE_ADDRESS')
-    DATABASE_PORT = getenv('DATABASE_PORT')
-    DATABASE_NAME = getenv('DATABASE_NAME')
-    DATABASE_USERNAME = getenv('DATABASE_USERNAME')
-    DATABASE_PASSWORD = getenv('DATABASE_PASSWORD')
-
-# List all JSON files
-for root, dirs, files in walk('artifacts/'):
-    for file in files:
-        if file.lower().endswith('.json'):
-            json_files.append(path.join(root, file))
-
-# Connect to MYSQL server
-conn = mysql.connector.connect(
-        host=DATABASE_ADDRESS,
-        port=DATABASE_PORT,
-        database=DATABASE_NAME,
-        user=DATABASE_USERNAME,
-        password=DATABASE_PASSWORD)
-# Send pipeline data to database
-try:
-    cursor = conn.cursor()
-
-    cursor.execute(sql_insert_pipeline, (CI_PIPELINE_ID, begin, COMMENT))
-    conn.commit()
-    id_pipeline = cursor.lastrowid
-
-except Exception as e:
-    print("insert mcb_pipeline failed: ", e)
-    sentry_sdk.capture_exception(e)
-
-# Iterate JSON files
-for file in json_files:
-    data, SERVER_NAME, stats_backup, stats_tape, stats_repositories = None, None, None, None, None
-    with open(file) as f:
-        data = json_load(f)
-    if data:
-        infos = data.get('infos')
-        if infos:
-            SERVER_NAME = infos.get('SERVER_NAME')
-            # Calculate the sum of all stats and store the infos
-            # in the variable server_infos grouped by SERVER_NAME
-            if infos.get('stats'):
-                if infos.get('stats').get('backup'):
-                    stats_backup = infos.get('stats').get('backup')
-                    stats['backup']['sessions'] += stats_backup.get('sessions')
-                    stats['backup']['total'] += stats_backup.get('total')
-                    stats['backup']['success'] += stats_backup.get('success')
-                    stats['backup']['warning'] += stats_backup.get('warning')
-                    stats['backup']['failed'] += stats_backup.get('failed')
-                    stats['backup']['running'] += stats_backup.get('running')
-                    stats['backup']['pending'] += stats_backup.get('pending')
-                    stats['backup']['idle'] += stats_backup.get('idle')
-                    stats['backup']['undefined'] += stats_backup.get('undefined')
-                    stats['backup']['in_progress'] += stats_backup.get('running') + stats_backup.get('pending')
-
-                if infos.get('stats').get('tape'):
-                    stats_tape = infos.get('stats').get('tape')
-                    stats['tape']['sessions'] += stats_tape.get('sessions')
-                    stats['tape']['success'] += stats_tape.get('success')
-                    stats['tape']['warning'] += stats_tape.get('warning')
-                    stats['tape']['failed'] += stats_tape.get('failed')
-                    stats['tape']['running'] += stats_tape.get('running')
-                    stats['tape']['pending'] += stats_tape.get('pending')
-                    stats['tape']['idle'] += stats_tape.get('idle')
-                    stats['tape']['undefined'] += stats_tape.get('undefined')
-                    stats['tape']['in_progress'] += stats_tape.get('in_progress')
-
-                if infos.get('stats').get('repositories'):
-                    stats['repositories'] += infos.get('stats').get('repositories')
-
-            server_infos[SERVER_NAME] = infos
-
-# Send info data to database
-try:
-    cursor.execute(sql_insert_info, (
-        id_pipeline, SERVER_NAME, stats['backup']['sessions'], stats['backup']['total'],
-        stats['backup']['success'], stats['backup']['warning'], stats['backup']['failed'],
-        stats['backup']['running'], stats['backup']['pending'], stats['backup']['idle'],
-        stats['backup']['undefined'], stats['backup']['in_progress'], stats['tape']['sessions'],
-        stats['tape']['success'], stats['tape']['warning'], stats['tape']['failed'],
-        stats['tape']['running'], stats['tape']['pending'], stats['tape']['idle'],
-        stats['tape']['undefined'], stats['tape']['in_progress'], stats['repositories']))
-    conn.commit()
-    id_infos = cursor.lastrowid
-
-except Exception as e:
-    print("insert mcb_info failed: ", e)
-    sentry_sdk.capture_exception(e)
-
-for file in json_files:
-    data, SERVER_NAME, stats_backup, stats_tape, stats_repositories = None, None, None, None, None
-    with open(file) as f:
-        data = json_load(f)
-    if data:
-        infos = data.get('infos')
-        # Get server_name
-        if infos:
-            SERVER_NAME = infos.get('SERVER_NAME')
-
-        sessions_root = data.get('sessions')
-        if sessions_root.get('tape'):
-            # Formatting values for Jinja2
-            for job in sessions_root.get('tape'):
-                tape = sessions_root.get('tape').get(job)
-
-                # Send tapes data to database
+        for var in ['DATABASE_ADDRESS', 'DATABASE_PORT', 'DATABASE_NAME', 'DATABASE_USERNAME', 'DATABASE_PASSWORD']:
+            if not getenv(var):
+                raise Exception(f'Required environment variable {var} is not defined')
+        DATABASE_ADDRESS = getenv('DATABASE_ADDRESS')
+        DATABASE_PORT = getenv('DATABASE_PORT')
+        DATABASE_NAME = getenv('DATABASE_NAME')
+        DATABASE_USERNAME = getenv('DATABASE_USERNAME')
+        DATABASE_PASSWORD = getenv('DATABASE_PASSWORD')
+
+    # List all JSON files
+    for root, dirs, files in walk('artifacts/'):
+        for file in files:
+            # Skip the report model written by a previous run
+            if file.lower().endswith('.json') and path.join(root, file) != 'artifacts/output.json':
+                json_files.append(path.join(root, file))
+
+    # Connect to MYSQL server
+    import mysql.connector
+    conn = mysql.connector.connect(
+            host=DATABASE_ADDRESS,
+            port=DATABASE_PORT,
+            database=DATABASE_NAME,
+            user=DATABASE_USERNAME,
+            password=DATABASE_PASSWORD)
+
+    # The dimension keys of schema v2 are resolved from memory during the ingestion
+    if SCHEMA_VERSION == 2:
+        from schema_v2 import DimensionCache, FACTS, ingest_rows
+        dimensions = DimensionCache(conn)
+        sql_insert_v2 = {table: open(scriptPath + '/sql/v2/' + FACTS[table][1], 'r').read() for table in FACTS}
+
+    # Send pipeline data to database
+    try:
+        cursor = conn.cursor()
+
+        cursor.execute(sql_insert_pipeline, (CI_PIPELINE_ID, begin, COMMENT))
+        conn.commit()
+        id_pipeline = cursor.lastrowid
+
+    except Exception as e:
+        print("insert mcb_pipeline failed: ", e)
+        sentry_sdk.capture_exception(e)
+
+    # Iterate JSON files
+    for file in json_files:
+        data, SERVER_NAME, stats_backup, stats_tape = None, None, None, None
+        # Each artifact is read and parsed once, its data is ingested by the next loop
+        artifact_hashes[file], artifacts[file] = read_artifact(file)
+        data = artifacts[file]
+        if data:
+            infos = data.get('infos')
+            if infos:
+                SERVER_NAME = infos.get('SERVER_NAME')
+                # Calculate the sum of all stats and store the infos
+                # in the variable server_infos grouped by SERVER_NAME
+                if infos.get('stats'):
+                    if infos.get('stats').get('backup'):
+                        stats_backup = infos.get('stats').get('backup')
+                        stats['backup']['sessions'] += stats_backup.get('sessions')
+                        stats['backup']['total'] += stats_backup.get('total')
+                        stats['backup']['success'] += stats_backup.get('success')
+                        stats['backup']['warning'] += stats_backup.get('warning')
+                        stats['backup']['failed'] += stats_backup.get('failed')
+                        stats['backup']['running'] += stats_backup.get('running')
+                        stats['backup']['pending'] += stats_backup.get('pending')
+                        stats['backup']['idle'] += stats_backup.get('idle')
+                        stats['backup']['undefined'] += stats_backup.get('undefined')
+                        stats['backup']['in_progress'] += stats_backup.get('running') + stats_backup.get('pending')
+
+                    if infos.get('stats').get('tape'):
+                        stats_tape = infos.get('stats').get('tape')
+                        stats['tape']['sessions'] += stats_tape.get('sessions')
+                        stats['tape']['success'] += stats_tape.get('success')
+                        stats['tape']['warning'] += stats_tape.get('warning')
+                        stats['tape']['failed'] += stats_tape.get('failed')
+                        stats['tape']['running'] += stats_tape.get('running')
+                        stats['tape']['pending'] += stats_tape.get('pending')
+                        stats['tape']['idle'] += stats_tape.get('idle')
+                        stats['tape']['undefined'] += stats_tape.get('undefined')
+                        stats['tape']['in_progress'] += stats_tape.get('in_progress')
+
+                    if infos.get('stats').get('repositories'):
+                        stats['repositories'] += infos.get('stats').get('repositories')
+
+                    # Backup, Replica and Backup Copy sessions
+                    for job_type, stats_type in (infos.get('stats').get('types') or {}).items():
+                        stats_types = stats['types'].setdefault(job_type, dict())
+                        for key in stats_type:
+                            stats_types[key] = stats_types.get(key, 0) + stats_type[key]
+
+                    if infos.get('stats').get('compliance'):
+                        for key in stats['compliance']:
+                            stats['compliance'][key] += infos.get('stats').get('compliance').get(key) or 0
+
+                    if infos.get('stats').get('unprotected'):
+                        stats['unprotected'] += infos.get('stats').get('unprotected')
+
+                    if infos.get('stats').get('missed'):
+                        for key in stats['missed']:
+                            stats['missed'][key] += infos.get('stats').get('missed').get(key) or 0
+
+                    if infos.get('stats').get('tape_media'):
+                        for key in stats['tape_media']:
+                            stats['tape_media'][key] += infos.get('stats').get('tape_media').get(key) or 0
+
+                server_infos[SERVER_NAME] = infos
+
+    # Send info data to database
+    try:
+        cursor.execute(sql_insert_info, (
+            id_pipeline, SERVER_NAME, stats['backup']['sessions'], stats['backup']['total'],
+            stats['backup']['success'], stats['backup']['warning'], stats['backup']['failed'],
+            stats['backup']['running'], stats['backup']['pending'], stats['backup']['idle'],
+            stats['backup']['undefined'], stats['backup']['in_progress'], stats['tape']['sessions'],
+            stats['tape']['success'], stats['tape']['warning'], stats['tape']['failed'],
+            stats['tape']['running'], stats['tape']['pending'], stats['tape']['idle'],
+            stats['tape']['undefined'], stats['tape']['in_progress'], stats['repositories']))
+        conn.commit()
+        id_infos = cursor.lastrowid
+
+    except Exception as e:
+        print("insert mcb_info failed: ", e)
+        sentry_sdk.capture_exception(e)
+
+    for file in json_files:
+        data, SERVER_NAME, stats_backup, stats_tape = None, None, None, None
+        content_hash = artifact_hashes[file]
+
+        # Reuse the formatted fragment of an unchanged artifact, its rows are still sent to database
+        cached = artifact_cache.get(content_hash)
+        if cached:
+            cache_hits += 1
+            refresh_fragment(cached, begin)
+            logging.info(f'Artifact of {cached["SERVER_NAME"]} unchanged, reusing cached fragment')
+        else:
+            cache_misses += 1
+
+        data = artifacts.pop(file)
+        if data:
+            infos = data.get('infos')
+            # Get server_name
+            if infos:
+                SERVER_NAME = infos.get('SERVER_NAME')
+
+            # In upsert mode, an unchanged artifact skips the sessions upserts, and an artifact already
+            # ingested for this run skips all the database writes. The history of a new run is always written
+            artifact_unchanged, artifact_ingested = False, False
+            rows_in_progress, rows_failed = dict(), dict()
+            rows_v2 = {'tape': [], 'in_progress': [], 'failed': [], 'repositorie': []}
+            if INGEST_MODE == 'upsert':
                 try:
                     cursor = conn.cursor()
-                    cursor.execute(sql_insert_tape, (
-                        id_infos,
-                        datetime_fmt_to_mysql(sessions_root['tape'][job]['start_date']),
-                        datetime_fmt_to_mysql(sessions_root['tape'][job]['end_date']),
-                        sessions_root['tape'][job]['backup_status'],
-                        sessions_root['tape'][job]['backup_status_details'],
-                        sessions_root['tape'][job]['job_name'],
-                        sessions_root['tape'][job]['job_id'],
-                        sessions_root['tape'][job]['reason'],
-                        sessions_root['tape'][job]['mediapool_name']))
-                    conn.commit()
+                    cursor.execute(sql_select_artifact, (SERVER_NAME,))
+                    stored_artifact = cursor.fetchone()
+                    artifact_unchanged = stored_artifact is not None and stored_artifact[0] == content_hash
+                    artifact_ingested = artifact_unchanged and stored_artifact[1] == id_infos
                 except Exception as e:
-                    print("insert mcb_tape failed: ", e)
-                    sentry_sdk.capture_exception(e)
-
-                sessions_root['tape'][job]['reason'] = error_text(tape.get('reason'))
-                sessions_root['tape'][job]['duration_color'] = 'bg-error' if duration_in_seconds(tape.get('start_date'), tape.get('end_date')) >= 20 * 3600 else ''
-                sessions_root['tape'][job]['duration'] = duration(tape.get('start_date'), tape.get('end_date'))
-                sessions_root['tape'][job]['start_date'] = format_datetime(tape.get('start_date'))
-                sessions_root['tape'][job]['end_date'] = format_datetime(tape.get('end_date'))
-            sessions_tape[SERVER_NAME] = sessions_root.get('tape')
-
-        if sessions_root.get('in_progress'):
-            # Formatting values for Jinja2
-            for job in sessions_root.get('in_progress'):
-                for vm in sessions_root.get('in_progress').get(job):
-                    # Send in progress data to database
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute(sql_insert_in_progress, (
-                            id_infos,
-                            datetime_fmt_to_mysql(sessions_root['in_progress'][job][vm]['start_date']),
-                            sessions_root['in_progress'][job][vm]['session_id'],
-                            sessions_root['in_progress'][job][vm]['orig_session_id'],
-                            sessions_root['in_progress'][job][vm]['backup_status'],
-                            sessions_root['in_progress'][job][vm]['backup_status_details'],
-                            datetime_fmt_to_mysql(sessions_root['in_progress'][job][vm]['last_point_success']),
-                            sessions_root['in_progress'][job][vm]['object_id'],
-                            sessions_root['in_progress'][job][vm]['job_name'],
-                            sessions_root['in_progress'][job][vm]['job_id'],
-                            sessions_root['in_progress'][job][vm]['type'],
-                            sessions_root['in_progress'][job][vm]['object_name'],
-                            sessions_root['in_progress'][job][vm]['backup_transport_mode'],
-                            sessions_root['in_progress'][job][vm]['target_storage'],
-                            sessions_root['in_progress'][job][vm]['proxies'],
-                            sessions_root['in_progress'][job][vm]['nb_restore_points'],
-                            sessions_root['in_progress'][job][vm]['retaindays'],
-                            sessions_root['in_progress'][job][vm]['retaincycles'],
-                            sessions_root['in_progress'][job][vm]['retention_maintenance']))
-                        conn.commit()
-                    except Exception as e:
-                        print("insert mcb_in_progress failed: ", e)
-                        sentry_sdk.capture_exception(e)
-
-                    in_progress = sessions_root.get('in_progress').get(job).get(vm)
-                    sessions_root['in_progress'][job][vm]['duration_color'] = 'bg-error' if duration_in_seconds(in_progress.get('start_date'), None) >= 20 * 3600 else ''
-                    sessions_root['in_progress'][job][vm]['lps_duration'] = duration_in_seconds(in_progress.get('last_point_success'), None)
-                    sessions_root['in_progress'][job][vm]['lps_color'] = lps_duration_color(sessions_root['in_progress'][job][vm]['lps_duration'])
-                    sessions_root['in_progress'][job][vm]['rp_color'] = rp_color(in_progress)
-                    sessions_root['in_progress'][job][vm]['duration'] = duration(in_progress.get('start_date'), None)
-                    sessions_root['in_progress'][job][vm]['start_date'] = format_datetime(in_progress.get('start_date'))
-                    sessions_root['in_progress'][job][vm]['last_point_success'] = format_date(in_progress.get('last_point_success'))
-            sessions_in_progress[SERVER_NAME] = sessions_root.get('in_progress')
-
-        if sessions_root.get('failed'):
-            # Formatting values for Jinja2
-            for job in sessions_root.get('failed'):
-                for vm in sessions_root.get('failed').get(job):
-
-                    # Send failed data to database
+                    errors.add("select mcb_artifact", e, SERVER_NAME)
+                if artifact_ingested:
+                    logging.info(f'Artifact of {SERVER_NAME} already ingested for this run, skipping database writes')
+                elif artifact_unchanged:
+                    logging.info(f'Artifact of {SERVER_NAME} unchanged, skipping sessions upserts')
+            # Rows of the in progress and failed sessions sent to database
+            sessions_written = not artifact_ingested and not (artifact_unchanged and SCHEMA_VERSION != 2)
+
+            # The sections of a cached artifact are replaced by the formatted ones of the cache,
+            # they are only read for the rows sent to database
+
+            sessions_root = data.get('sessions')
+            if sessions_root.get('tape') and not (cached and artifact_ingested):
+                # Formatting values for Jinja2
+                for job in sessions_root.get('tape'):
+                    tape = sessions_root.get('tape').get(job)
+
+                    # Send tapes data to database
+                    if not artifact_ingested:
+                        row = None
+                        try:
+                            row = (
+                                id_infos,
+                                datetime_fmt_to_mysql(sessions_root['tape'][job]['start_date']),
+                                datetime_fmt_to_mysql(sessions_root['tape'][job]['end_date']),
+                                sessions_root['tape'][job]['backup_status'],
+                                sessions_root['tape'][job]['backup_status_details'],
+                                sessions_root['tape'][job]['job_name'],
+                                sessions_root['tape'][job]['job_id'],
+                                sessions_root['tape'][job]['reason'],
+                                sessions_root['tape'][job]['mediapool_name'])
+                            if SCHEMA_VERSION == 2:
+                                rows_v2['tape'].append(row)
+                            else:
+                                cursor = conn.cursor()
+                                cursor.execute(sql_insert_tape, row)
+                                conn.commit()
+                        except Exception as e:
+                            errors.add("insert mcb_tape", e, row)
+
+                    if cached:
+                        continue
+                    sessions_root['tape'][job]['reason'] = error_text(tape.get('reason'))
+                    sessions_root['tape'][job]['duration_color'] = 'bg-error' if duration_in_seconds(tape.get('start_date'), tape.get('end_date')) >= 20 * 3600 else ''
+                    sessions_root['tape'][job]['duration'] = duration(tape.get('start_date'), tape.get('end_date'))
+                    sessions_root['tape'][job]['start_date'] = format_datetime(tape.get('start_date'))
+                    sessions_root['tape'][job]['end_date'] = format_datetime(tape.get('end_date'))
+                sessions_tape[SERVER_NAME] = sessions_root.get('tape')
+
+            if data.get('tape_media'):
+                pools = data.get('tape_media')
+
+                # Send the media pools to database in bulk for the history
+                if not artifact_ingested:
                     try:
                         cursor = conn.cursor()
-                        cursor.execute(sql_insert_failed, (
+                        cursor.executemany(sql_insert_tape_pool, [(
                             id_infos,
-                            datetime_fmt_to_mysql(sessions_root['failed'][job][vm]['start_date']),
-                            datetime_fmt_to_mysql(sessions_root['failed'][job][vm]['end_date']),
-                            sessions_root['failed'][job][vm]['session_id'],
-                            sessions_root['failed'][job][vm]['orig_session_id'],
-                            sessions_root['failed'][job][vm]['backup_status'],
-                            sessions_root['failed'][job][vm]['backup_status_details'],
-                            datetime_fmt_to_mysql(sessions_root['failed'][job][vm]['last_point_success']),
-                            sessions_root['failed'][job][vm]['object_id'],
-                            sessions_root['failed'][job][vm]['job_name'],
-                            sessions_root['failed'][job][vm]['job_id'],
-                            sessions_root['failed'][job][vm]['type'],
-                            sessions_root['failed'][job][vm]['reason'],
-                            sessions_root['failed'][job][vm]['object_name'],
-                            sessions_root['failed'][job][vm]['backup_transport_mode'],
-                            sessions_root['failed'][job][vm]['target_storage'],
-                            sessions_root['failed'][job][vm]['proxies'],
-                            sessions_root['failed'][job][vm]['nb_restore_points'],
-                            sessions_root['failed'][job][vm]['retaindays'],
-                            sessions_root['failed'][job][vm]['retaincycles'],
-                            sessions_root['failed'][job][vm]['retention_maintenance']))
+                            SERVER_NAME,
+                            name,
+                            pools[name]['cartridges'],
+                            pools[name]['scratch'],
+                            pools[name]['expiring'],
+                            pools[name]['vault'],
+                            pools[name]['offline'],
+                            pools[name]['capacity'],
+                            pools[name]['remaining']) for name in pools])
                         conn.commit()
                     except Exception as e:
-                        print("insert mcb_failed failed: ", e)
-                        sentry_sdk.capture_exception(e)
-
-                    failed = sessions_root.get('failed').get(job).get(vm)
-                    sessions_root['failed'][job][vm]['duration_color'] = 'bg-error' if duration_in_seconds(failed.get('start_date'), failed.get('end_date')) >= 20 * 3600 else ''
-                    sessions_root['failed'][job][vm]['lps_duration'] = duration_in_seconds(failed.get('last_point_success'), None)
-                    sessions_root['failed'][job][vm]['lps_color'] = lps_duration_color(sessions_root['failed'][job][vm]['lps_duration'])
-                    sessions_root['failed'][job][vm]['rp_color'] = rp_color(failed)
-                    sessions_root['failed'][job][vm]['last_point_success'] = format_date(failed.get('last_point_success'))
-                    sessions_root['failed'][job][vm]['reason'] = error_text(failed.get('reason'))
-                    sessions_root['failed'][job][vm]['duration'] = duration(failed.get('start_date'), failed.get('end_date'))
-                    sessions_root['failed'][job][vm]['start_date'] = format_datetime(failed.get('start_date'))
-                    sessions_root['failed'][job][vm]['end_date'] = format_datetime(failed.get('end_date'))
-            sessions_failed[SERVER_NAME] = sessions_root.get('failed')
-
-        if data.get('repositories'):
-            # Formatting values for Jinja2
-            # Show only repository with free space <= 8
-            for repo in data['repositories'].copy():
-                if data['repositories'].get(repo).get('id'):
-
-                    # Send repositories (without scale-out) data to database
+                        errors.add("insert mcb_tape_pool", e, SERVER_NAME)
+
+                # Formatting values for Jinja2
+                if not cached:
+                    for name in pools:
+                        pools[name]['scratch_color'] = 'bg-error' if pools[name]['low'] else ''
+                        pools[name]['capacity'] = sizeof_fmt(pools[name]['capacity'])
+                        pools[name]['remaining'] = sizeof_fmt(pools[name]['remaining'])
+                tape_media[SERVER_NAME] = pools
+
+            if sessions_root.get('in_progress') and (sessions_written or not cached):
+                # Formatting values for Jinja2
+                for job in sessions_root.get('in_progress'):
+                    for vm in sessions_root.get('in_progress').get(job):
+                        # Send in progress data to database
+                        row = None
+                        try:
+                            row = (
+                                id_infos,
+                                datetime_fmt_to_mysql(sessions_root['in_progress'][job][vm]['start_date']),
+                                sessions_root['in_progress'][job][vm]['session_id'],
+                                sessions_root['in_progress'][job][vm]['orig_session_id'],
+                                sessions_root['in_progress'][job][vm]['backup_status'],
+                                sessions_root['in_progress'][job][vm]['backup_status_details'],
+                                datetime_fmt_to_mysql(sessions_root['in_progress'][job][vm]['last_point_success']),
+                                sessions_root['in_progress'][job][vm]['object_id'],
+                                sessions_root['in_progress'][job][vm]['job_name'],
+                                sessions_root['in_progress'][job][vm]['job_id'],
+                                sessions_root['in_progress'][job][vm]['type'],
+                                sessions_root['in_progress'][job][vm]['object_name'],
+                                sessions_root['in_progress'][job][vm]['backup_transport_mode'],
+                                sessions_root['in_progress'][job][vm]['target_storage'],
+                                sessions_root['in_progress'][job][vm]['proxies'],
+                                sessions_root['in_progress'][job][vm]['nb_restore_points'],
+                                sessions_root['in_progress'][job][vm]['retaindays'],
+                                sessions_root['in_progress'][job][vm]['retaincycles'],
+                                sessions_root['in_progress'][job][vm]['retention_maintenance'])
+                            if SCHEMA_VERSION == 2:
+                                rows_v2['in_progress'].append(row)
+                            elif INGEST_MODE == 'upsert':
+                                # Upserted by batch once the artifact is formatted
+                                rows_in_progress[(row[2], row[7])] = row + (SERVER_NAME,)
+                            else:
+                                cursor = conn.cursor()
+                                cursor.execute(sql_insert_in_progress, row)
+                                conn.commit()
+                        except Exception as e:
+                            errors.add("insert mcb_in_progress", e, row)
+
+                        if cached:
+                            continue
+                        in_progress = sessions_root.get('in_progress').get(job).get(vm)
+                        sessions_root['in_progress'][job][vm]['duration_color'] = 'bg-error' if duration_in_seconds(in_progress.get('start_date'), None) >= 20 * 3600 else ''
+                        sessions_root['in_progress'][job][vm]['lps_duration'] = duration_in_seconds(in_progress.get('last_point_success'), None)
+                        sessions_root['in_progress'][job][vm]['lps_color'] = lps_duration_color(sessions_root['in_progress'][job][vm]['lps_duration'])
+                        sessions_root['in_progress'][job][vm]['rp_color'] = rp_color(in_progress)
+                        sessions_root['in_progress'][job][vm]['duration'] = duration(in_progress.get('start_date'), None)
+                        sessions_root['in_progress'][job][vm]['start_date'] = format_datetime(in_progress.get('start_date'))
+                        sessions_root['in_progress'][job][vm]['last_point_success'] = format_date(in_progress.get('last_point_success'))
+                sessions_in_progress[SERVER_NAME] = sessions_root.get('in_progress')
+
+            if sessions_root.get('failed') and (sessions_written or not cached):
+                # Formatting values for Jinja2
+                for job in sessions_root.get('failed'):
+                    for vm in sessions_root.get('failed').get(job):
+
+                        # Send failed data to database
+                        row = None
+                        try:
+                            row = (
+                                id_infos,
+                                datetime_fmt_to_mysql(sessions_root['failed'][job][vm]['start_date']),
+                                datetime_fmt_to_mysql(sessions_root['failed'][job][vm]['end_date']),
+                                sessions_root['failed'][job][vm]['session_id'],
+                                sessions_root['failed'][job][vm]['orig_session_id'],
+                                sessions_root['failed'][job][vm]['backup_status'],
+                                sessions_root['failed'][job][vm]['backup_status_details'],
+                                datetime_fmt_to_mysql(sessions_root['failed'][job][vm]['last_point_success']),
+                                sessions_root['failed'][job][vm]['object_id'],
+                                sessions_root['failed'][job][vm]['job_name'],
+                                sessions_root['failed'][job][vm]['job_id'],
+                                sessions_root['failed'][job][vm]['type'],
+                                sessions_root['failed'][job][vm]['reason'],
+                                sessions_root['failed'][job][vm]['object_name'],
+                                sessions_root['failed'][job][vm]['backup_transport_mode'],
+                                sessions_root['failed'][job][vm]['target_storage'],
+                                sessions_root['failed'][job][vm]['proxies'],
+                                sessions_root['failed'][job][vm]['nb_restore_points'],
+                                sessions_root['failed'][job][vm]['retaindays'],
+                                sessions_root['failed'][job][vm]['retaincycles'],
+                                sessions_root['failed'][job][vm]['retention_maintenance'])
+                            if SCHEMA_VERSION == 2:
+                                rows_v2['failed'].append(row)
+                            elif INGEST_MODE == 'upsert':
+                                # Upserted by batch once the artifact is formatted
+                                rows_failed[(row[3], row[8])] = row + (SERVER_NAME,)
+                            else:
+                                cursor = conn.cursor()
+                                cursor.execute(sql_insert_failed, row)
+                                conn.commit()
+                        except Exception as e:
+                            errors.add("insert mcb_failed", e, row)
+
+                        if cached:
+                            continue
+                        failed = sessions_root.get('failed').get(job).get(vm)
+                        sessions_root['failed'][job][vm]['duration_color'] = 'bg-error' if duration_in_seconds(failed.get('start_date'), failed.get('end_date')) >= 20 * 3600 else ''
+                        sessions_root['failed'][job][vm]['lps_duration'] = duration_in_seconds(failed.get('last_point_success'), None)
+                        sessions_root['failed'][job][vm]['lps_color'] = lps_duration_color(sessions_root['failed'][job][vm]['lps_duration'])
+                        sessions_root['failed'][job][vm]['rp_color'] = rp_color(failed)
+                        sessions_root['failed'][job][vm]['last_point_success'] = format_date(failed.get('last_point_success'))
+                        sessions_root['failed'][job][vm]['cause'], sessions_root['failed'][job][vm]['cause_template'] = reason_cause(failed.get('reason'), vm, job)
+                        sessions_root['failed'][job][vm]['reason_summary'] = error_summary(failed.get('reason'))
+                        sessions_root['failed'][job][vm]['reason'] = error_text(failed.get('reason'))
+                        sessions_root['failed'][job][vm]['duration'] = duration(failed.get('start_date'), failed.get('end_date'))
+                        sessions_root['failed'][job][vm]['start_date'] = format_datetime(failed.get('start_date'))
+                        sessions_root['failed'][job][vm]['end_date'] = format_datetime(failed.get('end_date'))
+                sessions_failed[SERVER_NAME] = sessions_root.get('failed')
+
+            if data.get('compliance') and not cached:
+                # Formatting the objects out of their RPO for Jinja2
+                for job in data.get('compliance'):
+                    for vm in data.get('compliance').get(job):
+                        breach = data['compliance'][job][vm]
+                        breach['lps_duration'] = duration_in_seconds(breach.get('last_point_success'), None)
+                        breach['lps_color'] = lps_duration_color(breach['lps_duration'])
+                        breach['last_point_success'] = format_datetime(breach.get('last_point_success'))
+                compliance[SERVER_NAME] = data.get('compliance')
+
+            if data.get('unprotected'):
+                unprotected[SERVER_NAME] = data.get('unprotected')
+
+            if data.get('missed') and not cached:
+                # Formatting the missed runs for Jinja2
+                for job in data.get('missed'):
+                    data['missed'][job]['missed_runs'] = [format_datetime(run) for run in data['missed'][job]['missed_runs']]
+                missed[SERVER_NAME] = data.get('missed')
+
+            if data.get('load') and not cached:
+                # Formatting the busiest proxies and datastores for Jinja2
+                for resource in data.get('load'):
+                    busiest = list(data['load'][resource])[:LOAD_TOP]
+                    data['load'][resource] = {name: data['load'][resource][name] for name in busiest}
+                    for name in busiest:
+                        data['load'][resource][name]['peak_time'] = format_datetime(data['load'][resource][name].get('peak_time'))
+                if any(data['load'].values()):
+                    loads[SERVER_NAME] = data.get('load')
+
+            if data.get('throughput'):
+                # Throughput of the jobs and backup window, computed for all the sessions at once
+                # and not cached, the running jobs are measured up to now
+                from throughput import job_throughput
+                jobs, window = job_throughput(data.get('throughput'), begin)
+                throughputs[SERVER_NAME] = {'window': window, 'jobs': jobs}
+
+                # Send the jobs throughput to database for the history
+                if not artifact_ingested:
                     try:
                         cursor = conn.cursor()
-                        cursor.execute(sql_insert_repositorie, (
+                        cursor.executemany(sql_insert_job_throughput, [(
                             id_infos,
-                            data['repositories'][repo]['id'],
-                            data['repositories'][repo]['name'],
-                            None,
-                            data['repositories'][repo]['description'],
-                            data['repositories'][repo]['type'],
-                            data['repositories'][repo]['path'],
-                            data['repositories'][repo]['status'],
-                            data['repositories'][repo]['host_name'],
-                            data['repositories'][repo]['host_ip'],
-                            None,
-                            data['repositories'][repo]['free'],
-                            data['repositories'][repo]['total'],
-                            data['repositories'][repo]['used'],))
+                            SERVER_NAME,
+                            job,
+                            datetime_fmt_to_mysql(jobs[job]['start']),
+                            datetime_fmt_to_mysql(jobs[job]['end']),
+                            int(jobs[job]['duration']),
+                            jobs[job]['sessions'],
+                            int(jobs[job]['processed']),
+                            int(jobs[job]['transferred']),
+                            float(jobs[job]['throughput'])) for job in jobs])
                         conn.commit()
                     except Exception as e:
-                        print("insert mcb_repositorie (without scale-out) failed: ", e)
-                        sentry_sdk.capture_exception(e)
-
-                    current_repo = data['repositories'].get(repo)
-
-                    data['repositories'][repo]['free_percent'] = int(current_repo.get('free') * 100 / current_repo.get('total'))
-                    data['repositories'][repo]['free_percent_color'] = repo_free_color(data['repositories'][repo]['free_percent'])
-
-                    data['repositories'][repo]['free'] = sizeof_fmt(data['repositories'][repo]['free'])
-                    data['repositories'][repo]['used'] = sizeof_fmt(data['repositories'][repo]['used'])
-                    data['repositories'][repo]['total'] = sizeof_fmt(data['repositories'][repo]['total'])
-
-                    if data['repositories'][repo]['free_percent'] > 8:
-                        del data['repositories'][repo]
-                else:
-                    scaleout_free, scaleout_used, scaleout_total = 0, 0, 0
-                    hasSizeAlert = False
-                    for extent in data['repositories'][repo].copy():
-                        current_repo = data['repositories'].get(repo).get(extent)
-                        scaleout_free += current_repo.get('free')
-                        scaleout_used += current_repo.get('used')
-                        scaleout_total += current_repo.get('total')
-                        if int(current_repo.get('free') * 100 / current_repo.get('total')) <= 8:
-                            hasSizeAlert = True
-                    if not hasSizeAlert:
-                        del data['repositories'][repo]
-
-                    if data.get('repositories').get(repo):
-                        for extent in data['repositories'][repo]:
+                        errors.add("insert mcb_job_throughput", e, SERVER_NAME)
 
-                            # Send repositories (with scale-out) data to database
+            if data.get('repositories'):
+                # Formatting values for Jinja2
+                # Show only repository with free space <= 8
+                for repo in data['repositories'].copy():
+                    if data['repositories'].get(repo).get('id'):
+
+                        # Send repositories (without scale-out) data to database
+                        if not artifact_ingested:
+                            row = None
                             try:
-                                cursor = conn.cursor()
-                                cursor.execute(sql_insert_repositorie, (
+                                row = (
                                     id_infos,
-                                    data['repositories'][repo][extent]['id'],
-                                    data['repositories'][repo][extent]['name'],
-                                    extent,
-                                    data['repositories'][repo][extent]['description'],
-                                    data['repositories'][repo][extent]['type'],
-                                    data['repositories'][repo][extent]['path'],
-                                    data['repositories'][repo][extent]['status'],
-                                    data['repositories'][repo][extent]['host_name'],
-                                    data['repositories'][repo][extent]['host_ip'],
-                                    data['repositories'][repo][extent]['scale_out_name'],
-                                    data['repositories'][repo][extent]['free'],
-                                    data['repositories'][repo][extent]['total'],
-                                    data['repositories'][repo][extent]['used'],))
-                                conn.commit()
+                                    data['repositories'][repo]['id'],
+                                    data['repositories'][repo]['name'],
+                                    None,
+                                    data['repositories'][repo]['description'],
+                                    data['repositories'][repo]['type'],
+                                    data['repositories'][repo]['path'],
+                                    data['repositories'][repo]['status'],
+                                    data['repositories'][repo]['host_name'],
+                                    data['repositories'][repo]['host_ip'],
+                                    None,
+                                    data['repositories'][repo]['free'],
+                                    data['repositories'][repo]['total'],
+                                    data['repositories'][repo]['used'],
+                                    SERVER_NAME)
+                                if SCHEMA_VERSION == 2:
+                                    rows_v2['repositorie'].append(row)
+                                else:
+                                    cursor = conn.cursor()
+                                    cursor.execute(sql_insert_repositorie, row)
+                                    conn.commit()
                             except Exception as e:
-                                print("insert mcb_repositorie (with scale-out) failed: ", e)
-                                sentry_sdk.capture_exception(e)
-
+                                errors.add("insert mcb_repositorie (without scale-out)", e, row)
+
+                        capacities.setdefault(SERVER_NAME, []).append(repository_capacity(repo, None, data['repositories'][repo]))
+                        if cached:
+                            continue
+                        current_repo = data['repositories'].get(repo)
+
+                        data['repositories'][repo]['free_percent'] = int(current_repo.get('free') * 100 / current_repo.get('total'))
+                        data['repositories'][repo]['free_percent_color'] = repo_free_color(data['repositories'][repo]['free_percent'])
+
+                        data['repositories'][repo]['free'] = sizeof_fmt(data['repositories'][repo]['free'])
+                        data['repositories'][repo]['used'] = sizeof_fmt(data['repositories'][repo]['used'])
+                        data['repositories'][repo]['total'] = sizeof_fmt(data['repositories'][repo]['total'])
+
+                        if data['repositories'][repo]['free_percent'] > 8:
+                            del data['repositories'][repo]
+                    else:
+                        scaleout_free, scaleout_used, scaleout_total = 0, 0, 0
+                        hasSizeAlert = False
+                        for extent in data['repositories'][repo].copy():
                             current_repo = data['repositories'].get(repo).get(extent)
 
-                            data['repositories'][repo][extent]['scaleout_free_percent'] = int(scaleout_free * 100 / scaleout_total)
-                            data['repositories'][repo][extent]['scaleout_free_percent_color'] = repo_free_color(data['repositories'][repo][extent]['scaleout_free_percent'])
-                            data['repositories'][repo][extent]['free_percent'] = int(current_repo.get('free') * 100 / current_repo.get('total'))
-                            data['repositories'][repo][extent]['free_percent_color'] = repo_free_color(data['repositories'][repo][extent]['free_percent'])
-
-                            data['repositories'][repo][extent]['scaleout_free'] = sizeof_fmt(scaleout_free)
-                            data['repositories'][repo][extent]['scaleout_used'] = sizeof_fmt(scaleout_used)
-                            data['repositories'][repo][extent]['scaleout_total'] = sizeof_fmt(scaleout_total)
-                            data['repositories'][repo][extent]['free'] = sizeof_fmt(data['repositories'][repo][extent]['free'])
-                            data['repositories'][repo][extent]['used'] = sizeof_fmt(data['repositories'][repo][extent]['used'])
-                            data['repositories'][repo][extent]['total'] = sizeof_fmt(data['repositories'][repo][extent]['total'])
-            if data.get('repositories'):
-                repositories[SERVER_NAME] = data.get('repositories')
-
-if len(json_files) == 0:
-    sentry_sdk.flush(120)
-    logging.info('No JSON found from crawlers')
-    logging.info('Script end')
-    exit(1)
-
-# Calculate percentages
-percent_failed = int(stats['backup']['failed'] * 100 / int(stats['backup']['total']))
-
-stats['backup']['success%'] = percent_mail(stats['backup']['success'] * 100 / int(stats['backup']['total']))
-stats['backup']['failed%'] = percent_mail(stats['backup']['failed'] * 100 / int(stats['backup']['total']))
-stats['backup']['warning%'] = percent_mail(stats['backup']['warning'] * 100 / int(stats['backup']['total']))
-stats['backup']['in_progress%'] = percent_mail(stats['backup']['in_progress'] * 100 / int(stats['backup']['total']))
-# Set emoji and color for global status
-if percent_failed < 25:
-    stats['backup']['emoji'] = '&#128578;'
-    stats['backup']['color'] = 'bg-success'
-elif 25 <= percent_failed < 50:
-    stats['backup']['emoji'] = '&#128528;'
-    stats['backup']['color'] = 'bg-warning'
-else:
-    stats['backup']['emoji'] = '&#128544;'
-    stats['backup']['color'] = 'bg-error'
-
-# Define the default folder for Jinja2 files
-file_loader = FileSystemLoader(scriptPath + '/jinja')
-env = Environment(loader=file_loader)
-
-# Load the Jinja2 template
-template = env.get_template('template.j2')
-
-# Render the jinja2 template
-html = template.render(
-    today=format_datetime_title(begin),
-    stats=stats,
-    tapes=sessions_tape,
-    in_progress=sessions_in_progress,
-    failed=sessions_failed,
-    repositories=repositories,
-    server_infos=server_infos
-)
-
-# Write the rendered template to a file
-with open('artifacts/output.html', 'w+') as f:
-    f.write(html)
-
-delta = datetime.now() - begin
-
-# Send the rendered template by mail
-if getenv('DISABLE_MAIL') != '1':
-    # Create message container - the correct MIME type is multipart/alternative.
-    msg = MIMEMultipart('alternative')
+                            # Send repositories (with scale-out) data to database
+                            # All the extents are stored for the capacity forecast
+                            if not artifact_ingested:
+                                row = None
+                                try:
+                                    row = (
+                                        id_infos,
+                                        current_repo['id'],
+                                        current_repo['name'],
+                                        extent,
+                                        current_repo['description'],
+                                        current_repo['type'],
+                                        current_repo['path'],
+                                        current_repo['status'],
+                                        current_repo['host_name'],
+                                        current_repo['host_ip'],
+                                        current_repo['scale_out_name'],
+                                        current_repo['free'],
+                                        current_repo['total'],
+                                        current_repo['used'],
+                                        SERVER_NAME)
+                                    if SCHEMA_VERSION == 2:
+                                        rows_v2['repositorie'].append(row)
+                                    else:
+                                        cursor = conn.cursor()
+                                        cursor.execute(sql_insert_repositorie, row)
+                                        conn.commit()
+                                except Exception as e:
+                                    errors.add("insert mcb_repositorie (with scale-out)", e, row)
+
+                            capacities.setdefault(SERVER_NAME, []).append(repository_capacity(repo, extent, current_repo))
+
+                            scaleout_free += current_repo.get('free')
+                            scaleout_used += current_repo.get('used')
+                            scaleout_total += current_repo.get('total')
+                            if int(current_repo.get('free') * 100 / current_repo.get('total')) <= 8:
+                                hasSizeAlert = True
+                        if cached:
+                            continue
+                        if not hasSizeAlert:
+                            del data['repositories'][repo]
+
+                        if data.get('repositories').get(repo):
+                            for extent in data['repositories'][repo]:
+                                current_repo = data['repositories'].get(repo).get(extent)
+
+                                data['repositories'][repo][extent]['scaleout_free_percent'] = int(scaleout_free * 100 / scaleout_total)
+                                data['repositories'][repo][extent]['scaleout_free_percent_color'] = repo_free_color(data['repositories'][repo][extent]['scaleout_free_percent'])
+                                data['repositories'][repo][extent]['free_percent'] = int(current_repo.get('free') * 100 / current_repo.get('total'))
+                                data['repositories'][repo][extent]['free_percent_color'] = repo_free_color(data['repositories'][repo][extent]['free_percent'])
+
+                                data['repositories'][repo][extent]['scaleout_free'] = sizeof_fmt(scaleout_free)
+                                data['repositories'][repo][extent]['scaleout_used'] = sizeof_fmt(scaleout_used)
+                                data['repositories'][repo][extent]['scaleout_total'] = sizeof_fmt(scaleout_total)
+                                data['repositories'][repo][extent]['free'] = sizeof_fmt(data['repositories'][repo][extent]['free'])
+                                data['repositories'][repo][extent]['used'] = sizeof_fmt(data['repositories'][repo][extent]['used'])
+                                data['repositories'][repo][extent]['total'] = sizeof_fmt(data['repositories'][repo][extent]['total'])
+                if data.get('repositories'):
+                    repositories[SERVER_NAME] = data.get('repositories')
+
+            # Insert the rows of the artifact in bulk in schema v2
+            if SCHEMA_VERSION == 2 and not artifact_ingested:
+                try:
+                    ingest_rows(conn, dimensions, sql_insert_v2, SERVER_NAME, rows_v2)
+                except Exception as e:
+                    errors.add("insert schema v2", e, SERVER_NAME)
 
-    # Define the mail Subject
-    msg['Subject'] = 'Morning check backup - T:{} | S:{} ({}%) | F:{} ({}%) | W:{} ({}%) | IP:{} ({}%)'.format(
-        stats.get('backup').get('sessions'),
-        stats.get('backup').get('success'),
-        stats['backup']['success%'],
-        stats.get('backup').get('failed'),
-        stats['backup']['failed%'],
-        stats.get('backup').get('warning'),
-        stats['backup']['warning%'],
-        stats.get('backup').get('in_progress'),
-        stats['backup']['in_progress%']
+            # Upsert the sessions of the artifact, writing only the changed rows
+            if INGEST_MODE == 'upsert' and not artifact_ingested:
+                try:
+                    cursor = conn.cursor()
+                    if not artifact_unchanged:
+                        changed_in_progress = upsert_sessions(cursor, sql_select_row_hash_in_progress, sql_insert_in_progress, rows_in_progress)
+                        changed_failed = upsert_sessions(cursor, sql_select_row_hash_failed, sql_insert_failed, rows_failed)
+                        # Sessions missing from the artifact have ended, successfully or not
+                        cursor.execute(sql_select_upsert_in_progress_keys, (SERVER_NAME,))
+                        ended = [key for key in cursor.fetchall() if tuple(key) not in rows_in_progress]
+                        if ended:
+                            cursor.executemany(sql_delete_in_progress, ended)
+                        logging.info(f'Upserted {SERVER_NAME} : in_progress={len(changed_in_progress)}/{len(rows_in_progress)}, '
+                                     f'failed={len(changed_failed)}/{len(rows_failed)}, ended={len(ended)}')
+                    # The run of the artifact is stored so that a re-run of the same pipeline skips it
+                    cursor.execute(sql_upsert_artifact, (SERVER_NAME, content_hash, id_infos, begin))
+                    conn.commit()
+                except Exception as e:
+                    errors.add("upsert sessions", e, SERVER_NAME)
+
+            # The sections of an unchanged artifact are the formatted ones of the cache
+            if cached:
+                for section, sessions in [('tape', sessions_tape), ('in_progress', sessions_in_progress),
+                                          ('failed', sessions_failed), ('repositories', repositories),
+                                          ('compliance', compliance), ('unprotected', unprotected), ('missed', missed),
+                                          ('tape_media', tape_media), ('load', loads)]:
+                    sessions.pop(SERVER_NAME, None)
+                    if cached.get(section):
+                        sessions[SERVER_NAME] = cached[section]
+
+            # Store the formatted fragment for the next runs
+            elif ARTIFACT_CACHE_DIR:
+                try:
+                    save_artifact_cache(ARTIFACT_CACHE_DIR, {
+                        'SERVER_NAME': SERVER_NAME,
+                        'content_hash': content_hash,
+                        'version': artifact_cache_version,
+                        'created': begin.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'tape': sessions_tape.get(SERVER_NAME),
+                        'in_progress': sessions_in_progress.get(SERVER_NAME),
+                        'failed': sessions_failed.get(SERVER_NAME),
+                        'repositories': repositories.get(SERVER_NAME),
+                        'compliance': compliance.get(SERVER_NAME),
+                        'unprotected': unprotected.get(SERVER_NAME),
+                        'missed': missed.get(SERVER_NAME),
+                        'tape_media': tape_media.get(SERVER_NAME),
+                        'load': loads.get(SERVER_NAME)
+                    })
+                except Exception as e:
+                    errors.add("save artifact cache", e, SERVER_NAME)
+
+    if errors.count:
+        logging.warning(f'{errors.count} errors during the ingestion, {errors.report()} events sent to Sentry')
+
+    if len(json_files) == 0:
+        if metrics:
+            metrics.close()
+        sentry_sdk.flush(SENTRY_FLUSH_TIMEOUT)
+        logging.info('No JSON found from crawlers')
+        logging.info('Script end')
+        exit(1)
+
+    if ARTIFACT_CACHE_DIR:
+        cache_hit_rate = cache_hits * 100 / len(json_files)
+        logging.info(f'Artifact cache : hits = {cache_hits}, misses = {cache_misses}, hit rate = {cache_hit_rate:.1f}%')
+
+    # Calculate percentages, emoji and color of the global status
+    summarize_stats(stats)
+
+    # Forecast the days before the reported repositories are full from their history
+    if FORECAST_HISTORY_DAYS > 0 and repositories:
+        try:
+            from forecast import group_history, days_to_full, forecast_text, forecast_color
+            cursor = conn.cursor()
+            cursor.execute(sql_select_repositorie_history, (begin - timedelta(days=FORECAST_HISTORY_DAYS),))
+            forecasts = days_to_full(group_history(cursor.fetchall()), begin, FORECAST_HALF_LIFE, FORECAST_MIN_POINTS)
+            logging.info(f'Forecast of {len(forecasts)} repositories, extents and scale-outs')
+
+            for server in repositories:
+                for repo in repositories[server]:
+                    if repositories[server][repo].get('id'):
+                        extents = {None: repositories[server][repo]}
+                    else:
+                        extents = repositories[server][repo]
+                        scaleout_days = forecasts.get((server, repo, None))
+                    for extent in extents:
+                        days = forecasts.get((server, repo, extent))
+                        extents[extent]['days_to_full'] = days
+                        extents[extent]['fills_in'] = forecast_text(days, FORECAST_HORIZON)
+                        extents[extent]['fills_in_color'] = forecast_color(days)
+                        if extent is not None:
+                            extents[extent]['scaleout_fills_in'] = forecast_text(scaleout_days, FORECAST_HORIZON)
+                            extents[extent]['scaleout_fills_in_color'] = forecast_color(scaleout_days)
+        except Exception as e:
+            errors.add("repositories forecast", e)
+
+    # Compare the throughput of the jobs to their history and format the slowest ones for Jinja2
+    throughput_history = dict()
+    if THROUGHPUT_HISTORY_DAYS > 0 and throughputs:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_select_job_throughput_history, (begin - timedelta(days=THROUGHPUT_HISTORY_DAYS), id_pipeline))
+            throughput_history = {(server, job): average for server, job, average in cursor.fetchall()}
+        except Exception as e:
+            errors.add("select mcb_job_throughput history", e)
+
+    throughput_report = dict()
+    if throughputs:
+        from throughput import throughput_trend
+    for server in throughputs:
+        window, jobs = throughputs[server]['window'], throughputs[server]['jobs']
+        report_jobs = dict()
+        for job in sorted(jobs, key=lambda job: jobs[job]['duration'], reverse=True)[:THROUGHPUT_TOP]:
+            trend = throughput_trend(jobs[job]['throughput'], throughput_history.get((server, job)))
+            report_jobs[job] = {
+                'start_date': format_datetime(jobs[job]['start']),
+                'end_date': format_datetime(jobs[job]['end']),
+                'duration': duration(jobs[job]['start'], jobs[job]['end']),
+                'sessions': jobs[job]['sessions'],
+                'processed': sizeof_fmt(jobs[job]['processed']),
+                'throughput': sizeof_fmt(jobs[job]['throughput'], 'B/s'),
+                'trend': trend,
+                'trend_color': 'bg-warning' if trend is not None and trend <= -THROUGHPUT_DEGRADATION else '',
+                'slowest_vm': jobs[job]['slowest_vm'],
+                'slowest_vm_throughput': sizeof_fmt(jobs[job]['slowest_vm_throughput'], 'B/s') if jobs[job]['slowest_vm'] else ''
+            }
+        throughput_report[server] = {
+            'window': {
+                'start_date': format_datetime(window['start']),
+                'end_date': format_datetime(window['end']),
+                'duration': duration(window['start'], window['end']),
+                'critical_job': window['critical_job']
+            },
+            'jobs': report_jobs
+        }
+
+    # Compare the failed and in progress sessions to those of the previous run of each server
+    changes = {'new': [], 'persistent': [], 'resolved': []}
+    current_failures = index_failures(sessions_failed, 'failed')
+    current_failures.update(index_failures(sessions_in_progress, 'in_progress'))
+    try:
+        changes = track_failures(conn.cursor(), sql_select_failure_state, sql_delete_failure_state, sql_insert_failure_state,
+                                 current_failures, list(server_infos), id_pipeline, begin)
+        conn.commit()
+        logging.info(f'Changes since last run : new = {len(changes["new"])}, persistent = {len(changes["persistent"])}, resolved = {len(changes["resolved"])}')
+    except Exception as e:
+        errors.add("failure state", e)
+
+    if errors.count:
+        logging.warning(f'{errors.count} errors during the report preparation, {errors.report()} events sent to Sentry')
+
+    # Show since when each session is failing or in progress
+    for session in changes['new'] + changes['persistent']:
+        sessions = sessions_failed if session['kind'] == 'failed' else sessions_in_progress
+        sessions[session['server']][session['job']][session['vm']]['since'] = session['since']
+
+    # Group the failures of all servers by cause, the sessions of the top causes refer to them in the report
+    failure_causes = cluster_failures(sessions_failed, FAILURE_CAUSES_TOP)
+    logging.info(f'Top failure causes : {[cause["count"] for cause in failure_causes]}')
+
+    # Define the default folder for Jinja2 files
+    from jinja2 import Environment, FileSystemLoader
+    file_loader = FileSystemLoader(scriptPath + '/jinja')
+    env = Environment(loader=file_loader)
+
+    # Render the report from the per-server fragments
+    fragment_cache = dict()
+    fragment_cache_dir = path.join(ARTIFACT_CACHE_DIR, 'fragments') if ARTIFACT_CACHE_DIR else None
+    report_parts = dict()
+    html = render_report(
+        env,
+        fragment_cache,
+        list(server_infos),
+        today=format_datetime_title(begin),
+        stats=stats,
+        tapes=sessions_tape,
+        in_progress=sessions_in_progress,
+        failed=sessions_failed,
+        repositories=repositories,
+        server_infos=server_infos,
+        cache_dir=fragment_cache_dir,
+        parts=report_parts,
+        causes=failure_causes,
+        compliance=compliance,
+        unprotected=unprotected,
+        missed=missed,
+        tape_media=tape_media,
+        loads=loads,
+        throughputs=throughput_report,
+        changes=changes,
+        changes_max_rows=CHANGES_MAX_ROWS,
+        version=artifact_cache_version
     )
 
-    # Define the sender of the mail
-    msg['From'] = 'morning-check-backup@ablondel.lycee'
+    # Write the rendered template to a file
+    write_atomic('artifacts/output.html', html)
+
+    # Render the report of each server group from the same model, reusing the fragments of its servers
+    reports = [{'group': None, 'servers': list(server_infos), 'stats': stats, 'causes': failure_causes, 'html': html,
+                'recipients': [recipient.strip() for recipient in MAIL_TO.split(',')]}]
+    for group, servers in group_servers(server_groups, server_infos).items():
+        if not servers:
+            continue
+        report = {'group': group, 'servers': servers, 'stats': group_stats(server_infos, servers),
+                  'causes': filter_causes(failure_causes, servers), 'recipients': server_groups[group].get('recipients', [])}
+        summarize_stats(report['stats'])
+        report['html'] = render_report(
+            env,
+            fragment_cache,
+            servers,
+            today=format_datetime_title(begin),
+            stats=report['stats'],
+            tapes=sessions_tape,
+            in_progress=sessions_in_progress,
+            failed=sessions_failed,
+            repositories=repositories,
+            server_infos=server_infos,
+            cache_dir=fragment_cache_dir,
+            causes=report['causes'],
+            compliance=compliance,
+            unprotected=unprotected,
+            missed=missed,
+            tape_media=tape_media,
+            loads=loads,
+            throughputs=throughput_report,
+            changes=changes,
+            changes_max_rows=CHANGES_MAX_ROWS,
+            version=artifact_cache_version
+        )
+        write_atomic('artifacts/output_{}.html'.format(re.sub(r'[^\w.-]', '_', group)), report['html'])
+        reports.append(report)
+
+    prune_fragment_cache(fragment_cache, fragment_cache_dir)
+    logging.info(f'{len(reports)} reports rendered from {len(fragment_cache)} fragments')
+
+    # Write the report model for the report service
+    write_atomic('artifacts/output.json', json.dumps({
+        'id_pipeline': CI_PIPELINE_ID,
+        'creation_time': begin,
+        'stats': stats,
+        'server_infos': server_infos,
+        'tapes': sessions_tape,
+        'in_progress': sessions_in_progress,
+        'failed': sessions_failed,
+        'repositories': repositories,
+        'capacity': capacities,
+        'compliance': compliance,
+        'unprotected': unprotected,
+        'missed': missed,
+        'tape_media': tape_media,
+        'load': loads,
+        'throughput': throughputs,
+        'changes': changes,
+        'failure_causes': failure_causes,
+        'parts': report_parts
+    }, cls=CustomJSONEncoder))
+
+    delta = datetime.now() - begin
+
+    # Send the rendered template by mail
+    mailer = None
+    if getenv('DISABLE_MAIL') != '1':
+        from common.mail import MailSender
+        mailer = MailSender(MAIL_RELAY, MAIL_PORT, timeout=MAIL_TIMEOUT, retries=MAIL_RETRIES)
+
+        for report in reports:
+            if not report['recipients']:
+                continue
+            name = report['group'] or 'all servers'
+
+            # The body and the attachment both hold the full report encoded in base64,
+            # above the budget a summary is sent instead
+            compact = MAIL_MODE == 'compact' or (MAIL_MODE == 'auto' and 2 * len(report['html'].encode('utf-8')) * 4 / 3 > MAIL_SIZE_BUDGET)
+            compact_html = None
+            if compact:
+                compact_html = render_compact_report(
+                    env, format_datetime_title(begin), report['stats'],
+                    {server: sessions_failed[server] for server in report['servers'] if server in sessions_failed},
+                    {server: repositories[server] for server in report['servers'] if server in repositories},
+                    {server: server_infos[server] for server in report['servers']},
+                    report['causes'], MAIL_MAX_ROWS, REPORT_URL, filter_changes(changes, report['servers']))
+
+            msg = build_mail(mail_subject(report['stats'], report['group']), MAIL_FROM, report['recipients'], report['html'], compact_html)
+            logging.info(f'Mail {name} {"compact" if compact else "full"} : report {len(report["html"])} bytes (budget {MAIL_SIZE_BUDGET})')
+            mailer.send(msg)
+
+    logging.info(f'Total execution time : {str(delta.total_seconds())}')
+
+    # Send statistics
+    if getenv('DISABLE_INFLUXDB') != '1':
+        logging.info('Sending stats/metrics to InfluxDB')
+        from common.metrics import MetricsBuilder
+
+        influx_data = MetricsBuilder({'job': getenv('CI_JOB_NAME'), 'type': 'process'})
+
+        # Add execution_time metric
+        influx_data.add('execution_time', {'value': delta.total_seconds()})
+
+        # Add artifact cache metrics
+        if ARTIFACT_CACHE_DIR:
+            influx_data.add('artifact_cache', {'hits': cache_hits, 'misses': cache_misses, 'hit_rate': cache_hit_rate})
+
+        # Add backups and tapes statistics
+        for stats_type in ['backup', 'tape']:
+            influx_data.add(stats_type, {
+                key: stats[stats_type][key] for key in ['success', 'warning', 'failed', 'running', 'pending', 'undefined', 'sessions']
+            })
+
+        # Add the global and per server RPO compliance
+        influx_data.add('compliance', stats['compliance'])
+        influx_data.add('unprotected', {'value': stats['unprotected']})
+        influx_data.add('missed_runs', stats['missed'])
+        influx_data.add('tape_media', stats['tape_media'])
+        for server in server_infos:
+            if (server_infos[server].get('stats') or {}).get('compliance'):
+                influx_data.add('compliance', server_infos[server]['stats']['compliance'], server=server)
+            if (server_infos[server].get('stats') or {}).get('missed'):
+                influx_data.add('missed_runs', server_infos[server]['stats']['missed'], server=server)
+            if (server_infos[server].get('stats') or {}).get('tape_media'):
+                influx_data.add('tape_media', server_infos[server]['stats']['tape_media'], server=server)
+
+        # Add the changes since the last run
+        influx_data.add('failure_changes', {status: len(changes[status]) for status in changes})
+
+        # Add the backup window of the servers and the throughput of their jobs
+        for server in throughputs:
+            influx_data.add('backup_window', {'duration': throughputs[server]['window']['duration']}, server=server)
+            for job, job_stats in throughputs[server]['jobs'].items():
+                influx_data.add('job_throughput', {key: job_stats[key] for key in ['throughput', 'processed', 'transferred', 'duration']},
+                                server=server, veeam_job=job)
+
+        # Send to InfluxDB in the background
+        for line in influx_data.build():
+            metrics.add(line)
+
+    # Flush the remaining metrics, spooling them if InfluxDB is unreachable
+    if metrics:
+        metrics.close()
+
+    # Wait for the mails sent in the background
+    if mailer:
+        mailer.close(MAIL_SEND_TIMEOUT)
+        if mailer.failed or mailer.queue.qsize():
+            logging.error('Unable to send the report by mail')
+            sentry_sdk.capture_message(f'Unable to send {mailer.failed + mailer.queue.qsize()} report mails')
+
+    # Flush Sentry SDK queue if needed
+    sentry_sdk.flush(SENTRY_FLUSH_TIMEOUT)
 
-    # Define the recipient(s) of the mail
-    msg['To'] = 'FR-infra-stockage@ablondel.lycee'
-
-    # Add HTML body
-    part1 = MIMEText(html, 'html')
-    msg.attach(part1)
+    logging.info('Script end')
 
-    # Add HTML attachment
-    attachment = MIMEApplication(html, Name='Morning check backup.html')
-    attachment['Content-Disposition'] = 'attachment; filename="Morning check backup.html"'
-    msg.attach(attachment)
 
-    logging.info(f'Sending mail to {msg["To"].split(",")}')
-    # Send the mail via internal Claranet' SMTP relay
-    with SMTP('smtp-relay-interne.lycee.fr.arno.net') as s:
-        s.sendmail(msg['From'], msg['To'].split(','), msg.as_string())
-
-logging.info(f'Total execution time : {str(delta.total_seconds())}')
-
-# Send statistics
-if getenv('DISABLE_INFLUXDB') != '1':
-    logging.info('Sending stats/metrics to InfluxDB')
-
-    # Create InfluxDB client instance
-    client = InfluxDBClient(host='server.adm.fr.arno.net', port=8086)
-
-    # Define InfluxDB templates
-    template_influx = '{},job=%s,type=process value={}' % getenv('CI_JOB_NAME')
-    template_influx_stats = '{},job=%s,type=process success={},warning={},failed={},running={},pending={},undefined={},sessions={}' % getenv('CI_JOB_NAME')
-
-    influx_data = []
-
-    # Add execution_time metric
-    influx_data.append(template_influx.format('execution_time', delta.total_seconds()))
-
-    # Add backups statistics
-    influx_data.append(template_influx_stats.format(
-        'backup',
-        stats['backup']['success'],
-        stats['backup']['warning'],
-        stats['backup']['failed'],
-        stats['backup']['running'],
-        stats['backup']['pending'],
-        stats['backup']['undefined'],
-        stats['backup']['sessions'],
-    ))
-
-    # Add tapes statistics
-    influx_data.append(template_influx_stats.format(
-        'tape',
-        stats['tape']['success'],
-        stats['tape']['warning'],
-        stats['tape']['failed'],
-        stats['tape']['running'],
-        stats['tape']['pending'],
-        stats['tape']['undefined'],
-        stats['tape']['sessions'],
-    ))
-
-    # Send to InfluxDB
-    client.write_points(influx_data, database='morning_check_backup', time_precision='ms', batch_size=10000, protocol='line')
-
-# Flush Sentry SDK queue if needed
-sentry_sdk.flush(120)
-
-logging.info('Script end')
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+from datetime import datetime, timedelta
+from typing import Union
+
+
+def load_sla_policies(file: Union[str, None], default: Union[float, None] = 24) -> dict:
+    """ Load the RPO policies in hours of the jobs (regex) and of the server tags
+        Example : {"default": 24, "jobs": {"^TAPE-": 168}, "tags": {"sante": 12}} """
+
+    policies = {'default': default, 'jobs': dict(), 'tags': dict()}
+    if file:
+        with open(file) as f:
+            policies.update(json.load(f))
+    return policies
+
+
+def rpo_policy(policies: dict, job: str, tags: list) -> Union[float, None]:
+    """ Return the RPO in hours of a job : the first job policy matching
+        its name, else the strictest policy of the tags, else the default """
+
+    for pattern, rpo in policies.get('jobs', {}).items():
+        if re.search(pattern, job or '', re.IGNORECASE):
+            return rpo
+    tag_rpos = [policies['tags'][tag] for tag in tags if tag in policies.get('tags', {})]
+    if tag_rpos:
+        return min(tag_rpos)
+    return policies.get('default')
+
+
+def rpo_compliance(objects: dict, now: datetime, policies: dict, tags: list, max_breaches: int = 500) -> tuple:
+    """ Check the age of the last restore point of every protected object
+        against the RPO of its job
+
+        objects maps (job_name, object_name) to (type, last_point_success),
+        the last restore point of the object in the backups of the job.
+        The cutoff date of each job is computed once, so that each object is
+        checked by a single comparison. An object without restore point is
+        in breach. Return the stats and the max_breaches oldest breaches
+        grouped by job and object """
+
+    cutoffs = dict()
+    stats = {'objects': 0, 'compliant': 0, 'breached': 0}
+    breached = []
+    for (job, vm), (job_type, last_point_success) in objects.items():
+        if job not in cutoffs:
+            rpo = rpo_policy(policies, job, tags)
+            cutoffs[job] = (rpo, now - timedelta(hours=rpo) if rpo is not None else None)
+        rpo, cutoff = cutoffs[job]
+        if cutoff is None:
+            continue
+        stats['objects'] += 1
+        if last_point_success is None or last_point_success < cutoff:
+            stats['breached'] += 1
+            breached.append((last_point_success or datetime.min, job, vm, job_type, last_point_success, rpo))
+        else:
+            stats['compliant'] += 1
+    stats['percent'] = round(stats['compliant'] * 100 / stats['objects'], 2) if stats['objects'] else 100
+
+    breaches = dict()
+    for sort_key, job, vm, job_type, last_point_success, rpo in sorted(breached, key=lambda breach: breach[0])[:max_breaches]:
+        breaches.setdefault(job, dict())[vm] = {'job_name': job, 'object_name': vm, 'type': job_type,
+                                                'last_point_success': last_point_success, 'rpo': rpo}
+    return stats, breaches
+
+
+def unprotected_objects(inventory: dict, *covered: set) -> set:
+    """ Return the ids of the inventory covered by none of the sets of ids """
+
+    return inventory.keys() - set().union(*covered)
@@ -1,21 +1,31 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from os import getenv, path
-from sys import exit, argv
+from os import fsync, getenv, path, remove, replace
+from sys import exit, argv, stdout, path as sys_path
 import json
 from uuid import UUID
+from time import sleep
+from typing import Callable
+from threading import local
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 from hashlib import md5
 from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
 
 import xml.etree.ElementTree as ET
 import re
 import logging
-import pyodbc
-import sentry_sdk
-import hvac
-from influxdb import InfluxDBClient
+
+from compliance import load_sla_policies, rpo_compliance, unprotected_objects
+from resource_load import add_session_load, summarize_load
+from tape_media import tape_pools
+from schedule import cached_schedule, expand_runs, missed_runs, load_schedule_cache, save_schedule_cache
+
+# Modules shared between the crawler and the worker, imported when needed
+sys_path.append(path.join(path.dirname(path.realpath(__file__)), '..'))
 
 
 def before_send(event: dict, hint: dict) -> dict:
@@ -130,6 +140,269 @@ def job_options_analysis(xml: str) -> tuple:
     return ret_RetainDays, ret_RetainCycles, ret_EnableDeletedVmDataRetention
 
 
+def mssql_connect(address: str, port: str, database: str, username: str, password: str):
+    """ Connect to the Veeam MSSQL database """
+
+    import pyodbc
+    return pyodbc.connect(
+        Driver='{ODBC Driver 17 for SQL Server}',
+        Server=f'{address},{port}',
+        Database=database,
+        UID=username,
+        PWD=password)
+
+
+def fetch_backup_sessions(connect: Callable, sql_template: str, start: datetime, end: datetime, chunk: timedelta,
+                          target: float, workers: int = 1, retries: int = 2, params: tuple = ()):
+    """ Yield the backup sessions of [start, end[ in chronological order
+
+        The query is formatted with the bounds of the sub-window followed by params
+
+        The window is fetched by sub-windows which shrink after a chunk slower
+        than target seconds and grow after a chunk faster than target / 2.
+        With workers > 1 the sub-windows are fetched in parallel waves, each
+        worker using its own connection. A failed sub-window is fetched again
+        by halves, without fetching the completed sub-windows again """
+
+    import pyodbc
+
+    min_chunk = timedelta(minutes=15)
+    connections = []
+    thread_data = local()
+
+    def fetch(window_start: datetime, window_end: datetime, retries: int) -> list:
+        if getattr(thread_data, 'conn', None) is None:
+            thread_data.conn = connect()
+            connections.append(thread_data.conn)
+        try:
+            cursor = thread_data.conn.cursor()
+            cursor.execute(sql_template.format(window_start.strftime('%Y-%m-%d %H:%M:%S'), window_end.strftime('%Y-%m-%d %H:%M:%S'), *params))
+            return cursor.fetchall()
+        except pyodbc.Error as e:
+            # Reconnect for the next attempt in case the connection is lost
+            thread_data.conn = None
+            if retries <= 0 or window_end - window_start <= min_chunk:
+                raise
+            logging.warning(f'Backup sessions chunk {window_start} - {window_end} failed, fetching it by halves : {e}')
+            middle = window_start + (window_end - window_start) / 2
+            return fetch(window_start, middle, retries - 1) + fetch(middle, window_end, retries - 1)
+
+    def timed_fetch(window_start: datetime, window_end: datetime) -> tuple:
+        chunk_begin = datetime.now()
+        rows = fetch(window_start, window_end, retries)
+        return rows, (datetime.now() - chunk_begin).total_seconds()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            window_start = start
+            while window_start < end:
+                windows = []
+                while window_start < end and len(windows) < workers:
+                    windows.append((window_start, min(window_start + chunk, end)))
+                    window_start = windows[-1][1]
+
+                futures = [executor.submit(timed_fetch, *window) for window in windows]
+
+                # Yield in chronological order so that the latest session of a VM wins
+                slowest = 0
+                for window, future in zip(windows, futures):
+                    rows, elapsed = future.result()
+                    slowest = max(slowest, elapsed)
+                    logging.info(f'Backup sessions chunk {window[0]} - {window[1]} : {len(rows)} sessions in {elapsed:.1f}s')
+                    yield from rows
+
+                if slowest > target:
+                    chunk = max(chunk / 2, min_chunk)
+                elif slowest < target / 2:
+                    chunk = min(chunk * 2, end - start)
+    finally:
+        for conn in connections:
+            try:
+                conn.close()
+            except pyodbc.Error:
+                pass
+
+
+class CheckpointJSONEncoder(json.JSONEncoder):
+    """ Serialize the datetimes of the crawl state tagged, so that
+        checkpoint_object restores them """
+
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return {'__datetime__': obj.isoformat()}
+        if isinstance(obj, UUID):
+            return str(obj)
+        return json.JSONEncoder.default(self, obj)
+
+
+def checkpoint_object(obj: dict):
+    """ Restore the datetimes tagged by CheckpointJSONEncoder """
+
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def save_checkpoint(file: str, state: dict) -> None:
+    """ Atomically write the crawl state so that a retry can resume from it
+
+        The sessions sizes, object ids and resource intervals only grow, the
+        ones collected since the previous checkpoint are appended to the
+        journal file + '.journal' and the checkpoint keeps the journal size.
+        The protected objects keyed by (job, VM) are converted to lists, JSON
+        has no tuple keys """
+
+    journaled = state.setdefault('journaled', {'offset': 0, 'sizes': 0, 'ids': set(), 'intervals': dict()})
+    delta = {
+        'sessions_sizes': state['sessions_sizes'][journaled['sizes']:],
+        'session_object_ids': sorted(state['session_object_ids'] - journaled['ids']),
+        'intervals': dict()
+    }
+    for resource, loads in state['resource_loads'].items():
+        for name, load in loads.items():
+            count = journaled['intervals'].get((resource, name), 0)
+            if len(load['intervals']) > count:
+                delta['intervals'].setdefault(resource, dict())[name] = load['intervals'][count:]
+
+    # A new crawl starts a new journal, a resumed one continues it after the
+    # deltas of its checkpoint
+    with open(file + '.journal', 'r+b' if journaled['offset'] else 'wb') as f:
+        f.seek(journaled['offset'])
+        f.truncate()
+        f.write(json.dumps(delta, cls=CheckpointJSONEncoder).encode('utf-8') + b'\n')
+        f.flush()
+        fsync(f.fileno())
+        journaled['offset'] = f.tell()
+    journaled['sizes'] = len(state['sessions_sizes'])
+    journaled['ids'].update(delta['session_object_ids'])
+    for resource, loads in delta['intervals'].items():
+        for name, intervals in loads.items():
+            journaled['intervals'][(resource, name)] = journaled['intervals'].get((resource, name), 0) + len(intervals)
+
+    state['saved'] = datetime.now()
+    serialized = {key: value for key, value in state.items() if key not in ['journaled', 'sessions_sizes', 'session_object_ids']}
+    serialized['journal_offset'] = journaled['offset']
+    serialized['protected_objects'] = [[job, vm, protected] for (job, vm), protected in state['protected_objects'].items()]
+    serialized['resource_loads'] = {
+        resource: {name: {key: value for key, value in load.items() if key != 'intervals'} for name, load in loads.items()}
+        for resource, loads in state['resource_loads'].items()
+    }
+    with open(file + '.tmp', 'w') as f:
+        json.dump(serialized, f, cls=CheckpointJSONEncoder)
+    replace(file + '.tmp', file)
+    logging.info(f'Checkpoint saved : stage={state.get("stage")}, resume_from={state.get("resume_from")}')
+
+
+def load_checkpoint(file: str, pipeline_id: str, server_name: str, max_age: int) -> dict:
+    """ Return the crawl state saved by an interrupted attempt of the same
+        pipeline and server, or an empty dict if there is nothing to resume
+
+        The journal is replayed up to the size kept by the checkpoint, the
+        deltas appended afterwards belong to sessions the retry reads again """
+
+    if not path.isfile(file):
+        return dict()
+    try:
+        with open(file) as f:
+            state = json.load(f, object_hook=checkpoint_object)
+        state['protected_objects'] = {(job, vm): tuple(protected) for job, vm, protected in state.get('protected_objects', [])}
+        state['sessions_sizes'] = []
+        state['session_object_ids'] = set()
+        resource_loads = state.setdefault('resource_loads', {'proxies': dict(), 'guest_proxies': dict(), 'datastores': dict()})
+        for loads in resource_loads.values():
+            for load in loads.values():
+                load['intervals'] = []
+
+        offset = state.pop('journal_offset', 0)
+        if offset:
+            with open(file + '.journal', 'rb') as f:
+                journal = f.read(offset)
+            if len(journal) < offset:
+                raise ValueError(f'journal truncated at {len(journal)} of {offset} bytes')
+            for line in journal.decode('utf-8').splitlines():
+                delta = json.loads(line, object_hook=checkpoint_object)
+                state['sessions_sizes'].extend(delta['sessions_sizes'])
+                state['session_object_ids'].update(delta['session_object_ids'])
+                for resource, loads in delta['intervals'].items():
+                    for name, intervals in loads.items():
+                        resource_loads[resource][name]['intervals'].extend(tuple(interval) for interval in intervals)
+
+        state['journaled'] = {
+            'offset': offset,
+            'sizes': len(state['sessions_sizes']),
+            'ids': set(state['session_object_ids']),
+            'intervals': {(resource, name): len(load['intervals']) for resource, loads in resource_loads.items() for name, load in loads.items()}
+        }
+    except Exception as e:
+        logging.warning(f'Unable to read the checkpoint {file} : {e}')
+        return dict()
+
+    if state.get('pipeline_id') != pipeline_id or state.get('server_name') != server_name:
+        logging.info(f'Ignoring the checkpoint {file} of another pipeline or server')
+        return dict()
+    if datetime.now() - state.get('saved', datetime.min) > timedelta(seconds=max_age):
+        logging.info(f'Ignoring the checkpoint {file} older than {max_age}s')
+        return dict()
+    return state
+
+
+def session_event(event: str, session) -> dict:
+    """ Build a change feed event from a task session row """
+
+    return {
+        'event': event,
+        'time': datetime.now(),
+        'job_name': session.job_name,
+        'job_id': session.job_id,
+        'object_name': session.object_name.upper() if session.object_name else None,
+        'object_id': session.object_id,
+        'session_id': session.session_id,
+        'backup_status': session.status,
+        'backup_status_details': backup_status_mapping(session.status),
+        'start_date': session.creation_time,
+        'end_date': session.end_time,
+        'reason': session.reason
+    }
+
+
+def watch_in_progress(conn, sql_in_progress: str, sql_sessions_by_id: str, interval: int, duration: int, output) -> None:
+    """ Poll the idle, running and pending task sessions and write their
+        changes (started, progressed, finished, failed) as newline-delimited JSON
+        Stop after duration seconds, or when nothing is in progress if duration is 0 """
+
+    def emit(event, session):
+        output.write(json.dumps(session_event(event, session), cls=CustomJSONEncoder) + '\n')
+        output.flush()
+
+    cursor = conn.cursor()
+    tracked = dict()
+    end = datetime.now() + timedelta(seconds=duration) if duration else None
+
+    while True:
+        cursor.execute(sql_in_progress)
+        current = {session.id: session for session in cursor.fetchall()}
+
+        for session_id, session in current.items():
+            if session_id not in tracked:
+                emit('started', session)
+            elif tracked[session_id] != (session.status, session.log_size):
+                emit('progressed', session)
+
+        # Sessions no longer in progress are done, retrieve their final status
+        done = [session_id for session_id in tracked if session_id not in current]
+        for i in range(0, len(done), 1000):
+            chunk = done[i:i + 1000]
+            cursor.execute(sql_sessions_by_id.format(', '.join(['?'] * len(chunk))), chunk)
+            for session in cursor.fetchall():
+                emit('failed' if session.status == 2 else 'finished', session)
+
+        tracked = {session_id: (session.status, session.log_size) for session_id, session in current.items()}
+
+        if (end and datetime.now() >= end) or (not end and not tracked):
+            break
+        sleep(interval)
+
+
 # Add capabilities to JSON serialize UUID and datetime objects
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -143,452 +416,788 @@ class CustomJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-# Define logger format
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s : %(lineno)d : %(levelname)s : %(module)s : %(funcName)s : %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-
-# Main
-
-# Initialize Sentry SDK
-logging.info('Initialize Sentry SDK')
-
-if not getenv('SENTRY_DSN'):
-    logging.error('Environment variable SENTRY_DSN is not defined')
-    exit(1)
-
-sentry_sdk.init(
-    getenv('SENTRY_DSN'),
-    before_send=before_send,
-    transport_queue_size=10000
-)
-
-# Global Variables
-begin = datetime.now()
-scriptPath = path.dirname(path.realpath(__file__))
-OUTFILE = 'artifacts/' + getenv('CI_JOB_NAME') + '.json'
-
-SERVER_NAME = getenv('SERVER_NAME')
-DATABASE_ADDRESS = getenv('DATABASE_ADDRESS')
-DATABASE_PORT = getenv('DATABASE_PORT')
-DATABASE_NAME = getenv('DATABASE_NAME')
-
-START_DATE = datetime.strftime(datetime.today() - timedelta(days=1), '%Y-%m-%d %H:%M:%S')
-END_DATE = datetime.strftime(datetime.today(), '%Y-%m-%d %H:%M:%S')
-
-sessions_tape = dict()
-sessions_in_progress = dict()
-sessions_failed = dict()
-repositories = dict()
-output = dict()
-
-stats = {
-    'backup': {
-        'sessions': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
-    },
-    'tape': {
-        'sessions': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
-    },
-    'repositories': 0
-}
-
-# Get SQL queries
-sql_tapes = open(scriptPath + '/sql/tapes.sql', 'r').read()
-sql_backups = open(scriptPath + '/sql/backups.sql', 'r').read().format(START_DATE, END_DATE)
-sql_repositories = open(scriptPath + '/sql/repositories.sql', 'r').read()
-
-# Retrieve credentials from Vault or read them from env vars
-if getenv('VAULT_ADDR'):
-    # Vérification des variable d'environnement
-    for var in ['VAULT_ADDR', 'VAULT_TOKEN', 'VAULT_CREDENTIALS_PATH',
-                'SERVER_NAME', 'DATABASE_ADDRESS', 'DATABASE_PORT',
-                'DATABASE_NAME']:
-        if not getenv(var):
-            raise Exception(f'Required environment variable {var} is not defined')
-    # Objet hvac.Client avec les valeurs des variables d'environnement.
-    vault = hvac.Client(token=getenv('VAULT_TOKEN'),
-                        url=getenv('VAULT_ADDR'))
-
-    vault_res = vault.is_authenticated()
-    logging.info('Vault auth res  : ' + str(vault_res))
-    read_secret_veeam_result = vault.read(getenv('VAULT_CREDENTIALS_PATH'))
-    # Test de présence dans Vault des information de connexion de la base de donnée
-    if read_secret_veeam_result['data']['data']:
-        veeam_credentials = read_secret_veeam_result['data']['data']
+def main() -> None:
+    """ Crawl the Veeam database and write the artifact of SERVER_NAME """
+
+    # Define logger format
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s : %(lineno)d : %(levelname)s : %(module)s : %(funcName)s : %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    # Main
+
+    # Initialize Sentry SDK
+    logging.info('Initialize Sentry SDK')
+
+    if not getenv('SENTRY_DSN'):
+        logging.error('Environment variable SENTRY_DSN is not defined')
+        exit(1)
+
+    import sentry_sdk
+    sentry_sdk.init(
+        getenv('SENTRY_DSN'),
+        before_send=before_send,
+        transport_queue_size=10000
+    )
+
+    # Global Variables
+    begin = datetime.now()
+    scriptPath = path.dirname(path.realpath(__file__))
+    OUTFILE = 'artifacts/' + getenv('CI_JOB_NAME') + '.json'
+
+    SERVER_NAME = getenv('SERVER_NAME')
+    # Comma separated tags used by the worker to group the servers in reports
+    SERVER_TAGS = [tag.strip() for tag in getenv('SERVER_TAGS', '').split(',') if tag.strip()]
+    DATABASE_ADDRESS = getenv('DATABASE_ADDRESS')
+    DATABASE_PORT = getenv('DATABASE_PORT')
+    DATABASE_NAME = getenv('DATABASE_NAME')
+
+    INFLUXDB_URL = getenv('INFLUXDB_URL', 'http://server.adm.fr.arno.net:8086')
+    INFLUXDB_DATABASE = getenv('INFLUXDB_DATABASE', 'morning_check_backup')
+    METRICS_SPOOL_DIR = getenv('METRICS_SPOOL_DIR')
+    METRICS_MAX_SERIES = int(getenv('METRICS_MAX_SERIES', '1000'))
+    WATCH_INTERVAL = int(getenv('WATCH_INTERVAL', '60'))
+    WATCH_DURATION = int(getenv('WATCH_DURATION', '0'))
+    WATCH_OUTPUT = getenv('WATCH_OUTPUT')
+    CHECKPOINT_FILE = getenv('CHECKPOINT_FILE', 'artifacts/' + getenv('CI_JOB_NAME') + '.checkpoint')
+    CHECKPOINT_INTERVAL = int(getenv('CHECKPOINT_INTERVAL', '60'))
+    CHECKPOINT_MAX_AGE = int(getenv('CHECKPOINT_MAX_AGE', '21600'))
+
+    END_DATETIME = datetime.today()
+    START_DATETIME = END_DATETIME - timedelta(days=1)
+    START_DATE = datetime.strftime(START_DATETIME, '%Y-%m-%d %H:%M:%S')
+    END_DATE = datetime.strftime(END_DATETIME, '%Y-%m-%d %H:%M:%S')
+
+    # Adaptive time windows of the backups query
+    BACKUP_CHUNK_HOURS = float(getenv('BACKUP_CHUNK_HOURS', '6'))
+    BACKUP_CHUNK_TARGET = float(getenv('BACKUP_CHUNK_TARGET', '60'))
+    BACKUP_CHUNK_WORKERS = int(getenv('BACKUP_CHUNK_WORKERS', '1'))
+    BACKUP_CHUNK_RETRIES = int(getenv('BACKUP_CHUNK_RETRIES', '2'))
+    # Job types extracted by the backups query : Backup, Replica and Backup Copy
+    BACKUP_JOB_TYPES = ', '.join(str(int(job_type)) for job_type in getenv('BACKUP_JOB_TYPES', '0,1,51,63,65').split(','))
+
+    # RPO in hours of the objects, by default or by job and server tag policies
+    SLA_POLICIES_FILE = getenv('SLA_POLICIES_FILE')
+    SLA_RPO_HOURS = float(getenv('SLA_RPO_HOURS', '24'))
+    SLA_MAX_BREACHES = int(getenv('SLA_MAX_BREACHES', '500'))
+    # A VM without restore point since INVENTORY_DAYS and without job is unprotected
+    INVENTORY_DAYS = int(getenv('INVENTORY_DAYS', '7'))
+    # A custom pool with less scratch tapes in its library than TAPE_MIN_SCRATCH is low
+    TAPE_MIN_SCRATCH = int(getenv('TAPE_MIN_SCRATCH', '5'))
+    TAPE_CUSTOM_POOL_TYPES = tuple(int(pool_type) for pool_type in getenv('TAPE_CUSTOM_POOL_TYPES', '5').split(','))
+    TAPE_EXPIRING_DAYS = int(getenv('TAPE_EXPIRING_DAYS', '7'))
+    # A scheduled run without job session started from MISSED_RUN_EARLY minutes before to MISSED_RUN_TOLERANCE minutes after it is missed
+    MISSED_RUN_TOLERANCE = timedelta(minutes=float(getenv('MISSED_RUN_TOLERANCE', '60')))
+    MISSED_RUN_EARLY = timedelta(minutes=float(getenv('MISSED_RUN_EARLY', '5')))
+    # Timezone of the schedules and of the job sessions (Example : Europe/Paris), the local timezone by default
+    SCHEDULE_TIMEZONE = ZoneInfo(getenv('SCHEDULE_TIMEZONE')) if getenv('SCHEDULE_TIMEZONE') else None
+    MISSED_RUNS_MAX = int(getenv('MISSED_RUNS_MAX', '10'))
+    SCHEDULE_CACHE_FILE = getenv('SCHEDULE_CACHE_FILE')
+
+    sessions_tape = dict()
+    sessions_in_progress = dict()
+    sessions_failed = dict()
+    protected_objects = dict()
+    session_object_ids = set()
+    unprotected = dict()
+    missed = dict()
+    tape_media = dict()
+    # Sessions of each backup proxy, guest interaction proxy and datastore
+    resource_loads = {'proxies': dict(), 'guest_proxies': dict(), 'datastores': dict()}
+    # Times and sizes of all the task sessions for the throughput of the jobs
+    sessions_sizes = []
+    repositories = dict()
+    jobs_metrics = dict()
+    output = dict()
+
+    stats = {
+        'backup': {
+            'sessions': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
+        },
+        'tape': {
+            'sessions': 0, 'success': 0, 'warning': 0, 'failed': 0, 'running': 0, 'pending': 0, 'idle': 0, 'in_progress': 0, 'undefined': 0
+        },
+        'repositories': 0,
+        'types': dict()
+    }
+
+    # Resume from the checkpoint of an interrupted attempt of the same pipeline
+    resumed = load_checkpoint(CHECKPOINT_FILE, getenv('CI_PIPELINE_ID'), SERVER_NAME, CHECKPOINT_MAX_AGE)
+    resumed_stage = resumed.get('stage')
+    if resumed_stage:
+        logging.info('Resuming from checkpoint : stage={}, resume_from={}'.format(resumed_stage, resumed.get('resume_from')))
+        START_DATETIME = resumed['start']
+        END_DATETIME = resumed['end']
+        START_DATE = datetime.strftime(START_DATETIME, '%Y-%m-%d %H:%M:%S')
+        END_DATE = datetime.strftime(END_DATETIME, '%Y-%m-%d %H:%M:%S')
+        sessions_tape = resumed['sessions_tape']
+        sessions_in_progress = resumed['sessions_in_progress']
+        sessions_failed = resumed['sessions_failed']
+        jobs_metrics = resumed['jobs_metrics']
+        protected_objects = resumed.get('protected_objects', protected_objects)
+        session_object_ids = resumed.get('session_object_ids', session_object_ids)
+        resource_loads = resumed.get('resource_loads', resource_loads)
+        sessions_sizes = resumed.get('sessions_sizes', sessions_sizes)
+        stats = resumed['stats']
+        stats.setdefault('types', dict())
+
+    # The maps are referenced so that the checkpoint always holds their current state
+    checkpoint = {
+        'pipeline_id': getenv('CI_PIPELINE_ID'),
+        'server_name': SERVER_NAME,
+        'stage': resumed_stage,
+        'resume_from': resumed.get('resume_from'),
+        'start': START_DATETIME,
+        'end': END_DATETIME,
+        'sessions_tape': sessions_tape,
+        'sessions_in_progress': sessions_in_progress,
+        'sessions_failed': sessions_failed,
+        'jobs_metrics': jobs_metrics,
+        'protected_objects': protected_objects,
+        'session_object_ids': session_object_ids,
+        'resource_loads': resource_loads,
+        'sessions_sizes': sessions_sizes,
+        'stats': stats
+    }
+    if resumed_stage:
+        checkpoint['journaled'] = resumed['journaled']
+
+    # Get SQL queries
+    sql_tapes = open(scriptPath + '/sql/tapes.sql', 'r').read()
+    sql_backups = open(scriptPath + '/sql/backups.sql', 'r').read()
+    sql_repositories = open(scriptPath + '/sql/repositories.sql', 'r').read()
+    sql_in_progress = open(scriptPath + '/sql/in_progress.sql', 'r').read().format(BACKUP_JOB_TYPES)
+    sql_sessions_by_id = open(scriptPath + '/sql/sessions_by_id.sql', 'r').read()
+    sql_inventory = open(scriptPath + '/sql/inventory.sql', 'r').read()
+    sql_protected_objects = open(scriptPath + '/sql/protected_objects.sql', 'r').read()
+    sql_restore_points = open(scriptPath + '/sql/restore_points.sql', 'r').read().format(BACKUP_JOB_TYPES)
+    sql_tape_media = open(scriptPath + '/sql/tape_media.sql', 'r').read()
+    sql_jobs_schedule = open(scriptPath + '/sql/jobs_schedule.sql', 'r').read().format(BACKUP_JOB_TYPES)
+    sql_job_sessions = open(scriptPath + '/sql/job_sessions.sql', 'r').read()
+
+    # Retrieve credentials from Vault or read them from env vars
+    if getenv('VAULT_ADDR'):
+        import hvac
+
+        # Vérification des variable d'environnement
+        for var in ['VAULT_ADDR', 'VAULT_TOKEN', 'VAULT_CREDENTIALS_PATH',
+                    'SERVER_NAME', 'DATABASE_ADDRESS', 'DATABASE_PORT',
+                    'DATABASE_NAME']:
+            if not getenv(var):
+                raise Exception(f'Required environment variable {var} is not defined')
+        # Objet hvac.Client avec les valeurs des variables d'environnement.
+        vault = hvac.Client(token=getenv('VAULT_TOKEN'),
+                            url=getenv('VAULT_ADDR'))
+
+        vault_res = vault.is_authenticated()
+        logging.info('Vault auth res  : ' + str(vault_res))
+        read_secret_veeam_result = vault.read(getenv('VAULT_CREDENTIALS_PATH'))
+        # Test de présence dans Vault des information de connexion de la base de donnée
+        if read_secret_veeam_result['data']['data']:
+            veeam_credentials = read_secret_veeam_result['data']['data']
+        else:
+            raise Exception('Unable to retrieve Veeam MSSQL database credentials from Vault')
+
+        SQL_USERNAME = veeam_credentials.get('DB_USERNAME')
+        SQL_PASSWORD = veeam_credentials.get('DB_PASSWORD')
+    # Assignation des informations de connexions à la base de données en cas de lancement local
     else:
-        raise Exception('Unable to retrieve Veeam MSSQL database credentials from Vault')
-
-    SQL_USERNAME = veeam_credentials.get('DB_USERNAME')
-    SQL_PASSWORD = veeam_credentials.get('DB_PASSWORD')
-# Assignation des informations de connexions à la base de données en cas de lancement local
-else:
-    SQL_USERNAME = getenv('DB_USERNAME')
-    SQL_PASSWORD = getenv('DB_PASSWORD')
-
-logging.info('Script start : %s' % __file__)
-logging.info('Parameters : %s' % (', '.join(argv[1:]) or 'None'))
-logging.info('Output file : ' + OUTFILE)
-
-try:
-
-    # Connect to MSSQL server
-    with pyodbc.connect(
-            Driver='{ODBC Driver 17 for SQL Server}',
-            Server=f'{DATABASE_ADDRESS},{DATABASE_PORT}',
-            Database=DATABASE_NAME,
-            UID=SQL_USERNAME,
-            PWD=SQL_PASSWORD) as conn:
-
-        # TAPES
-        logging.info('Beginning of tape sessions extraction')
-
-        # Instantiate a new cursor
-        cursor = conn.cursor()
-
-        # Execute the SQL query
-        logging.info(sql_tapes)
-        cursor.execute(sql_tapes)
-
-        # Iterate tape sessions
-        for session in cursor:
-            backup_status_str = backup_status_mapping(session.result)
-
-            obj_dict = dict()
-            obj_dict['start_date'] = session.creation_time
-            obj_dict['end_date'] = session.end_time
-            obj_dict['backup_status'] = session.result
-            obj_dict['backup_status_details'] = backup_status_str
-            obj_dict['job_name'] = session.job_name
-            obj_dict['job_id'] = session.job_id
-            obj_dict['reason'] = session.reason
-            obj_dict['mediapool_name'] = session.mediapool_name
-
-            job_name = obj_dict['job_name']
-
-            # Only keep the last session of job_name
-            if sessions_tape.get(job_name):
-                if sessions_tape[job_name]['start_date'] < obj_dict['start_date']:
-                    sessions_tape[job_name] = obj_dict
-            else:
-                sessions_tape[job_name] = obj_dict
-
-        # Calculate stats
-        for job in sessions_tape:
-            session = sessions_tape.get(job)
-            stats['tape']['sessions'] += 1
-            if session.get('backup_status') == -1:
-                stats['tape']['idle'] += 1
-            elif session.get('backup_status') == 0:
-                stats['tape']['success'] += 1
-            elif session.get('backup_status') in [1, 3]:
-                stats['tape']['warning'] += 1
-            elif session.get('backup_status') == 2:
-                stats['tape']['failed'] += 1
-            elif session.get('backup_status') == 5:
-                stats['tape']['running'] += 1
-            elif session.get('backup_status') == 6:
-                stats['tape']['pending'] += 1
+        SQL_USERNAME = getenv('DB_USERNAME')
+        SQL_PASSWORD = getenv('DB_PASSWORD')
+
+    # Start the metrics exporter early so that it drains its spool during the crawl
+    metrics = None
+    if getenv('DISABLE_INFLUXDB') != '1':
+        from common.metrics import MetricsExporter
+        metrics = MetricsExporter(INFLUXDB_URL, INFLUXDB_DATABASE, spool_dir=METRICS_SPOOL_DIR)
+
+    logging.info('Script start : %s' % __file__)
+    logging.info('Parameters : %s' % (', '.join(argv[1:]) or 'None'))
+    logging.info('Output file : ' + OUTFILE)
+
+    # Watch mode : follow the in progress sessions instead of crawling
+    if '--watch' in argv[1:]:
+        logging.info(f'Watching in progress sessions every {WATCH_INTERVAL}s')
+        try:
+            # The output file is flushed and closed on exit, stdout is left open
+            with mssql_connect(DATABASE_ADDRESS, DATABASE_PORT, DATABASE_NAME, SQL_USERNAME, SQL_PASSWORD) as conn, \
+                    (open(WATCH_OUTPUT, 'a') if WATCH_OUTPUT else nullcontext(stdout)) as output_watch:
+                watch_in_progress(conn, sql_in_progress, sql_sessions_by_id, WATCH_INTERVAL, WATCH_DURATION, output_watch)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(e)
+            sentry_sdk.capture_exception(e)
+            exit(1)
+        if metrics:
+            metrics.close()
+        sentry_sdk.flush(120)
+        logging.info('Script end')
+        exit(0)
+
+    try:
+
+        # Connect to MSSQL server
+        with mssql_connect(DATABASE_ADDRESS, DATABASE_PORT, DATABASE_NAME, SQL_USERNAME, SQL_PASSWORD) as conn:
+
+            # TAPES
+            if resumed_stage:
+                logging.info('Tape sessions restored from the checkpoint')
             else:
-                stats['tape']['undefined'] += 1
-
-            # Setting end_date to None for in progress sessions and counting
-            if session.get('backup_status') in [-1, 5, 6]:
-                sessions_tape[job]['end_date'] = None
-                stats['tape']['in_progress'] += 1
-
-        logging.info('End of tape sessions extraction')
-
-        # BACKUP
-        logging.info('Beginning of backup sessions extraction : start={}, end={}'.format(START_DATE, END_DATE))
-
-        # Execute the SQL query
-        logging.info(sql_backups)
-        cursor.execute(sql_backups)
-
-        # Iterate backup sessions
-        for session in cursor:
-            stats['backup']['sessions'] += 1
-            backup_status_str = backup_status_mapping(session.status)
-
-            BTM, datastores, proxies, guest_proxies = session_log_analysis(session.log_xml)
-
-            RetainDays, RetainCycles, EnableDeletedVmDataRetention = job_options_analysis(session.options)
-
-            obj_dict = dict()
-            obj_dict['start_date'] = session.creation_time
-            obj_dict['end_date'] = session.end_time
-            obj_dict['session_id'] = session.session_id
-            obj_dict['orig_session_id'] = session.orig_session_id
-            obj_dict['backup_status'] = session.status
-            obj_dict['backup_status_details'] = backup_status_str
-            obj_dict['last_point_success'] = session.last_point_success
-            obj_dict['object_id'] = session.object_id
-            obj_dict['job_name'] = session.job_name
-            obj_dict['job_id'] = session.job_id
-            obj_dict['type'] = jobtype_mapping(session.job_type)
-            obj_dict['reason'] = session.reason
-            obj_dict['object_name'] = session.object_name.upper()
-            obj_dict['backup_transport_mode'] = BTM
-            obj_dict['target_storage'] = session.repository_name
-            obj_dict['proxies'] = ','.join(proxies)
-            obj_dict['nb_restore_points'] = session.nb_restore_points
-            obj_dict['retaindays'] = RetainDays
-            obj_dict['retaincycles'] = RetainCycles
-            obj_dict['retention_maintenance'] = EnableDeletedVmDataRetention
-
-            job_name = obj_dict['job_name']
-            job_id = obj_dict['job_id']
-            vm_name = obj_dict['object_name']
-
-            if session.status == 2:  # Status 2 = Failed
-                # Test if sessions_failed[job_name] is defined
-                if sessions_failed.get(job_name):
-                    # Test if sessions_failed[job_name][job_id] is defined
-                    if sessions_failed.get(job_name).get(job_id):
-                        # Test if sessions_failed[job_name][job_id][vm_name] is defined
-                        if sessions_failed.get(job_name).get(job_id).get(vm_name):
-                            # Compare if local obj_dict['start_date'] is the most recent
-                            if sessions_failed[job_name][job_id][vm_name]['start_date'] < obj_dict['start_date']:
+                logging.info('Beginning of tape sessions extraction')
+
+            # Instantiate a new cursor
+            cursor = conn.cursor()
+
+            if not resumed_stage:
+                # Execute the SQL query
+                logging.info(sql_tapes)
+                cursor.execute(sql_tapes)
+
+                # Iterate tape sessions
+                for session in cursor:
+                    backup_status_str = backup_status_mapping(session.result)
+
+                    obj_dict = dict()
+                    obj_dict['start_date'] = session.creation_time
+                    obj_dict['end_date'] = session.end_time
+                    obj_dict['backup_status'] = session.result
+                    obj_dict['backup_status_details'] = backup_status_str
+                    obj_dict['job_name'] = session.job_name
+                    obj_dict['job_id'] = session.job_id
+                    obj_dict['reason'] = session.reason
+                    obj_dict['mediapool_name'] = session.mediapool_name
+
+                    job_name = obj_dict['job_name']
+
+                    # Only keep the last session of job_name
+                    if sessions_tape.get(job_name):
+                        if sessions_tape[job_name]['start_date'] < obj_dict['start_date']:
+                            sessions_tape[job_name] = obj_dict
+                    else:
+                        sessions_tape[job_name] = obj_dict
+
+                # Calculate stats
+                for job in sessions_tape:
+                    session = sessions_tape.get(job)
+                    stats['tape']['sessions'] += 1
+                    if session.get('backup_status') == -1:
+                        stats['tape']['idle'] += 1
+                    elif session.get('backup_status') == 0:
+                        stats['tape']['success'] += 1
+                    elif session.get('backup_status') in [1, 3]:
+                        stats['tape']['warning'] += 1
+                    elif session.get('backup_status') == 2:
+                        stats['tape']['failed'] += 1
+                    elif session.get('backup_status') == 5:
+                        stats['tape']['running'] += 1
+                    elif session.get('backup_status') == 6:
+                        stats['tape']['pending'] += 1
+                    else:
+                        stats['tape']['undefined'] += 1
+
+                    # Setting end_date to None for in progress sessions and counting
+                    if session.get('backup_status') in [-1, 5, 6]:
+                        sessions_tape[job]['end_date'] = None
+                        stats['tape']['in_progress'] += 1
+
+            logging.info('End of tape sessions extraction')
+
+            # TAPE MEDIA
+            if getenv('DISABLE_TAPE_MEDIA') != '1':
+                logging.info('Beginning of tape media inventory')
+
+                # All the media in one query, aggregated by media pool
+                logging.info(sql_tape_media)
+                cursor.execute(sql_tape_media)
+                tape_media, stats['tape_media'] = tape_pools(cursor, END_DATETIME, TAPE_EXPIRING_DAYS, TAPE_MIN_SCRATCH, TAPE_CUSTOM_POOL_TYPES)
+                logging.info('End of tape media inventory : {} cartridges in {} pools [ Scratch = {}, Expiring = {}, Low pools = {}]'.format(
+                    stats['tape_media']['cartridges'], stats['tape_media']['pools'], stats['tape_media']['scratch'],
+                    stats['tape_media']['expiring'], stats['tape_media']['low']))
+            if not resumed_stage:
+                checkpoint['stage'] = 'tapes'
+                save_checkpoint(CHECKPOINT_FILE, checkpoint)
+
+            # BACKUP
+            logging.info('Beginning of backup sessions extraction : start={}, end={}'.format(START_DATE, END_DATE))
+
+            if resumed_stage != 'backups_done':
+                # Execute the SQL query by adaptive time windows
+                logging.info(sql_backups)
+                backup_sessions = fetch_backup_sessions(
+                    lambda: mssql_connect(DATABASE_ADDRESS, DATABASE_PORT, DATABASE_NAME, SQL_USERNAME, SQL_PASSWORD),
+                    sql_backups,
+                    checkpoint['resume_from'] or START_DATETIME,
+                    END_DATETIME,
+                    timedelta(hours=BACKUP_CHUNK_HOURS),
+                    BACKUP_CHUNK_TARGET,
+                    workers=BACKUP_CHUNK_WORKERS,
+                    retries=BACKUP_CHUNK_RETRIES,
+                    params=(BACKUP_JOB_TYPES,)
+                )
+
+                # Iterate backup sessions
+                last_checkpoint = datetime.now()
+                last_creation_time = None
+                for session in backup_sessions:
+                    # Checkpoint only before the first session of a creation_time so that the
+                    # state covers all the sessions created before resume_from
+                    if session.creation_time != last_creation_time:
+                        last_creation_time = session.creation_time
+                        if (datetime.now() - last_checkpoint).total_seconds() >= CHECKPOINT_INTERVAL:
+                            checkpoint['stage'] = 'backups'
+                            checkpoint['resume_from'] = session.creation_time
+                            save_checkpoint(CHECKPOINT_FILE, checkpoint)
+                            last_checkpoint = datetime.now()
+
+                    stats['backup']['sessions'] += 1
+                    backup_status_str = backup_status_mapping(session.status)
+
+                    # Count the sessions of each job type, the failed ones are counted once deduplicated
+                    job_type = jobtype_mapping(session.job_type)
+                    if not stats['types'].get(job_type):
+                        stats['types'][job_type] = {'sessions': 0, 'total': 0, 'success': 0, 'warning': 0, 'failed': 0, 'in_progress': 0}
+                    stats_type = stats['types'][job_type]
+                    stats_type['sessions'] += 1
+                    if session.status == 0:
+                        stats_type['success'] += 1
+                    elif session.status in [1, 3]:
+                        stats_type['warning'] += 1
+                    elif session.status in [-1, 5, 6]:
+                        stats_type['in_progress'] += 1
+
+                    BTM, datastores, proxies, guest_proxies = session_log_analysis(session.log_xml)
+
+                    RetainDays, RetainCycles, EnableDeletedVmDataRetention = job_options_analysis(session.options)
+
+                    obj_dict = dict()
+                    obj_dict['start_date'] = session.creation_time
+                    obj_dict['end_date'] = session.end_time
+                    obj_dict['session_id'] = session.session_id
+                    obj_dict['orig_session_id'] = session.orig_session_id
+                    obj_dict['backup_status'] = session.status
+                    obj_dict['backup_status_details'] = backup_status_str
+                    obj_dict['last_point_success'] = session.last_point_success
+                    obj_dict['object_id'] = session.object_id
+                    obj_dict['job_name'] = session.job_name
+                    obj_dict['job_id'] = session.job_id
+                    obj_dict['type'] = job_type
+                    obj_dict['reason'] = session.reason
+                    obj_dict['object_name'] = session.object_name.upper()
+                    obj_dict['backup_transport_mode'] = BTM
+                    obj_dict['target_storage'] = session.repository_name
+                    obj_dict['proxies'] = ','.join(proxies)
+                    obj_dict['guest_proxies'] = ','.join(guest_proxies)
+                    obj_dict['datastores'] = ','.join(datastores)
+                    # The size columns depend on the version of Veeam
+                    obj_dict['processed_size'] = getattr(session, 'processed_size', None)
+                    obj_dict['read_size'] = getattr(session, 'read_size', None)
+                    obj_dict['transferred_size'] = getattr(session, 'transferred_size', None)
+                    obj_dict['nb_restore_points'] = session.nb_restore_points
+                    obj_dict['retaindays'] = RetainDays
+                    obj_dict['retaincycles'] = RetainCycles
+                    obj_dict['retention_maintenance'] = EnableDeletedVmDataRetention
+
+                    job_name = obj_dict['job_name']
+                    job_id = obj_dict['job_id']
+                    vm_name = obj_dict['object_name']
+
+                    # Keep the objects of the sessions for the RPO compliance, the restore points query
+                    # replaces their last restore point by the one of their job
+                    protected = protected_objects.get((job_name, vm_name))
+                    if not protected or (session.last_point_success and (protected[1] is None or session.last_point_success > protected[1])):
+                        protected_objects[(job_name, vm_name)] = (job_type, session.last_point_success)
+                    session_object_ids.add(str(session.object_id).lower())
+
+                    sessions_sizes.append([job_name, vm_name, session.creation_time, session.end_time,
+                                           obj_dict['processed_size'], obj_dict['read_size'], obj_dict['transferred_size']])
+
+                    for resource, names in [('proxies', proxies), ('guest_proxies', guest_proxies), ('datastores', datastores)]:
+                        add_session_load(resource_loads[resource], names, session.creation_time, session.end_time, session.status, BTM)
+
+                    # Aggregate the sessions of the job for the metrics
+                    if not jobs_metrics.get(job_name):
+                        jobs_metrics[job_name] = {'sessions': 0, 'failed': 0, 'restore_points': 0, 'duration': 0, 'start': session.creation_time, 'end': None}
+                    job_metrics = jobs_metrics[job_name]
+                    job_metrics['sessions'] += 1
+                    job_metrics['failed'] += 1 if session.status == 2 else 0
+                    job_metrics['restore_points'] = max(job_metrics['restore_points'], session.nb_restore_points or 0)
+                    job_metrics['start'] = min(job_metrics['start'], session.creation_time)
+                    if session.end_time and (job_metrics['end'] is None or session.end_time > job_metrics['end']):
+                        job_metrics['end'] = session.end_time
+                        job_metrics['duration'] = (job_metrics['end'] - job_metrics['start']).total_seconds()
+
+                    if session.status == 2:  # Status 2 = Failed
+                        # Test if sessions_failed[job_name] is defined
+                        if sessions_failed.get(job_name):
+                            # Test if sessions_failed[job_name][job_id] is defined
+                            if sessions_failed.get(job_name).get(job_id):
+                                # Test if sessions_failed[job_name][job_id][vm_name] is defined
+                                if sessions_failed.get(job_name).get(job_id).get(vm_name):
+                                    # Compare if local obj_dict['start_date'] is the most recent
+                                    if sessions_failed[job_name][job_id][vm_name]['start_date'] < obj_dict['start_date']:
+                                        sessions_failed[job_name][job_id][vm_name] = obj_dict
+                                else:
+                                    sessions_failed[job_name][job_id][vm_name] = obj_dict
+                            else:
+                                sessions_failed[job_name][job_id] = dict()
                                 sessions_failed[job_name][job_id][vm_name] = obj_dict
                         else:
+                            sessions_failed[job_name] = dict()
+                            sessions_failed[job_name][job_id] = dict()
                             sessions_failed[job_name][job_id][vm_name] = obj_dict
-                    else:
-                        sessions_failed[job_name][job_id] = dict()
-                        sessions_failed[job_name][job_id][vm_name] = obj_dict
-                else:
-                    sessions_failed[job_name] = dict()
-                    sessions_failed[job_name][job_id] = dict()
-                    sessions_failed[job_name][job_id][vm_name] = obj_dict
-            elif session.status in [-1, 5, 6]:  # Stauts -1 = Idle, Status 5 = Running, Status 6 = Pending
-                if session.status == -1:
-                    stats['backup']['idle'] += 1
-                    stats['backup']['in_progress'] += 1
-                elif session.status == 5:
-                    stats['backup']['running'] += 1
-                    stats['backup']['in_progress'] += 1
-                elif session.status == 6:
-                    stats['backup']['pending'] += 1
-                    stats['backup']['in_progress'] += 1
-
-                # Remove from sessions_failed if found a session with status 5 or 6
-                # Test if sessions_failed[job_name] is defined
-                if sessions_failed.get(job_name):
-                    # Test if sessions_failed[job_name][job_id] is defined
-                    if sessions_failed.get(job_name).get(job_id):
-                        # Test if sessions_failed[job_name][job_id][vm_name] is defined
-                        if sessions_failed.get(job_name).get(job_id).get(vm_name):
-                            del sessions_failed[job_name][job_id][vm_name]
-                            if len(sessions_failed.get(job_name).get(job_id)) == 0:
-                                del sessions_failed[job_name][job_id]
-                            if len(sessions_failed.get(job_name)) == 0:
-                                del sessions_failed[job_name]
-
-                # Remove irrelevant fields for idle, running and pending sessions
-                del obj_dict['end_date']
-                del obj_dict['reason']
-
-                # Test if sessions_in_progress[job_name] is defined
-                if sessions_in_progress.get(job_name):
-                    # Test if sessions_in_progress[job_name][job_id] is defined
-                    if sessions_in_progress.get(job_name).get(job_id):
-                        sessions_in_progress[job_name][job_id][vm_name] = obj_dict
-                    else:
-                        sessions_in_progress[job_name][job_id] = dict()
-                        sessions_in_progress[job_name][job_id][vm_name] = obj_dict
-                else:
-                    sessions_in_progress[job_name] = dict()
-                    sessions_in_progress[job_name][job_id] = dict()
-                    sessions_in_progress[job_name][job_id][vm_name] = obj_dict
-
-            elif session.status in [0, 1, 3]:  # Status 0 = Success, Status 1 or 3 = Warning
-                if session.status == 0:
-                    stats['backup']['success'] += 1
-                elif session.status == 1 or session.status == 3:
-                    stats['backup']['warning'] += 1
-                # Remove from sessions_failed if found a session with status 0, 1 or 3
-                # Test if sessions_failed[job_name] is defined
-                if sessions_failed.get(job_name):
-                    # Test if sessions_failed[job_name][job_id] is defined
-                    if sessions_failed.get(job_name).get(job_id):
-                        # Test if sessions_failed[job_name][job_id][vm_name] is defined
-                        if sessions_failed.get(job_name).get(job_id).get(vm_name):
-                            del sessions_failed[job_name][job_id][vm_name]
-                            if len(sessions_failed.get(job_name).get(job_id)) == 0:
-                                del sessions_failed[job_name][job_id]
-                            if len(sessions_failed.get(job_name)) == 0:
-                                del sessions_failed[job_name]
-
-        # Remove job_id & calculate the number of failed sessions
-        for job in sessions_failed:
-            for job_id in sessions_failed.get(job):
-                if sessions_failed.get(job).get(job_id):
-                    for vm in sessions_failed.get(job).get(job_id):
-                        stats['backup']['failed'] += 1
-                    sessions_failed[job] = sessions_failed[job][job_id]
-
-        # Remove job_id
-        for job in sessions_in_progress:
-            for job_id in sessions_in_progress.get(job):
-                sessions_in_progress[job] = sessions_in_progress[job][job_id]
-
-        # Calculate total number of unique sessions
-        stats['backup']['total'] = int(stats['backup']['success']) + int(stats['backup']['failed']) + int(stats['backup']['warning']) + int(stats['backup']['in_progress'])
-
-        logging.info('End of backup sessions extraction')
-
-        # REPOSITORIES
-        logging.info('Beginning of repositories informations extraction')
-
-        # Execute the SQL query
-        logging.info(sql_repositories)
-        cursor.execute(sql_repositories)
-
-        # Iterate repositories
-        for repository in cursor:
-            stats['repositories'] += 1
-            obj_dict = dict()
-            obj_dict['id'] = repository.id
-            obj_dict['name'] = repository.name
-            obj_dict['description'] = repository.description
-            obj_dict['type'] = repository.type
-            obj_dict['path'] = repository.path
-            obj_dict['status'] = repository.status
-            obj_dict['host_name'] = SERVER_NAME if repository.host_name == 'This server' else repository.host_name
-            obj_dict['host_ip'] = repository.host_ip
-            obj_dict['scale_out_name'] = repository.scale_out_name
-            obj_dict['free'] = repository.freeSpace
-            obj_dict['total'] = repository.totalSpace
-            obj_dict['used'] = int(repository.totalSpace) - int(repository.freeSpace)
-
-            if repository.scale_out_name:
-                group_name = repository.scale_out_name
-                repo_name = repository.name
-                if not repositories.get(group_name):
-                    repositories[group_name] = dict()
-                repositories[group_name][repo_name] = obj_dict
-
-            else:
-                group_name = repository.name
-                if not repositories.get(group_name):
-                    repositories[group_name] = dict()
-                del obj_dict['scale_out_name']
-                repositories[group_name] = obj_dict
-
-    logging.info('End of repositories informations extraction')
-
-    output['infos'] = dict()
-    output['infos']['SERVER_NAME'] = SERVER_NAME
-    output['infos']['stats'] = stats
-
-    output['sessions'] = dict()
-    output['sessions']['tape'] = sessions_tape
-    output['sessions']['in_progress'] = sessions_in_progress
-    output['sessions']['failed'] = sessions_failed
-    output['repositories'] = repositories
-
-    # write to JSON file
-    with open(OUTFILE, 'w+') as f:
-        f.write(json.dumps(output, indent=4, cls=CustomJSONEncoder))
-        f.close()
-
-    delta = datetime.now() - begin
-
-    logging.info('Tape sessions : {} [ Success = {}, Warning = {}, Failed = {}, Running = {}, Pending = {}, Idle = {}, Undefined = {}]'.format(
-        stats['tape']['sessions'],
-        stats['tape']['success'],
-        stats['tape']['warning'],
-        stats['tape']['failed'],
-        stats['tape']['running'],
-        stats['tape']['pending'],
-        stats['tape']['idle'],
-        stats['tape']['undefined']
-    ))
-    logging.info('Backup sessions : {} [ Success = {}, Warning = {}, Failed = {}, Running = {}, Pending = {}, Idle = {}, Undefined = {}]'.format(
-        stats['backup']['sessions'],
-        stats['backup']['success'],
-        stats['backup']['warning'],
-        stats['backup']['failed'],
-        stats['backup']['running'],
-        stats['backup']['pending'],
-        stats['backup']['idle'],
-        stats['backup']['undefined']
-    ))
-    logging.info('Repositories : {}'.format(stats['repositories']))
-
-    logging.info(f'Total execution time : {str(delta.total_seconds())}')
-
-    # Send statistics
-    if getenv('DISABLE_INFLUXDB') != '1':
-        logging.info('Sending stats/metrics to InfluxDB')
-
-        # Create InfluxDB client instance
-        client = InfluxDBClient(host='100.0.00.1', port=8086)  # server.adm.fr.arno.net
-
-        # Define InfluxDB templates
-        template_influx = '{},job=%s,type=crawler value={}' % getenv('CI_JOB_NAME')
-        template_influx_stats = '{},job=%s,type=crawler success={},warning={},failed={},running={},pending={},idle={},undefined={},sessions={}' % getenv('CI_JOB_NAME')
-        template_influx_repository = '{},job=%s,type=crawler,repo="{}",extent="{}" free={},used={},total={}' % getenv('CI_JOB_NAME')
-        template_influx_scaleout = '{},job=%s,type=crawler,scaleout="{}" free={},used={},total={}' % getenv('CI_JOB_NAME')
-
-        influx_data = []
-
-        # Add execution_time metric
-        influx_data.append(template_influx.format('execution_time', delta.total_seconds()))
-
-        # Add backups statistics
-        influx_data.append(template_influx_stats.format(
-            'backup',
-            stats['backup']['success'],
-            stats['backup']['warning'],
-            stats['backup']['failed'],
-            stats['backup']['running'],
-            stats['backup']['pending'],
-            stats['backup']['idle'],
-            stats['backup']['undefined'],
-            stats['backup']['sessions'],
-        ))
+                    elif session.status in [-1, 5, 6]:  # Stauts -1 = Idle, Status 5 = Running, Status 6 = Pending
+                        if session.status == -1:
+                            stats['backup']['idle'] += 1
+                            stats['backup']['in_progress'] += 1
+                        elif session.status == 5:
+                            stats['backup']['running'] += 1
+                            stats['backup']['in_progress'] += 1
+                        elif session.status == 6:
+                            stats['backup']['pending'] += 1
+                            stats['backup']['in_progress'] += 1
+
+                        # Remove from sessions_failed if found a session with status 5 or 6
+                        # Test if sessions_failed[job_name] is defined
+                        if sessions_failed.get(job_name):
+                            # Test if sessions_failed[job_name][job_id] is defined
+                            if sessions_failed.get(job_name).get(job_id):
+                                # Test if sessions_failed[job_name][job_id][vm_name] is defined
+                                if sessions_failed.get(job_name).get(job_id).get(vm_name):
+                                    del sessions_failed[job_name][job_id][vm_name]
+                                    if len(sessions_failed.get(job_name).get(job_id)) == 0:
+                                        del sessions_failed[job_name][job_id]
+                                    if len(sessions_failed.get(job_name)) == 0:
+                                        del sessions_failed[job_name]
+
+                        # Remove irrelevant fields for idle, running and pending sessions
+                        del obj_dict['end_date']
+                        del obj_dict['reason']
+
+                        # Test if sessions_in_progress[job_name] is defined
+                        if sessions_in_progress.get(job_name):
+                            # Test if sessions_in_progress[job_name][job_id] is defined
+                            if sessions_in_progress.get(job_name).get(job_id):
+                                sessions_in_progress[job_name][job_id][vm_name] = obj_dict
+                            else:
+                                sessions_in_progress[job_name][job_id] = dict()
+                                sessions_in_progress[job_name][job_id][vm_name] = obj_dict
+                        else:
+                            sessions_in_progress[job_name] = dict()
+                            sessions_in_progress[job_name][job_id] = dict()
+                            sessions_in_progress[job_name][job_id][vm_name] = obj_dict
+
+                    elif session.status in [0, 1, 3]:  # Status 0 = Success, Status 1 or 3 = Warning
+                        if session.status == 0:
+                            stats['backup']['success'] += 1
+                        elif session.status == 1 or session.status == 3:
+                            stats['backup']['warning'] += 1
+                        # Remove from sessions_failed if found a session with status 0, 1 or 3
+                        # Test if sessions_failed[job_name] is defined
+                        if sessions_failed.get(job_name):
+                            # Test if sessions_failed[job_name][job_id] is defined
+                            if sessions_failed.get(job_name).get(job_id):
+                                # Test if sessions_failed[job_name][job_id][vm_name] is defined
+                                if sessions_failed.get(job_name).get(job_id).get(vm_name):
+                                    del sessions_failed[job_name][job_id][vm_name]
+                                    if len(sessions_failed.get(job_name).get(job_id)) == 0:
+                                        del sessions_failed[job_name][job_id]
+                                    if len(sessions_failed.get(job_name)) == 0:
+                                        del sessions_failed[job_name]
+
+                # Remove job_id & calculate the number of failed sessions
+                for job in sessions_failed:
+                    for job_id in sessions_failed.get(job):
+                        if sessions_failed.get(job).get(job_id):
+                            for vm in sessions_failed.get(job).get(job_id):
+                                stats['backup']['failed'] += 1
+                                stats['types'][sessions_failed[job][job_id][vm]['type']]['failed'] += 1
+                            sessions_failed[job] = sessions_failed[job][job_id]
+
+                # Remove job_id
+                for job in sessions_in_progress:
+                    for job_id in sessions_in_progress.get(job):
+                        sessions_in_progress[job] = sessions_in_progress[job][job_id]
+
+                # Calculate total number of unique sessions
+                stats['backup']['total'] = int(stats['backup']['success']) + int(stats['backup']['failed']) + int(stats['backup']['warning']) + int(stats['backup']['in_progress'])
+                for stats_type in stats['types'].values():
+                    stats_type['total'] = stats_type['success'] + stats_type['failed'] + stats_type['warning'] + stats_type['in_progress']
+
+                checkpoint['stage'] = 'backups_done'
+                save_checkpoint(CHECKPOINT_FILE, checkpoint)
+
+            logging.info('End of backup sessions extraction')
+
+            # RPO COMPLIANCE
+            # Every object of a job or with a restore point of a job, so that the objects of a job which did not run are checked too
+            logging.info(sql_restore_points)
+            cursor.execute(sql_restore_points)
+            for row in cursor:
+                protected_objects[(row.job_name, row.object_name.upper())] = (jobtype_mapping(row.job_type), row.last_point_success)
+
+            stats['compliance'], compliance_breaches = rpo_compliance(
+                protected_objects, END_DATETIME, load_sla_policies(SLA_POLICIES_FILE, SLA_RPO_HOURS), SERVER_TAGS, SLA_MAX_BREACHES)
+            logging.info('RPO compliance : {}% of {} objects [ Breached = {}]'.format(
+                stats['compliance']['percent'], stats['compliance']['objects'], stats['compliance']['breached']))
+
+            # INVENTORY
+            if getenv('DISABLE_INVENTORY') != '1':
+                logging.info('Beginning of VM inventory extraction')
+
+                # Index the VMs and the ids of the objects in a job or with a recent restore point
+                logging.info(sql_inventory)
+                cursor.execute(sql_inventory)
+                inventory = {str(vm.id).lower(): vm for vm in cursor}
+                sql = sql_protected_objects.format(datetime.strftime(END_DATETIME - timedelta(days=INVENTORY_DAYS), '%Y-%m-%d %H:%M:%S'))
+                logging.info(sql)
+                cursor.execute(sql)
+                protected_ids = {str(row.object_id).lower() for row in cursor}
+
+                for object_id in unprotected_objects(inventory, protected_ids, session_object_ids):
+                    vm = inventory[object_id]
+                    unprotected[vm.object_name.upper()] = {
+                        'object_id': vm.id,
+                        'object_name': vm.object_name.upper(),
+                        'object_ref': vm.object_ref,
+                        'platform': vm.platform,
+                        'host_name': vm.host_name
+                    }
+                unprotected = dict(sorted(unprotected.items()))
+                stats['unprotected'] = len(unprotected)
+                logging.info(f'End of VM inventory extraction : {len(inventory)} VMs, {len(unprotected)} unprotected')
+
+            # MISSED RUNS
+            if getenv('DISABLE_MISSED_RUNS') != '1':
+                logging.info('Beginning of missed runs detection')
+
+                # Start times of the runs of each job, sorted by the query
+                # The sessions started early for the first runs of the window are fetched too
+                sql = sql_job_sessions.format(datetime.strftime(START_DATETIME - MISSED_RUN_EARLY, '%Y-%m-%d %H:%M:%S'), END_DATE, BACKUP_JOB_TYPES)
+                logging.info(sql)
+                cursor.execute(sql)
+                job_starts = dict()
+                for job_session in cursor:
+                    job_starts.setdefault(str(job_session.job_id).lower(), []).append(job_session.creation_time)
+
+                # The schedules are parsed again only when they changed since the previous crawl
+                # A schedule which cannot be parsed skips its job, the errors are reported once by type
+                from common.errors import ErrorAggregator
+                schedule_errors = ErrorAggregator()
+                schedule_cache = load_schedule_cache(SCHEDULE_CACHE_FILE)
+                logging.info(sql_jobs_schedule)
+                cursor.execute(sql_jobs_schedule)
+                expected_runs = 0
+                for job in cursor:
+                    job_id = str(job.id).lower()
+                    try:
+                        rules = cached_schedule(schedule_cache, job_id, job.schedule)
+                        if not rules:
+                            continue
+                        tolerance = min(MISSED_RUN_TOLERANCE, timedelta(seconds=rules['period'])) if rules.get('period') else MISSED_RUN_TOLERANCE
+                        # Only the runs which should have started by now are checked
+                        expected = expand_runs(rules, START_DATETIME, END_DATETIME - tolerance, SCHEDULE_TIMEZONE)
+                    except (ET.ParseError, ValueError) as e:
+                        schedule_errors.add('parse schedule', e, job.name)
+                        continue
+                    expected_runs += len(expected)
+                    job_missed = missed_runs(expected, job_starts.get(job_id, []), tolerance, MISSED_RUN_EARLY, SCHEDULE_TIMEZONE)
+                    if job_missed:
+                        missed[job.name] = {
+                            'job_id': job.id,
+                            'type': jobtype_mapping(job.type),
+                            'schedule': rules['summary'],
+                            'expected': len(expected),
+                            'missed': len(job_missed),
+                            'missed_runs': job_missed[-MISSED_RUNS_MAX:]
+                        }
+                save_schedule_cache(SCHEDULE_CACHE_FILE, schedule_cache)
+                if schedule_errors.count:
+                    logging.warning(f'{schedule_errors.count} schedules not parsed, {schedule_errors.report()} events sent to Sentry')
+
+                missed = dict(sorted(missed.items(), key=lambda item: item[1]['missed'], reverse=True))
+                stats['missed'] = {'jobs': len(missed), 'runs': sum(job['missed'] for job in missed.values()), 'expected': expected_runs}
+                logging.info('End of missed runs detection : {} expected runs, {} missed [ Jobs = {}]'.format(
+                    expected_runs, stats['missed']['runs'], stats['missed']['jobs']))
+
+            # REPOSITORIES
+            logging.info('Beginning of repositories informations extraction')
+
+            # Execute the SQL query
+            logging.info(sql_repositories)
+            cursor.execute(sql_repositories)
+
+            # Iterate repositories
+            for repository in cursor:
+                stats['repositories'] += 1
+                obj_dict = dict()
+                obj_dict['id'] = repository.id
+                obj_dict['name'] = repository.name
+                obj_dict['description'] = repository.description
+                obj_dict['type'] = repository.type
+                obj_dict['path'] = repository.path
+                obj_dict['status'] = repository.status
+                obj_dict['host_name'] = SERVER_NAME if repository.host_name == 'This server' else repository.host_name
+                obj_dict['host_ip'] = repository.host_ip
+                obj_dict['scale_out_name'] = repository.scale_out_name
+                obj_dict['free'] = repository.freeSpace
+                obj_dict['total'] = repository.totalSpace
+                obj_dict['used'] = int(repository.totalSpace) - int(repository.freeSpace)
+
+                if repository.scale_out_name:
+                    group_name = repository.scale_out_name
+                    repo_name = repository.name
+                    if not repositories.get(group_name):
+                        repositories[group_name] = dict()
+                    repositories[group_name][repo_name] = obj_dict
 
-        # Add tapes statistics
-        influx_data.append(template_influx_stats.format(
-            'tape',
+                else:
+                    group_name = repository.name
+                    if not repositories.get(group_name):
+                        repositories[group_name] = dict()
+                    del obj_dict['scale_out_name']
+                    repositories[group_name] = obj_dict
+
+        logging.info('End of repositories informations extraction')
+
+        output['infos'] = dict()
+        output['infos']['SERVER_NAME'] = SERVER_NAME
+        output['infos']['tags'] = SERVER_TAGS
+        output['infos']['stats'] = stats
+
+        output['sessions'] = dict()
+        output['sessions']['tape'] = sessions_tape
+        output['tape_media'] = tape_media
+        output['sessions']['in_progress'] = sessions_in_progress
+        output['sessions']['failed'] = sessions_failed
+        output['compliance'] = compliance_breaches
+        output['unprotected'] = unprotected
+        output['missed'] = missed
+        output['throughput'] = sessions_sizes
+        output['load'] = {resource: summarize_load(loads, END_DATETIME) for resource, loads in resource_loads.items()}
+        output['repositories'] = repositories
+
+        # write to JSON file
+        with open(OUTFILE, 'w+') as f:
+            f.write(json.dumps(output, indent=4, cls=CustomJSONEncoder))
+            f.close()
+
+        # The crawl is complete, a retry must start from nothing
+        for file in [CHECKPOINT_FILE, CHECKPOINT_FILE + '.journal']:
+            if path.isfile(file):
+                remove(file)
+
+        delta = datetime.now() - begin
+
+        logging.info('Tape sessions : {} [ Success = {}, Warning = {}, Failed = {}, Running = {}, Pending = {}, Idle = {}, Undefined = {}]'.format(
+            stats['tape']['sessions'],
             stats['tape']['success'],
             stats['tape']['warning'],
             stats['tape']['failed'],
             stats['tape']['running'],
             stats['tape']['pending'],
             stats['tape']['idle'],
-            stats['tape']['undefined'],
-            stats['tape']['sessions'],
+            stats['tape']['undefined']
         ))
-
-        # Add repositories statistics
-        for repository in repositories:
-            repository_fmt = repository.replace(' ', '-')  # InfluxDB does not support spaces in metric names
-            if repositories.get(repository).get('id'):
-                repo = repositories.get(repository)
-                influx_data.append(template_influx_repository.format('repository', repository_fmt, None, repo.get('free'), repo.get('used'), repo.get('total')))
-            else:
-                scaleout_free, scaleout_used, scaleout_total = 0, 0, 0
-                for extent in repositories.get(repository):
-                    extent_fmt = extent.replace(' ', '-')
-                    repo = repositories.get(repository).get(extent)
-                    influx_data.append(template_influx_repository.format('repository', repository_fmt, extent_fmt, repo.get('free'), repo.get('used'), repo.get('total')))
-                    scaleout_free += repo.get('free')
-                    scaleout_used += repo.get('used')
-                    scaleout_total += repo.get('total')
-                influx_data.append(template_influx_scaleout.format('scaleout', repository_fmt, repo.get('free'), repo.get('used'), repo.get('total')))
-
-        # Send to InfluxDB
-        client.write_points(influx_data, database='morning_check_backup', time_precision='ms', batch_size=10000, protocol='line')
-
-except Exception as e:
-    print(e)
-    sentry_sdk.capture_exception(e)
-    exit(1)
-
-sentry_sdk.flush(120)
-
-logging.info('Script end')
+        logging.info('Backup sessions : {} [ Success = {}, Warning = {}, Failed = {}, Running = {}, Pending = {}, Idle = {}, Undefined = {}]'.format(
+            stats['backup']['sessions'],
+            stats['backup']['success'],
+            stats['backup']['warning'],
+            stats['backup']['failed'],
+            stats['backup']['running'],
+            stats['backup']['pending'],
+            stats['backup']['idle'],
+            stats['backup']['undefined']
+        ))
+        for job_type, stats_type in stats['types'].items():
+            logging.info('{} sessions : {} [ Success = {}, Warning = {}, Failed = {}, In progress = {}]'.format(
+                job_type, stats_type['sessions'], stats_type['success'], stats_type['warning'], stats_type['failed'], stats_type['in_progress']))
+        logging.info('Repositories : {}'.format(stats['repositories']))
+
+        logging.info(f'Total execution time : {str(delta.total_seconds())}')
+
+        # Send statistics
+        if getenv('DISABLE_INFLUXDB') != '1':
+            logging.info('Sending stats/metrics to InfluxDB')
+            from common.metrics import MetricsBuilder
+
+            influx_data = MetricsBuilder({'job': getenv('CI_JOB_NAME'), 'type': 'crawler'}, max_series=METRICS_MAX_SERIES)
+
+            # Add execution_time metric
+            influx_data.add('execution_time', {'value': delta.total_seconds()})
+
+            # Add backups and tapes statistics
+            for stats_type in ['backup', 'tape']:
+                influx_data.add(stats_type, {
+                    key: stats[stats_type][key] for key in ['success', 'warning', 'failed', 'running', 'pending', 'idle', 'undefined', 'sessions']
+                })
+
+            # Add RPO compliance statistics
+            influx_data.add('compliance', stats['compliance'])
+            if 'unprotected' in stats:
+                influx_data.add('unprotected', {'value': stats['unprotected']})
+            if 'missed' in stats:
+                influx_data.add('missed_runs', stats['missed'])
+
+            # Add the tape media of each pool
+            if 'tape_media' in stats:
+                influx_data.add('tape_media', stats['tape_media'])
+            for name, pool in tape_media.items():
+                influx_data.add('tape_pool', {key: pool[key] for key in ['cartridges', 'scratch', 'expiring', 'vault', 'offline', 'capacity', 'remaining', 'used_percent']},
+                                mediapool=name)
+
+            # Add the load of the proxies and datastores, the busiest first when the series are limited
+            for resource, tag in [('proxies', 'proxy'), ('guest_proxies', 'guest_proxy'), ('datastores', 'datastore')]:
+                for name, load in output['load'][resource].items():
+                    influx_data.add(tag, {key: load[key] for key in ['sessions', 'failed', 'nbd', 'failed_percent', 'nbd_percent', 'peak']},
+                                    **{tag: name})
+
+            # Add per job type statistics
+            for job_type, stats_type in stats['types'].items():
+                influx_data.add('job_type', stats_type, job_type=job_type)
+
+            # Add repositories statistics
+            for repository in repositories:
+                if repositories.get(repository).get('id'):
+                    repo = repositories.get(repository)
+                    influx_data.add('repository', {'free': repo.get('free'), 'used': repo.get('used'), 'total': repo.get('total')},
+                                    repo=repository)
+                else:
+                    scaleout_free, scaleout_used, scaleout_total = 0, 0, 0
+                    for extent in repositories.get(repository):
+                        repo = repositories.get(repository).get(extent)
+                        influx_data.add('repository', {'free': repo.get('free'), 'used': repo.get('used'), 'total': repo.get('total')},
+                                        repo=repository, extent=extent)
+                        scaleout_free += repo.get('free')
+                        scaleout_used += repo.get('used')
+                        scaleout_total += repo.get('total')
+                    influx_data.add('scaleout', {'free': scaleout_free, 'used': scaleout_used, 'total': scaleout_total},
+                                    scaleout=repository)
+
+            # Add per job statistics, the longest jobs first when the series are limited
+            for job_name, job_stats in sorted(jobs_metrics.items(), key=lambda item: item[1]['duration'], reverse=True):
+                influx_data.add('job', {key: job_stats[key] for key in ['sessions', 'failed', 'restore_points', 'duration']}, veeam_job=job_name)
+
+            # Send to InfluxDB in the background
+            for line in influx_data.build():
+                metrics.add(line)
+
+    except Exception as e:
+        print(e)
+        sentry_sdk.capture_exception(e)
+        if metrics:
+            metrics.close()
+        exit(1)
+
+    if metrics:
+        metrics.close()
+
+    sentry_sdk.flush(120)
+
+    logging.info('Script end')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Union
+
+
+def add_session_load(loads: dict, names: list, start: datetime, end: Union[datetime, None], status: int,
+                     transport_mode: str) -> None:
+    """ Count a task session on each of the proxies or datastores it used """
+
+    for name in names:
+        load = loads.setdefault(name, {'sessions': 0, 'failed': 0, 'nbd': 0, 'intervals': []})
+        load['sessions'] += 1
+        load['failed'] += 1 if status == 2 else 0
+        load['nbd'] += 1 if transport_mode == 'nbd' else 0
+        load['intervals'].append((start, end))
+
+
+def max_concurrency(intervals: list, now: datetime) -> tuple:
+    """ Return the maximum number of overlapping intervals and when it is
+        first reached, by a sweep over the sorted starts and ends
+
+        An interval without end is still running at now. An interval ending
+        when another one starts does not overlap it """
+
+    events = []
+    for start, end in intervals:
+        events.append((start, 1))
+        events.append((end or now, -1))
+    # The ends (-1) are sorted before the starts (1) of the same time
+    events.sort()
+
+    peak, peak_time, current = 0, None, 0
+    for time, change in events:
+        current += change
+        if current > peak:
+            peak, peak_time = current, time
+    return peak, peak_time
+
+
+def summarize_load(loads: dict, now: datetime) -> dict:
+    """ Replace the intervals of each proxy or datastore by their peak
+        concurrency, add the failure and NBD rates and sort by peak """
+
+    result = dict()
+    for name, load in loads.items():
+        peak, peak_time = max_concurrency(load['intervals'], now)
+        result[name] = {
+            'sessions': load['sessions'],
+            'failed': load['failed'],
+            'nbd': load['nbd'],
+            'failed_percent': round(load['failed'] * 100 / load['sessions'], 1),
+            'nbd_percent': round(load['nbd'] * 100 / load['sessions'], 1),
+            'peak': peak,
+            'peak_time': peak_time
+        }
+    return dict(sorted(result.items(), key=lambda item: (-item[1]['peak'], item[0])))
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, time, timedelta, tzinfo
+from hashlib import md5
+from os import makedirs, path, replace
+from typing import Union
+
+# Index of the days by datetime.weekday() and of the months by datetime.month - 1
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+WEEK_NUMBERS = {'First': 0, 'Second': 1, 'Third': 2, 'Fourth': 3, 'Last': -1}
+
+
+def enabled(element: Union[ET.Element, None]) -> bool:
+    """ Test the Enabled or IsEnabled attribute or child of a schedule option """
+
+    if element is None:
+        return False
+    value = element.get('Enabled', element.get('IsEnabled'))
+    if value is None and element.find('IsEnabled') is not None:
+        value = element.find('IsEnabled').text
+    return value == 'True'
+
+
+def parse_time(text: Union[str, None]) -> Union[int, None]:
+    """ Return the seconds since midnight of the time in a text
+        Example : 22:30:00 or 2013-01-01 22:30:00 """
+
+    match = re.search(r'(\d{1,2}):(\d{2})(?::(\d{2}))?', text or '')
+    if not match:
+        return None
+    return int(match.group(1)) * 3600 + int(match.group(2)) * 60 + int(match.group(3) or 0)
+
+
+def parse_hours(text: Union[str, None]) -> list:
+    """ Return the permitted hours of each weekday from the hourly grid of a
+        periodic schedule, a 0 permits the hour. Without grid all the hours
+        are permitted """
+
+    hours = [list(range(24)) for day in WEEKDAYS]
+    if not text:
+        return hours
+    grid = ET.fromstring(text)
+    for weekday, day in enumerate(WEEKDAYS):
+        element = grid.find(day)
+        if element is not None and element.text:
+            hours[weekday] = [hour for hour, value in enumerate(element.text.split(',')) if value.strip() == '0']
+    return hours
+
+
+def parse_schedule(xml: Union[str, bytes, None]) -> Union[dict, None]:
+    """ Parse the schedule XML of a job into its rules, the times are in
+        seconds since midnight
+        Return None for a job without time based schedule : continuous,
+        chained after another job or without any enabled option """
+
+    if not xml:
+        return None
+    if isinstance(xml, bytes):
+        xml = xml.decode('utf-8')
+    root = ET.fromstring(xml)
+
+    if enabled(root.find('OptionsScheduleAfterJob')) or enabled(root.find('OptionsContinuous')):
+        return None
+
+    daily = root.find('OptionsDaily')
+    if enabled(daily):
+        run = parse_time(daily.findtext('TimeLocal') or daily.findtext('Time'))
+        kind = daily.findtext('Kind')
+        if kind == 'Everyday':
+            days = WEEKDAYS
+        elif kind == 'WeekDays':
+            days = WEEKDAYS[:5]
+        else:
+            days = [day.text for day in daily.findall('Days')]
+        return {'kind': 'daily', 'time': run, 'weekdays': [WEEKDAYS.index(day) for day in days if day in WEEKDAYS],
+                'summary': f'{kind} at {timedelta(seconds=run or 0)}'}
+
+    monthly = root.find('OptionsMonthly')
+    if enabled(monthly):
+        run = parse_time(monthly.findtext('TimeLocal') or monthly.findtext('Time'))
+        months = [MONTHS.index(month.text) + 1 for month in monthly.findall('Months') if month.text in MONTHS]
+        day_number = monthly.findtext('DayNumberInMonth')
+        day_of_week = monthly.findtext('DayOfWeek')
+        day_of_month = monthly.findtext('DayOfMonth')
+        return {'kind': 'monthly', 'time': run, 'months': months or list(range(1, 13)),
+                'week': WEEK_NUMBERS.get(day_number),
+                'weekday': WEEKDAYS.index(day_of_week) if day_of_week in WEEKDAYS else None,
+                'day': int(day_of_month) if day_of_month and day_of_month.isdigit() else None,
+                'summary': f'Monthly {day_number} {day_of_week if day_number in WEEK_NUMBERS else day_of_month} at {timedelta(seconds=run or 0)}'}
+
+    periodically = root.find('OptionsPeriodically')
+    if enabled(periodically):
+        # The period and the offset are in minutes
+        period = int(periodically.findtext('FullPeriod') or 60) * 60
+        offset = int(periodically.findtext('HourlyOffset') or 0) * 60
+        return {'kind': 'periodic', 'period': period, 'offset': offset % period if period else 0,
+                'hours': parse_hours(periodically.findtext('Schedule')),
+                'summary': f'Every {timedelta(seconds=period)}'}
+
+    return None
+
+
+def monthly_match(rules: dict, day: datetime) -> bool:
+    """ Test if a monthly schedule runs on a day """
+
+    if day.month not in rules['months']:
+        return False
+    if rules['week'] is None:
+        return day.day == rules['day']
+    if day.weekday() != rules['weekday']:
+        return False
+    if rules['week'] == -1:
+        return (day + timedelta(days=7)).month != day.month
+    return (day.day - 1) // 7 == rules['week']
+
+
+def day_times(rules: dict) -> list:
+    """ Return the run times of a daily or periodic schedule for each weekday """
+
+    if rules['kind'] == 'daily':
+        return [[rules['time']] if weekday in rules['weekdays'] and rules['time'] is not None else [] for weekday in range(7)]
+    runs = range(rules['offset'], 86400, rules['period'] or 86400)
+    # The weekdays usually share the same permitted hours
+    by_hours = dict()
+    for hours in rules['hours']:
+        if tuple(hours) not in by_hours:
+            permitted = set(hours)
+            by_hours[tuple(hours)] = [run for run in runs if run // 3600 in permitted]
+    return [by_hours[tuple(hours)] for hours in rules['hours']]
+
+
+def local_timestamp(local: datetime, zone: Union[tzinfo, None] = None) -> float:
+    """ Return the timestamp of a naive local time of zone, the local
+        timezone of the host by default
+        A time skipped by a DST change is shifted forward by the change, a
+        time repeated by a DST change is its first occurrence """
+
+    return local.replace(tzinfo=zone, fold=0).timestamp()
+
+
+def local_timestamps(times: list, zone: Union[tzinfo, None] = None) -> list:
+    """ Return the timestamps of naive local times of zone
+
+        Without DST change between the first and the last time, they are
+        shifted from the timestamp of the first midnight, so that only the
+        times around a DST change are converted one by one """
+
+    if not times:
+        return []
+    midnight = datetime.combine(min(times).date(), time())
+    midnights = [local_timestamp(midnight + timedelta(days=day), zone) for day in range((max(times) - midnight).days + 2)]
+    if all(after - before == 86400 for before, after in zip(midnights, midnights[1:])):
+        return [midnights[0] + (local - midnight).total_seconds() for local in times]
+    return [local_timestamp(local, zone) for local in times]
+
+
+def expand_runs(rules: dict, start: datetime, end: datetime, zone: Union[tzinfo, None] = None) -> list:
+    """ Return the sorted run times of a schedule between start and end, as
+        timestamps
+
+        start, end and the times of the schedule are naive local times of
+        zone. The times of each weekday are computed once, then shifted day by
+        day, so that a frequent schedule is expanded without a datetime per
+        run. Only the days of a DST change convert each run, their runs
+        skipped forward onto an existing run are counted once """
+
+    midnight = datetime.combine(start.date(), time())
+    first, last = local_timestamp(start, zone), local_timestamp(end, zone)
+    times = day_times(rules) if rules['kind'] != 'monthly' else None
+    runs = []
+    for day in range(int((end - midnight).total_seconds() // 86400) + 1):
+        date = midnight + timedelta(days=day)
+        if times is not None:
+            seconds = times[date.weekday()]
+        else:
+            seconds = [rules['time']] if rules['time'] is not None and monthly_match(rules, date) else []
+        if not seconds:
+            continue
+        base = local_timestamp(date, zone)
+        if local_timestamp(date + timedelta(days=1), zone) - base == 86400:
+            day_runs = [base + second for second in seconds]
+        else:
+            day_runs = sorted({local_timestamp(date + timedelta(seconds=second), zone) for second in seconds})
+        runs.extend(run for run in day_runs if first <= run < last)
+    return runs
+
+
+def missed_runs(expected: list, starts: list, tolerance: timedelta, early: timedelta = timedelta(minutes=5),
+                zone: Union[tzinfo, None] = None) -> list:
+    """ Return the expected runs without a session started between early
+        before and tolerance after them, as naive local times of zone
+
+        expected are the timestamps of the runs and starts the naive local
+        start times of the sessions, from early before the first run so that
+        a session started just before the window still matches its run. Both
+        lists are sorted and walked once together. A session matches a single
+        run, so that the session of a run does not hide the miss of the next
+        one """
+
+    starts = local_timestamps(starts, zone)
+    tolerance, early = tolerance.total_seconds(), early.total_seconds()
+    missed = []
+    i = 0
+    for run in expected:
+        while i < len(starts) and starts[i] < run - early:
+            i += 1
+        if i == len(starts) or starts[i] >= run + tolerance:
+            missed.append(datetime.fromtimestamp(run, zone).replace(tzinfo=None))
+        else:
+            i += 1
+    return missed
+
+
+def cached_schedule(cache: dict, job_id: str, xml: Union[str, bytes, None]) -> Union[dict, None]:
+    """ Return the parsed schedule of a job, parsing it only when the job
+        is unknown or its schedule XML changed """
+
+    if isinstance(xml, bytes):
+        xml = xml.decode('utf-8')
+    content_hash = md5((xml or '').encode('utf-8')).hexdigest()
+    cached = cache.get(job_id)
+    if cached is None or cached['hash'] != content_hash:
+        cached = cache[job_id] = {'hash': content_hash, 'rules': parse_schedule(xml)}
+    return cached['rules']
+
+
+def load_schedule_cache(file: Union[str, None]) -> dict:
+    """ Read the parsed schedules of the previous crawls """
+
+    if not file or not path.isfile(file):
+        return dict()
+    try:
+        with open(file) as f:
+            return json.load(f)
+    except ValueError:
+        return dict()
+
+
+def save_schedule_cache(file: Union[str, None], cache: dict) -> None:
+    """ Atomically write the parsed schedules for the next crawls """
+
+    if not file:
+        return
+    if path.dirname(file):
+        makedirs(path.dirname(file), exist_ok=True)
+    with open(file + '.tmp', 'w') as f:
+        json.dump(cache, f)
+    replace(file + '.tmp', file)
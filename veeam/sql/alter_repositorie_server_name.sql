@@ -0,0 +1,14 @@
+-- Server of each repository row, the mcb_info row of a run only holds the name of one of its servers
+alter table mcb_repositorie
+    add column server_name varchar(255) null;
+
+-- The rows inserted before are attributed by the GUID of their repository, unique to its server,
+-- once the worker inserted the repositories with their server. The rows still unknown are left
+-- out of the capacity forecast
+update mcb_repositorie
+    inner join (select id_repo, max(server_name) as server_name
+                from mcb_repositorie
+                where server_name is not null
+                group by id_repo) known on known.id_repo = mcb_repositorie.id_repo
+set mcb_repositorie.server_name = known.server_name
+where mcb_repositorie.server_name is null;
@@ -65,9 +65,9 @@ ON js.id = bts.session_id
     LEFT JOIN [dbo].[BObjects] AS bo
     ON bo.id = bts.object_id
 WHERE
-    bts.creation_time BETWEEN '{0}'
-  AND '{1}'
-  AND js.job_type = 0
+    bts.creation_time >= '{0}'
+  AND bts.creation_time < '{1}'
+  AND js.job_type IN ({2})
   AND bo.viobject_type != 'Vapp'
   AND bo.type != 4
 ORDER BY
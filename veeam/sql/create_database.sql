@@ -137,9 +137,160 @@ create table mcb_repositorie
     free           bigint unsigned not null,
     total          bigint unsigned not null,
     used           bigint unsigned not null,
+    server_name    varchar(255) null,
     constraint mcb_repositorie_pk
         primary key (id),
     constraint mcb_repositorie_mcb_info_id_fk
         foreign key (id_info) references mcb_info (id)
             on update cascade on delete cascade
-);
\ No newline at end of file
+);
+-- Current state of the sessions when INGEST_MODE=upsert, one row by (session_id, object_id)
+-- updated in place, the history of mcb_in_progress and mcb_failed is left to the insert mode
+create table mcb_upsert_in_progress
+(
+    id                    int unsigned auto_increment,
+    id_info               int unsigned          not null,
+    start_date            datetime     not null,
+    session_id            varchar(40) not null,
+    orig_session_id       varchar(40) not null,
+    backup_status         int          not null,
+    backup_status_details text  not null,
+    last_point_success    datetime     null,
+    object_id             varchar(40) not null,
+    job_name              text not null,
+    job_id                varchar(40) not null,
+    type                  text  not null,
+    object_name           text not null,
+    backup_transport_mode varchar(10)  null,
+    target_storage        text not null,
+    proxies               text null,
+    nb_restore_points     smallint unsigned not null,
+    retaindays            smallint unsigned not null,
+    retaincycles          smallint unsigned not null,
+    retention_maintenance boolean      null,
+    server_name           varchar(255) not null,
+    row_hash              char(32)     not null,
+    constraint mcb_upsert_in_progress_pk
+        primary key (id),
+    constraint mcb_upsert_in_progress_session_id_object_id_uk
+        unique (session_id, object_id),
+    constraint mcb_upsert_in_progress_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade
+);
+
+create index mcb_upsert_in_progress_server_name_index on mcb_upsert_in_progress (server_name);
+
+create table mcb_upsert_failed
+(
+    id                    int unsigned auto_increment,
+    id_info               int unsigned         not null,
+    start_date            datetime    not null,
+    end_date              datetime    not null,
+    session_id            varchar(40) not null,
+    orig_session_id       varchar(40) not null,
+    backup_status         int          not null,
+    backup_status_details text  not null,
+    last_point_success    datetime     null,
+    object_id             varchar(40) not null,
+    job_name              text not null,
+    job_id                varchar(40) not null,
+    type                  text  not null,
+    reason                text   not null,
+    object_name           text not null,
+    backup_transport_mode varchar(10)  null,
+    target_storage        text not null,
+    proxies               text null,
+    nb_restore_points     smallint unsigned not null,
+    retaindays            smallint unsigned not null,
+    retaincycles          smallint unsigned not null,
+    retention_maintenance boolean      null,
+    server_name           varchar(255) not null,
+    row_hash              char(32)     not null,
+    constraint mcb_upsert_failed_pk
+        primary key (id),
+    constraint mcb_upsert_failed_session_id_object_id_uk
+        unique (session_id, object_id),
+    constraint mcb_upsert_failed_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade
+);
+
+create table mcb_artifact
+(
+    id             int unsigned auto_increment,
+    server_name    varchar(255) not null,
+    content_hash   char(32)     not null,
+    id_info        int unsigned not null,
+    update_time    datetime     not null,
+    constraint mcb_artifact_pk
+        primary key (id),
+    constraint mcb_artifact_server_name_uk
+        unique (server_name),
+    constraint mcb_artifact_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade
+);
+
+create table mcb_job_throughput
+(
+    id             int unsigned auto_increment,
+    id_info        int unsigned    not null,
+    server_name    varchar(255)    not null,
+    job_name       text            not null,
+    start_date     datetime        not null,
+    end_date       datetime        not null,
+    duration       int unsigned    not null,
+    sessions       int unsigned    not null,
+    processed      bigint unsigned not null,
+    transferred    bigint unsigned not null,
+    throughput     double          not null,
+    constraint mcb_job_throughput_pk
+        primary key (id),
+    constraint mcb_job_throughput_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade
+);
+
+-- Tape media of each media pool by run, for the history of the scratch tapes
+create table mcb_tape_pool
+(
+    id             int unsigned auto_increment,
+    id_info        int unsigned    not null,
+    server_name    varchar(255)    not null,
+    mediapool_name varchar(255)    not null,
+    cartridges     int unsigned    not null,
+    scratch        int unsigned    not null,
+    expiring       int unsigned    not null,
+    vault          int unsigned    not null,
+    offline        int unsigned    not null,
+    capacity       bigint unsigned not null,
+    remaining      bigint unsigned not null,
+    constraint mcb_tape_pool_pk
+        primary key (id),
+    constraint mcb_tape_pool_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade
+);
+
+-- Failed and in progress sessions of each run, by hash of their server, job and object,
+-- compared by the next run of the server to report the new, persistent and resolved failures
+create table mcb_failure_state
+(
+    id_pipeline int unsigned not null,
+    kind        varchar(16)  not null,
+    key_hash    binary(16)   not null,
+    server_name varchar(255) not null,
+    job_name    text         not null,
+    object_name text         not null,
+    first_seen  datetime     not null,
+    last_seen   datetime     not null,
+    constraint mcb_failure_state_pk
+        primary key (id_pipeline, kind, key_hash),
+    constraint mcb_failure_state_mcb_pipeline_id_fk
+        foreign key (id_pipeline) references mcb_pipeline (id)
+            on update cascade on delete cascade
+);
+
+-- Range scans of the repositories history by the capacity forecast
+create index mcb_pipeline_creation_time_index on mcb_pipeline (creation_time);
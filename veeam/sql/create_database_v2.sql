@@ -0,0 +1,176 @@
+-- Schema v2 : the names and GUIDs repeated by every session are stored once in the
+-- dimension tables and referenced by integer keys, the GUIDs are stored as binary(16)
+-- and the status and types as small integers. mcb_pipeline and mcb_info are shared with v1.
+
+create table mcb2_server
+(
+    id   smallint unsigned auto_increment,
+    name varchar(255) not null,
+    constraint mcb2_server_pk
+        primary key (id),
+    constraint mcb2_server_name_uk
+        unique (name)
+);
+
+create table mcb2_job
+(
+    id        int unsigned auto_increment,
+    id_server smallint unsigned not null,
+    guid      binary(16)        not null,
+    name      varchar(255)      not null,
+    type      smallint          not null,
+    constraint mcb2_job_pk
+        primary key (id),
+    constraint mcb2_job_uk
+        unique (id_server, guid),
+    constraint mcb2_job_mcb2_server_id_fk
+        foreign key (id_server) references mcb2_server (id)
+            on update cascade on delete cascade
+);
+
+create table mcb2_object
+(
+    id        int unsigned auto_increment,
+    id_server smallint unsigned not null,
+    guid      binary(16)        not null,
+    name      varchar(255)      not null,
+    constraint mcb2_object_pk
+        primary key (id),
+    constraint mcb2_object_uk
+        unique (id_server, guid),
+    constraint mcb2_object_mcb2_server_id_fk
+        foreign key (id_server) references mcb2_server (id)
+            on update cascade on delete cascade
+);
+
+create table mcb2_repository
+(
+    id        int unsigned auto_increment,
+    id_server smallint unsigned not null,
+    name      varchar(255)      not null,
+    guid      binary(16)        null,
+    constraint mcb2_repository_pk
+        primary key (id),
+    constraint mcb2_repository_uk
+        unique (id_server, name),
+    constraint mcb2_repository_mcb2_server_id_fk
+        foreign key (id_server) references mcb2_server (id)
+            on update cascade on delete cascade
+);
+
+create table mcb2_tape
+(
+    id             int unsigned auto_increment,
+    id_info        int unsigned  not null,
+    id_job         int unsigned  not null,
+    start_date     datetime      not null,
+    end_date       datetime      null,
+    backup_status  tinyint       not null,
+    reason         text          null,
+    mediapool_name varchar(255)  null,
+    constraint mcb2_tape_pk
+        primary key (id),
+    constraint mcb2_tape_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade,
+    constraint mcb2_tape_mcb2_job_id_fk
+        foreign key (id_job) references mcb2_job (id)
+);
+
+create table mcb2_in_progress
+(
+    id                    int unsigned auto_increment,
+    id_info               int unsigned  not null,
+    id_job                int unsigned  not null,
+    id_object             int unsigned  not null,
+    id_repository         int unsigned  null,
+    start_date            datetime      not null,
+    session_id            binary(16)    not null,
+    orig_session_id       binary(16)    null,
+    backup_status         tinyint       not null,
+    last_point_success    datetime      null,
+    backup_transport_mode tinyint       null,
+    proxies               varchar(1024) null,
+    nb_restore_points     smallint unsigned not null,
+    retaindays            smallint      not null,
+    retaincycles          smallint      not null,
+    retention_maintenance boolean       null,
+    constraint mcb2_in_progress_pk
+        primary key (id),
+    constraint mcb2_in_progress_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade,
+    constraint mcb2_in_progress_mcb2_job_id_fk
+        foreign key (id_job) references mcb2_job (id),
+    constraint mcb2_in_progress_mcb2_object_id_fk
+        foreign key (id_object) references mcb2_object (id),
+    constraint mcb2_in_progress_mcb2_repository_id_fk
+        foreign key (id_repository) references mcb2_repository (id)
+);
+
+create table mcb2_failed
+(
+    id                    int unsigned auto_increment,
+    id_info               int unsigned  not null,
+    id_job                int unsigned  not null,
+    id_object             int unsigned  not null,
+    id_repository         int unsigned  null,
+    start_date            datetime      not null,
+    end_date              datetime      not null,
+    session_id            binary(16)    not null,
+    orig_session_id       binary(16)    null,
+    backup_status         tinyint       not null,
+    last_point_success    datetime      null,
+    reason                text          not null,
+    backup_transport_mode tinyint       null,
+    proxies               varchar(1024) null,
+    nb_restore_points     smallint unsigned not null,
+    retaindays            smallint      not null,
+    retaincycles          smallint      not null,
+    retention_maintenance boolean       null,
+    constraint mcb2_failed_pk
+        primary key (id),
+    constraint mcb2_failed_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade,
+    constraint mcb2_failed_mcb2_job_id_fk
+        foreign key (id_job) references mcb2_job (id),
+    constraint mcb2_failed_mcb2_object_id_fk
+        foreign key (id_object) references mcb2_object (id),
+    constraint mcb2_failed_mcb2_repository_id_fk
+        foreign key (id_repository) references mcb2_repository (id)
+);
+
+create table mcb2_repositorie
+(
+    id             int unsigned auto_increment,
+    id_info        int unsigned    not null,
+    id_repository  int unsigned    not null,
+    extent         varchar(255)    null,
+    scale_out_name varchar(255)    null,
+    description    text            null,
+    type           smallint        not null,
+    path           varchar(1024)   not null,
+    status         tinyint         not null,
+    host_name      varchar(255)    not null,
+    host_ip        varchar(45)     null,
+    free           bigint unsigned not null,
+    total          bigint unsigned not null,
+    used           bigint unsigned not null,
+    constraint mcb2_repositorie_pk
+        primary key (id),
+    constraint mcb2_repositorie_mcb_info_id_fk
+        foreign key (id_info) references mcb_info (id)
+            on update cascade on delete cascade,
+    constraint mcb2_repositorie_mcb2_repository_id_fk
+        foreign key (id_repository) references mcb2_repository (id)
+);
+
+-- Progress of the migration of the v1 history, by v1 table
+create table mcb2_migration
+(
+    table_name varchar(64)  not null,
+    last_id    int unsigned not null,
+    constraint mcb2_migration_pk
+        primary key (table_name)
+);
@@ -1,5 +1,11 @@
+drop table mcb_failure_state;
+drop table mcb_artifact;
+drop table mcb_upsert_failed;
+drop table mcb_upsert_in_progress;
 drop table mcb_failed;
 drop table mcb_in_progress;
+drop table mcb_job_throughput;
+drop table mcb_tape_pool;
 drop table mcb_tape;
 drop table mcb_repositorie;
 drop table mcb_info;
@@ -0,0 +1,20 @@
+SELECT bts.id,
+       bts.session_id,
+       bts.object_id,
+       bts.object_name,
+       bts.status,
+       bts.reason,
+       bts.creation_time,
+       bts.end_time,
+       DATALENGTH(bts.log_xml) as log_size,
+
+       js.job_id,
+       js.job_name
+
+FROM
+    [dbo].[Backup.Model.BackupTaskSessions] AS bts
+    LEFT JOIN [dbo].[Backup.Model.JobSessions] AS js
+ON js.id = bts.session_id
+WHERE
+    bts.status IN (-1, 5, 6)
+  AND js.job_type IN ({0});
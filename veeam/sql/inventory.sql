@@ -0,0 +1,18 @@
+SELECT
+    bo.id,
+    bo.object_name,
+    bo.object_id AS object_ref,
+    bo.platform,
+    bo.viobject_type,
+
+    h.name AS host_name
+
+FROM
+    [dbo].[BObjects] bo
+
+LEFT JOIN [dbo].Hosts h
+    ON h.id = bo.host_id
+
+WHERE
+    bo.type = 1
+    AND bo.viobject_type != 'Vapp'
@@ -0,0 +1,10 @@
+SELECT js.job_id,
+       js.creation_time
+FROM
+    [dbo].[Backup.Model.JobSessions] AS js
+WHERE
+    js.creation_time >= '{0}'
+  AND js.creation_time < '{1}'
+  AND js.job_type IN ({2})
+ORDER BY
+    js.creation_time ASC;
@@ -0,0 +1,10 @@
+SELECT bj.id,
+       bj.name,
+       bj.type,
+       bj.schedule
+FROM
+    [dbo].[BJobs] AS bj
+WHERE
+    bj.is_deleted = 0
+  AND bj.schedule_enabled = 1
+  AND bj.type IN ({0});
@@ -0,0 +1,20 @@
+SELECT
+    oij.object_id
+FROM
+    [dbo].[ObjectsInJobs] oij
+
+LEFT JOIN [dbo].[BJobs] bj
+    ON bj.id = oij.job_id
+
+WHERE
+    bj.is_deleted = 0
+
+UNION
+
+SELECT
+    oib.object_id
+FROM
+    [dbo].[Backup.Model.OIBs] oib
+WHERE
+    oib.creation_time >= '{0}'
+    AND oib.completion_time_utc IS NOT null
@@ -0,0 +1,53 @@
+WITH restore_points AS (
+    SELECT
+        b.job_id,
+        oib.object_id,
+        MAX(oib.creation_time) AS last_point_success
+    FROM
+        [dbo].[Backup.Model.OIBs] oib
+    INNER JOIN [dbo].[Backup.Model.Storages] s
+        ON s.id = oib.storage_id
+    INNER JOIN [dbo].[Backup.Model.Backups] b
+        ON b.id = s.backup_id
+    WHERE
+        oib.completion_time_utc IS NOT null
+    GROUP BY
+        b.job_id,
+        oib.object_id
+)
+
+SELECT
+    bj.name AS job_name,
+    bj.type AS job_type,
+    bo.object_name,
+    rp.last_point_success
+
+FROM (
+    SELECT
+        oij.job_id,
+        oij.object_id
+    FROM
+        [dbo].[ObjectsInJobs] oij
+
+    UNION
+
+    SELECT
+        job_id,
+        object_id
+    FROM
+        restore_points
+) jo
+
+INNER JOIN [dbo].[BJobs] bj
+    ON bj.id = jo.job_id
+INNER JOIN [dbo].[BObjects] bo
+    ON bo.id = jo.object_id
+LEFT JOIN restore_points rp
+    ON rp.job_id = jo.job_id
+    AND rp.object_id = jo.object_id
+
+WHERE
+    bj.is_deleted = 0
+    AND bj.type IN ({0})
+    AND bo.type = 1
+    AND bo.viobject_type != 'Vapp'
@@ -0,0 +1,15 @@
+SELECT tm.id,
+       tm.barcode,
+       tm.capacity,
+       tm.remaining,
+       tm.expiration_date,
+       tm.vault_id,
+       CASE WHEN tm.location_type = 0 THEN 1 ELSE 0 END AS offline,
+
+       mp.name AS mediapool_name,
+       mp.type AS mediapool_type
+FROM
+    [dbo].[Tape.tape_mediums] tm
+
+LEFT JOIN [dbo].[Tape.media_pools] mp
+    ON mp.id = tm.media_pool_id;
@@ -0,0 +1,14 @@
+-- Unique keys required by the worker when INGEST_MODE=upsert
+-- Remove duplicated rows left by previous re-runs before applying
+-- The sessions are upserted in mcb_upsert_in_progress and mcb_upsert_failed, which have their keys
+alter table mcb_pipeline
+    add constraint mcb_pipeline_id_pipeline_gitlab_uk unique (id_pipeline_gitlab);
+
+alter table mcb_info
+    add constraint mcb_info_id_pipeline_uk unique (id_pipeline);
+
+alter table mcb_tape
+    add constraint mcb_tape_id_info_job_id_start_date_uk unique (id_info, job_id, start_date);
+
+alter table mcb_repositorie
+    add constraint mcb_repositorie_id_info_id_repo_uk unique (id_info, id_repo);
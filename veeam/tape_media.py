@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+
+def tape_pools(media, now: datetime, expiring_days: int = 7, min_scratch: int = 5, custom_types: tuple = (5,)) -> tuple:
+    """ Aggregate the tape media by media pool
+
+        A medium is scratch when it holds no data or when its data expired,
+        it can then be overwritten. A medium expiring within expiring_days
+        will be scratch soon. The vaulted and offline media are counted
+        apart since they cannot be loaded. A custom pool, of one of
+        custom_types, with less than min_scratch scratch media in the
+        library is low. The system pools (Free, Imported, Retired,
+        Unrecognized) are not used by the jobs and are never low. Return
+        the pools sorted by scratch media and the stats of all the media """
+
+    expiring = now + timedelta(days=expiring_days)
+    pools = dict()
+    for medium in media:
+        name = medium.mediapool_name or 'Unknown'
+        pool = pools.setdefault(name, {'type': medium.mediapool_type, 'cartridges': 0, 'scratch': 0, 'expiring': 0,
+                                       'vault': 0, 'offline': 0, 'capacity': 0, 'remaining': 0})
+        capacity, remaining = medium.capacity or 0, medium.remaining or 0
+        pool['cartridges'] += 1
+        pool['capacity'] += capacity
+        pool['remaining'] += remaining
+        in_vault = medium.vault_id is not None
+        pool['vault'] += 1 if in_vault else 0
+        pool['offline'] += 1 if medium.offline and not in_vault else 0
+        if remaining >= capacity or (medium.expiration_date is not None and medium.expiration_date <= now):
+            # Only the media in the library can be used by the next sessions
+            pool['scratch'] += 1 if not in_vault and not medium.offline else 0
+        elif medium.expiration_date is not None and medium.expiration_date <= expiring:
+            pool['expiring'] += 1
+
+    stats = {'pools': len(pools), 'cartridges': 0, 'scratch': 0, 'expiring': 0, 'low': 0}
+    for pool in pools.values():
+        pool['used_percent'] = round((pool['capacity'] - pool['remaining']) * 100 / pool['capacity'], 1) if pool['capacity'] else 0
+        pool['low'] = pool['type'] in custom_types and pool['scratch'] < min_scratch
+        for key in ['cartridges', 'scratch', 'expiring']:
+            stats[key] += pool[key]
+        stats['low'] += 1 if pool['low'] else 0
+    return dict(sorted(pools.items(), key=lambda item: (item[1]['scratch'], item[0]))), stats
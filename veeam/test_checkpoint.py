@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime, timedelta
+
+from crawler import load_checkpoint, save_checkpoint
+from resource_load import add_session_load
+
+START = datetime(2024, 3, 1, 22, 0)
+
+
+def crawl_state() -> dict:
+    return {
+        'pipeline_id': '42',
+        'server_name': 'VBR1',
+        'stage': 'backups',
+        'resume_from': START,
+        'start': START - timedelta(days=1),
+        'end': START,
+        'sessions_tape': dict(),
+        'sessions_in_progress': dict(),
+        'sessions_failed': dict(),
+        'jobs_metrics': {'Job A': {'sessions': 0, 'failed': 0, 'restore_points': 0, 'duration': 0, 'start': START, 'end': None}},
+        'protected_objects': dict(),
+        'session_object_ids': set(),
+        'resource_loads': {'proxies': dict(), 'guest_proxies': dict(), 'datastores': dict()},
+        'sessions_sizes': [],
+        'stats': {'backup': {'sessions': 0}, 'types': dict()}
+    }
+
+
+def add_session(state: dict, i: int) -> None:
+    start = START + timedelta(minutes=i)
+    end = start + timedelta(minutes=30) if i % 2 else None
+    state['protected_objects'][('Job A', f'VM{i}')] = ('Backup', start)
+    state['session_object_ids'].add(f'id{i}')
+    state['sessions_sizes'].append(['Job A', f'VM{i}', start, end, 100 * i, 50 * i, 10 * i])
+    add_session_load(state['resource_loads']['proxies'], ['proxy1'], start, end, 2 if i == 3 else 0, 'nbd')
+    state['stats']['backup']['sessions'] += 1
+    state['resume_from'] = start
+
+
+def test_roundtrip(tmp_path):
+    file = str(tmp_path / 'crawl.checkpoint')
+    state = crawl_state()
+    for i in range(3):
+        add_session(state, i)
+    save_checkpoint(file, state)
+    for i in range(3, 5):
+        add_session(state, i)
+    save_checkpoint(file, state)
+
+    resumed = load_checkpoint(file, '42', 'VBR1', 3600)
+    for key in ['resume_from', 'start', 'end', 'jobs_metrics', 'protected_objects', 'session_object_ids', 'resource_loads',
+                'sessions_sizes', 'stats']:
+        assert resumed[key] == state[key], key
+    # The tuple keys, the tuples and the datetimes are restored
+    assert resumed['protected_objects'][('Job A', 'VM4')] == ('Backup', START + timedelta(minutes=4))
+    assert resumed['resource_loads']['proxies']['proxy1']['intervals'][0] == (START, None)
+    assert isinstance(resumed['sessions_sizes'][1][3], datetime)
+
+
+def test_journal_appends_deltas(tmp_path):
+    file = str(tmp_path / 'crawl.checkpoint')
+    state = crawl_state()
+    for i in range(3):
+        add_session(state, i)
+    save_checkpoint(file, state)
+    add_session(state, 3)
+    save_checkpoint(file, state)
+    save_checkpoint(file, state)
+
+    deltas = [json.loads(line) for line in (tmp_path / 'crawl.checkpoint.journal').read_text().splitlines()]
+    assert [len(delta['sessions_sizes']) for delta in deltas] == [3, 1, 0]
+    assert [delta['session_object_ids'] for delta in deltas] == [['id0', 'id1', 'id2'], ['id3'], []]
+    assert [len(delta['intervals'].get('proxies', {}).get('proxy1', [])) for delta in deltas] == [3, 1, 0]
+    # The checkpoint itself only keeps the counters
+    checkpoint = json.loads((tmp_path / 'crawl.checkpoint').read_text())
+    assert 'sessions_sizes' not in checkpoint
+    assert checkpoint['resource_loads']['proxies']['proxy1'] == {'sessions': 4, 'failed': 1, 'nbd': 4}
+
+
+def test_resumed_crawl_continues_journal(tmp_path):
+    file = str(tmp_path / 'crawl.checkpoint')
+    state = crawl_state()
+    for i in range(2):
+        add_session(state, i)
+    save_checkpoint(file, state)
+    # Deltas appended by an attempt interrupted before its checkpoint was written
+    with open(file + '.journal', 'a') as f:
+        f.write('{"sessions_sizes": [["Job A", "VM9"]], "session_object_ids": ["id9"], "intervals": {}}\n')
+
+    resumed = load_checkpoint(file, '42', 'VBR1', 3600)
+    assert resumed['session_object_ids'] == {'id0', 'id1'}
+    add_session(resumed, 2)
+    save_checkpoint(file, resumed)
+
+    expected = crawl_state()
+    for i in range(3):
+        add_session(expected, i)
+    resumed = load_checkpoint(file, '42', 'VBR1', 3600)
+    assert resumed['sessions_sizes'] == expected['sessions_sizes']
+    assert resumed['session_object_ids'] == expected['session_object_ids']
+    assert resumed['resource_loads'] == expected['resource_loads']
+
+
+def test_checkpoint_ignored(tmp_path):
+    file = str(tmp_path / 'crawl.checkpoint')
+    state = crawl_state()
+    add_session(state, 0)
+    save_checkpoint(file, state)
+
+    assert load_checkpoint(file, '43', 'VBR1', 3600) == dict()
+    assert load_checkpoint(file, '42', 'VBR2', 3600) == dict()
+    (tmp_path / 'crawl.checkpoint.journal').write_text('')
+    assert load_checkpoint(file, '42', 'VBR1', 3600) == dict()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from tape_media import tape_pools
+
+NOW = datetime(2024, 3, 1, 7, 0)
+TB = 2 ** 40
+
+Medium = namedtuple('Medium', ['mediapool_name', 'mediapool_type', 'capacity', 'remaining', 'expiration_date', 'vault_id', 'offline'])
+
+
+def medium(pool: str, pool_type: int = 5, remaining: int = 0, expiration_date: datetime = None, vault_id: str = None,
+           offline: int = 0) -> Medium:
+    return Medium(pool, pool_type, TB, remaining, expiration_date, vault_id, offline)
+
+
+def test_pools_aggregated():
+    media = [
+        medium('Daily', remaining=TB),
+        medium('Daily', expiration_date=NOW - timedelta(days=1)),
+        medium('Daily', expiration_date=NOW + timedelta(days=3)),
+        medium('Daily', remaining=TB, vault_id='vault'),
+        medium('Daily', remaining=TB, offline=1),
+        medium('Daily', expiration_date=NOW + timedelta(days=30))
+    ]
+    pools, stats = tape_pools(media, NOW, expiring_days=7, min_scratch=2)
+
+    daily = pools['Daily']
+    assert (daily['cartridges'], daily['scratch'], daily['expiring'], daily['vault'], daily['offline']) == (6, 2, 1, 1, 1)
+    assert daily['used_percent'] == 50.0
+    assert not daily['low']
+    assert stats == {'pools': 1, 'cartridges': 6, 'scratch': 2, 'expiring': 1, 'low': 0}
+
+
+def test_system_pools_never_low():
+    media = [medium('Weekly'), medium('Free', pool_type=1), medium('Imported', pool_type=2), medium('Retired', pool_type=3),
+             medium('Unrecognized', pool_type=4), medium(None, pool_type=None)]
+    pools, stats = tape_pools(media, NOW, min_scratch=1)
+
+    assert [name for name, pool in pools.items() if pool['low']] == ['Weekly']
+    assert stats['low'] == 1
+    assert pools['Unknown']['cartridges'] == 1
+
+
+def test_custom_types():
+    media = [medium('Weekly'), medium('GFS', pool_type=6)]
+    pools, stats = tape_pools(media, NOW, min_scratch=1, custom_types=(5, 6))
+
+    assert pools['GFS']['low'] and pools['Weekly']['low']
+    assert stats['low'] == 2